@@ -0,0 +1,94 @@
+"""
+Compare the chunks of the contingency plans split at headings only, as before, against the token-aware chunker.
+Reports the distribution of chunk sizes and, over the labelled questions of bench_retrieval, the keyword
+retrieval recall and the average and largest prompt a contingency answer is generated from.
+Sizes are counted with the model's tokenizer when LLAMA_PATH is set, otherwise estimated.
+Run from the repository root: python benchmarks/bench_chunking.py
+"""
+
+import sys, os, statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+sys.path.append(os.path.dirname(__file__))
+
+import contingency
+from chatbot import chunking
+from chatbot.bm25 import BM25Index
+from prompts import contingency_prompt_builder
+from bench_retrieval import LABELLED_QUERIES
+
+DOCS_FOLDER = "src/data/contingency_plans"
+
+
+def split_at_headings(blocks: list[dict]) -> list[dict]:
+    """
+    The chunking used before: a new chunk at every heading, whatever its size.
+    """
+    chunks = []
+    current_heading = "General"
+    current_text = []
+    for block in blocks:
+        is_heading = "Heading" in block["style"] or block["text"].isupper()
+        if is_heading and current_text:
+            chunks.append({"heading_path": current_heading, "text": " ".join(current_text)})
+            current_heading = block["text"]
+            current_text = []
+        else:
+            current_text.append(block["text"])
+    if current_text:
+        chunks.append({"heading_path": current_heading, "text": " ".join(current_text)})
+    return chunks
+
+
+def get_token_counter():
+    if not os.getenv("LLAMA_PATH"):
+        return chunking.count_tokens, "estimated"
+    from llama_cpp import Llama
+    llm = Llama(model_path=os.getenv("LLAMA_PATH"), vocab_only=True, verbose=False)
+    return lambda text: len(llm.tokenize(text.encode(), add_bos=False)), "model"
+
+
+def build_index(chunker) -> BM25Index:
+    index = BM25Index()
+    for filename in sorted(os.listdir(DOCS_FOLDER)):
+        if not filename.endswith(".docx"):
+            continue
+        station = filename.replace(".docx", "")
+        chunks = chunker(contingency.read_blocks(f"{DOCS_FOLDER}/{filename}"))
+        index.add_document(filename, [{
+            "id": f"{filename}_chunk_{i}",
+            "document": f"{chunk['heading_path']}: {chunk['text']}",
+            "metadata": {"source": filename, "station": station},
+        } for i, chunk in enumerate(chunks)])
+    return index
+
+
+def percentile(values: list[int], percent: float) -> int:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+if __name__ == "__main__":
+    count_tokens, counted_by = get_token_counter()
+    print(f"Token counts {counted_by}; chunker limits {chunking.get_settings()}\n")
+    print(f"{'chunker':<12} {'chunks':>6} {'min':>5} {'p5':>5} {'p50':>5} {'p95':>5} {'max':>5} "
+          f"{'<min':>5} {'>max':>5} {'recall@1':>9} {'prompt':>7} {'largest':>8}")
+
+    for label, chunker in (("headings", split_at_headings), ("token-aware", chunking.chunk_blocks)):
+        index = build_index(chunker)
+        sizes = [count_tokens(chunk["document"]) for chunk in index.chunks.values()]
+
+        hits = 0
+        prompt_sizes = []
+        for query, station, heading in LABELLED_QUERIES:
+            results = index.search(query, station, 1)
+            chunks = [index.chunks[chunk_id]["document"] for chunk_id, _ in results]
+            hits += any(heading in chunk for chunk in chunks)
+            prompt = contingency_prompt_builder("\n\n".join(chunks), f"{station}.docx")
+            prompt_sizes.append(count_tokens(prompt["content"]) + count_tokens(query))
+
+        print(f"{label:<12} {len(sizes):>6} {min(sizes):>5} {percentile(sizes, 5):>5} {percentile(sizes, 50):>5} "
+              f"{percentile(sizes, 95):>5} {max(sizes):>5} "
+              f"{sum(size < chunking.CHUNK_MIN_TOKENS for size in sizes):>5} "
+              f"{sum(size > chunking.CHUNK_MAX_TOKENS for size in sizes):>5} "
+              f"{hits / len(LABELLED_QUERIES):>9.2f} {statistics.mean(prompt_sizes):>7.0f} {max(prompt_sizes):>8}")
@@ -0,0 +1,57 @@
+"""
+Compare per-query contingency search latency when a new Chroma client is opened for every query
+against the shared, warmed-up client and collection handle.
+Run from the repository root: python benchmarks/bench_contingency.py [runs]
+"""
+
+import sys, os, time, statistics
+import chromadb
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import contingency
+
+QUERIES = [
+    ("What happens if the line is blocked?", "Fleet"),
+    ("Where do replacement buses leave from?", "Andover"),
+    ("Who do staff contact during disruption?", "Ascot"),
+    ("What should passengers do if the station is closed?", None),
+]
+
+
+def search_with_new_client(query: str, station: str = None, n_results=1) -> tuple:
+    """
+    The search as it was before the shared handle: a new client and collection lookup per query.
+    """
+    client = chromadb.PersistentClient(path=contingency.CHROMA_PATH)
+    collection = client.get_collection(contingency.COLLECTION_NAME)
+    where = {"station": station} if station else None
+    results = collection.query(query_texts=[query], n_results=n_results, where=where)
+    return results["documents"][0], [m["source"] for m in results["metadatas"][0]]
+
+
+def time_queries(search, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        for query, station in QUERIES:
+            start = time.perf_counter()
+            search(query, station=station)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label: str, timings: list[float]) -> None:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<16} median {statistics.median(timings) * 1000:7.1f}ms   p95 {p95 * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    start = time.perf_counter()
+    contingency.warm_up()
+    print(f"warm-up          {(time.perf_counter() - start) * 1000:7.1f}ms")
+
+    report("new client", time_queries(search_with_new_client, runs))
+    report("shared handle", time_queries(contingency.search_contingency, runs))
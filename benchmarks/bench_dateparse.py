@@ -0,0 +1,62 @@
+"""
+Compare dateparser against the fast-path parse_datestring on the date and time phrases from tests/test_nlp.py.
+Run from the repository root: python benchmarks/bench_dateparse.py
+"""
+
+import sys, os, time, dateparser
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import utils.input_handler as input_handler
+
+PHRASES = [
+    "may 15th", "10:00 am", "tomorrow", "friday", "5:00 pm", "june 1st", "8:30 am", "june 3rd", "6:00 pm",
+    "next monday", "9:00 am", "next wednesday", "evening", "the 20th", "noon", "the 22nd", "midnight",
+    "july 4th", "7:15 am", "july 5th", "10:00 pm", "march 10th", "3:00 pm", "march 12th", "11:00 am",
+    "this saturday", "2:00 pm", "next tuesday", "4:00 pm", "5 week",
+]
+
+
+def time_dateparser(current_date: datetime, rounds: int) -> float:
+    settings = {
+        "PREFER_DATES_FROM": "future",
+        "RELATIVE_BASE": current_date,
+        "TIMEZONE": "GMT",
+        "DATE_ORDER": "DMY",
+    }
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for phrase in PHRASES:
+            dateparser.parse(phrase, settings=settings)
+    return time.perf_counter() - start
+
+
+def time_parse_datestring(current_date: datetime, rounds: int, clear_memo: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if clear_memo:
+            input_handler.date_memo.clear()
+        for phrase in PHRASES:
+            input_handler.parse_datestring(phrase, current_date)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    current_date = datetime.now()
+    calls = rounds * len(PHRASES)
+
+    # Warm dateparser's language detection so the first call does not dominate
+    time_dateparser(current_date, 1)
+    fallthrough = [p for p in PHRASES if input_handler.fast_parse_datestring(input_handler.normalise_datestring(p), current_date.date()) is None]
+
+    results = {
+        "dateparser": time_dateparser(current_date, rounds),
+        "fast path (cold memo)": time_parse_datestring(current_date, rounds, True),
+        "fast path (warm memo)": time_parse_datestring(current_date, rounds, False),
+    }
+
+    print(f"{len(PHRASES)} phrases x {rounds} rounds, {len(fallthrough)} fall through to dateparser: {fallthrough}")
+    for name, seconds in results.items():
+        print(f"{name:24} {seconds:.3f}s total  {1e6 * seconds / calls:8.1f}us/phrase")
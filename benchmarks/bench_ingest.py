@@ -0,0 +1,43 @@
+"""
+Compare full contingency ingestion throughput across parsing processes and write batch sizes.
+Each run rebuilds a scratch store, so the store the chatbot uses is left alone, and starts from an empty
+embedding cache, so every chunk is embedded rather than read back from an earlier run.
+Run from the repository root: python benchmarks/bench_ingest.py [processes,...] [batch sizes,...]
+e.g. python benchmarks/bench_ingest.py 1,4 1,64,256
+"""
+
+import sys, os, tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import contingency
+from utils import data_versions
+from utils.embedding_cache import EmbeddingCache
+
+
+if __name__ == "__main__":
+    process_counts = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else f"1,{os.cpu_count()}").split(",")]
+    batch_sizes = [int(n) for n in (sys.argv[2] if len(sys.argv) > 2 else "1,256").split(",")]
+
+    with tempfile.TemporaryDirectory() as chroma_path:
+        # Everything ingestion writes goes to the scratch directory, so the chatbot's store and keyword index,
+        # and the data versions its response cache is checked against, are left alone
+        contingency.CHROMA_PATH = chroma_path
+        contingency.MANIFEST_PATH = os.path.join(chroma_path, "contingency_manifest.json")
+        contingency.BM25_PATH = os.path.join(chroma_path, "contingency_bm25.json")
+        contingency.STATION_MAP_PATH = os.path.join(chroma_path, "contingency_stations.json")
+        data_versions.VERSIONS_DIR = os.path.join(chroma_path, "versions")
+
+        results = []
+        for processes in process_counts:
+            for batch_size in batch_sizes:
+                # Loads the model before the run is timed, then swaps in an empty cache for the run
+                model_id = contingency.get_embedding_cache().model_id
+                contingency.embedding_cache = EmbeddingCache(model_id, tempfile.mkdtemp(dir=chroma_path))
+                stats = contingency.ingest_documents(rebuild=True, processes=processes, batch_size=batch_size)
+                results.append((processes, batch_size, stats))
+
+    print(f"\n{'processes':>9} {'batch':>6} {'seconds':>8} {'docs/s':>8} {'chunks/s':>9}")
+    for processes, batch_size, stats in results:
+        print(f"{processes:>9} {batch_size:>6} {stats['seconds']:>8.1f} "
+              f"{stats['documents'] / stats['seconds']:>8.1f} {stats['chunks'] / stats['seconds']:>9.1f}")
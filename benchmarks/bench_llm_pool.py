@@ -0,0 +1,68 @@
+"""
+Measure generation throughput of the LLM worker pool against the number of worker processes,
+along with how much of each worker's memory is private and how much is the shared, memory-mapped model.
+Run from the repository root with LLAMA_PATH set: python benchmarks/bench_llm_pool.py [max_workers] [requests]
+"""
+
+import sys, os, time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import llm_pool
+
+MESSAGES = [
+    {"role": "system", "content": "You are a railway assistant helping a user."},
+    {"role": "user", "content": "Explain what to do if my train to Norwich is cancelled."},
+]
+MAX_TOKENS = 64
+
+
+def get_memory_kb(pid: int) -> tuple[int, int]:
+    """
+    :return: The process's private (anonymous) and file-backed resident memory in kB.
+    """
+    memory = {}
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                memory[key] = int(value.split()[0])
+    return memory.get("RssAnon", 0), memory.get("RssFile", 0)
+
+
+def run(pool: llm_pool.LLMPool, requests: int) -> tuple[float, int]:
+    """
+    Send the requests from as many threads as there are workers, so every worker stays busy.
+    :return: The wall time and the number of tokens generated.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=pool.workers) as executor:
+        results = list(executor.map(lambda i: pool.chat(MESSAGES, max_tokens=MAX_TOKENS), range(requests)))
+    return time.perf_counter() - start, sum(stats["completion_tokens"] for _, stats in results)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else cores
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    counts = sorted({1, *(n for n in (2, 4, 8, 16) if n <= max_workers), max_workers})
+    print(f"{requests} requests of up to {MAX_TOKENS} tokens on {cores} cores")
+    print(f"{'workers':>7} {'threads':>7} {'tokens/s':>9} {'private MB':>11} {'shared MB':>10}")
+
+    for workers in counts:
+        pool = llm_pool.LLMPool(workers).start()
+        try:
+            # Warm up each worker once, so the timing excludes first-touch page faults
+            run(pool, workers)
+            seconds, tokens = run(pool, requests)
+            memory = [get_memory_kb(process.pid) for process in pool.processes]
+        finally:
+            pool.stop()
+
+        private = sum(anon for anon, _ in memory) / 1024
+        shared = max(file for _, file in memory) / 1024
+        print(f"{workers:>7} {pool.threads_per_worker:>7} {tokens / seconds:>9.1f} {private:>11.0f} {shared:>10.0f}")
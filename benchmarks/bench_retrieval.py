@@ -0,0 +1,57 @@
+"""
+Compare contingency retrieval by vectors alone, keywords alone and both fused, on labelled questions.
+A question is answered when a chunk holding the expected section of the station's plan is returned.
+Run from the repository root, after ingesting the plans: python benchmarks/bench_retrieval.py [k]
+"""
+
+import sys, os, json, time, statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import contingency
+
+# Question, plan and the heading of the section that answers it, from the labelled set of eval_retrieval
+with open(os.path.join(os.path.dirname(__file__), "contingency_questions.json"), mode="r") as file:
+    LABELLED_QUERIES = [(question["question"], question["plan"], question["section"]) for question in json.load(file)]
+
+
+def search_vectors(query: str, station: str, k: int) -> list[str]:
+    results = contingency.get_collection().query(query_texts=[query], n_results=k, where={"station": station})
+    return results["documents"][0]
+
+
+def search_keywords(query: str, station: str, k: int) -> list[str]:
+    index = contingency.get_keyword_index()
+    return [index.chunks[chunk_id]["document"] for chunk_id, _ in index.search(query, station, k)]
+
+
+def search_hybrid(query: str, station: str, k: int) -> list[str]:
+    return contingency.search_contingency(query, station=station, n_results=k)[0]
+
+
+def evaluate(search, k: int) -> tuple[float, float, list[float]]:
+    """
+    :return: The recall at 1 and at k, and the latency of every query.
+    """
+    hits_at_1 = hits_at_k = 0
+    timings = []
+    for query, station, heading in LABELLED_QUERIES:
+        start = time.perf_counter()
+        chunks = search(query, station, k)
+        timings.append(time.perf_counter() - start)
+        found = [heading in chunk for chunk in chunks]
+        hits_at_1 += any(found[:1])
+        hits_at_k += any(found)
+    return hits_at_1 / len(LABELLED_QUERIES), hits_at_k / len(LABELLED_QUERIES), timings
+
+
+if __name__ == "__main__":
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    contingency.warm_up()
+
+    print(f"{'retriever':<10} {'recall@1':>9} {'recall@' + str(k):>9} {'p50':>8} {'p95':>8}")
+    for label, search in (("vector", search_vectors), ("keyword", search_keywords), ("hybrid", search_hybrid)):
+        recall_at_1, recall_at_k, timings = evaluate(search, k)
+        p95 = sorted(timings)[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{label:<10} {recall_at_1:>9.2f} {recall_at_k:>9.2f} "
+              f"{statistics.median(timings) * 1000:>6.1f}ms {p95 * 1000:>6.1f}ms")
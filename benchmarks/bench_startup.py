@@ -0,0 +1,50 @@
+"""
+Compare building the spaCy entity rulers from the station table against loading them from the compiled cache.
+Run from the repository root: python benchmarks/bench_startup.py
+"""
+
+import sys, os, time, spacy
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import nlp as nlp_module
+
+
+def reset_pipeline() -> None:
+    """
+    Replace the module's spaCy pipeline with a fresh one without any entity rulers.
+    :return: None
+    """
+    nlp_module.nlp = spacy.load("en_core_web_sm")
+
+
+def time_build(stations: list[str]) -> float:
+    reset_pipeline()
+    start = time.perf_counter()
+    nlp_module.add_series_entity_ruler()
+    nlp_module.add_station_entity_ruler(stations)
+    return time.perf_counter() - start
+
+
+def time_load(cache_dir: str) -> float:
+    reset_pipeline()
+    start = time.perf_counter()
+    nlp_module.load_entity_rulers(cache_dir)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    stations = nlp_module.get_all_station_names()
+    cache_dir = os.path.join(nlp_module.RULER_CACHE_DIR, nlp_module.get_ruler_cache_key(stations))
+
+    build_times = [time_build(stations) for _ in range(runs)]
+    load_times = [time_load(cache_dir) for _ in range(runs)]
+
+    best_build = min(build_times)
+    best_load = min(load_times)
+    print(f"Stations:           {len(stations)}")
+    print(f"Build rulers (best of {runs}): {best_build:.3f}s")
+    print(f"Load rulers  (best of {runs}): {best_load:.3f}s")
+    print(f"Speed-up:           {best_build / best_load:.1f}x")
@@ -0,0 +1,55 @@
+"""
+Measure time-to-first-token of /chat/stream against the full response time of /chat.
+Start the server first (python src/chatbot/server.py), then run from the repository root:
+    python benchmarks/bench_ttft.py [runs] [message]
+"""
+
+import sys, json, time, statistics
+from urllib.request import Request, urlopen
+
+BASE_URL = "http://localhost:8000"
+
+
+def post(path: str, body: dict):
+    request = Request(
+        f"{BASE_URL}{path}",
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urlopen(request)
+
+
+def time_blocking(message: str) -> float:
+    start = time.perf_counter()
+    with post("/chat", {"message": message}) as response:
+        json.loads(response.read())
+    return time.perf_counter() - start
+
+
+def time_streaming(message: str) -> tuple[float, float]:
+    """
+    :return: The time until the first reply or token arrived, and the time until the stream finished.
+    """
+    start = time.perf_counter()
+    first = None
+    with post("/chat/stream", {"message": message}) as response:
+        for line in response:
+            event = json.loads(line)
+            if first is None and event["type"] in ("reply", "token"):
+                first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first if first is not None else total, total
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    message = sys.argv[2] if len(sys.argv) > 2 else "does Norwich have toilets"
+
+    blocking = [time_blocking(message) for _ in range(runs)]
+    streaming = [time_streaming(message) for _ in range(runs)]
+
+    print(f"{runs} runs of {message!r}")
+    print(f"/chat         full response   median {statistics.median(blocking):.2f}s")
+    print(f"/chat/stream  first token     median {statistics.median(s[0] for s in streaming):.2f}s")
+    print(f"/chat/stream  full response   median {statistics.median(s[1] for s in streaming):.2f}s")
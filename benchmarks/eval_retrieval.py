@@ -0,0 +1,225 @@
+"""
+Evaluate contingency retrieval on the labelled questions in contingency_questions.json, reporting recall@k,
+mean reciprocal rank and p50/p95/p99 latency for each store, retriever, candidate count and number of results.
+A question is answered when a chunk of the expected plan holding the expected section is returned.
+Everything runs offline against stores already ingested; to compare chunking settings, ingest each into its own
+store first and pass them all, as in:
+    python benchmarks/eval_retrieval.py --store default=./chroma_db --store small=./chroma_db_small --output eval.json
+Run from the repository root. The JSON results go to --output, or to stdout with the table on stderr.
+"""
+
+import sys, os, json, time, argparse, datetime, statistics, subprocess
+from unittest import mock
+
+# Never reach for the network: the embedding model and the stores must already be on disk.
+# Chroma downloads its embedding model whatever these say, so main checks the model is there first
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "chatbot")))
+
+import contingency
+from chatbot import station_partitions
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "contingency_questions.json")
+# The files Chroma's default embedding function loads, downloading them all if any is missing
+EMBEDDING_MODEL_FILES = ["config.json", "model.onnx", "special_tokens_map.json", "tokenizer_config.json",
+                         "tokenizer.json", "vocab.txt"]
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> list[dict]:
+    """
+    :return: The labelled questions, each with the station as a user might name it, the plan that answers it
+    and the heading of the section that does.
+    """
+    with open(path, mode="r") as file:
+        return json.load(file)
+
+
+def check_embedding_model() -> None:
+    """
+    Exit unless the embedding model is already on disk, rather than let Chroma download it.
+    """
+    model_path = os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+    missing = [name for name in EMBEDDING_MODEL_FILES if not os.path.exists(os.path.join(model_path, name))]
+    if missing:
+        sys.exit(f"The embedding model is not in {model_path} (missing {', '.join(missing)}); "
+                 f"ingest the plans once to download it")
+
+
+def use_store(path: str) -> None:
+    """
+    Point contingency at another store, dropping the handles opened on the last one.
+    """
+    contingency.CHROMA_PATH = path
+    contingency.MANIFEST_PATH = os.path.join(path, "contingency_manifest.json")
+    contingency.BM25_PATH = os.path.join(path, "contingency_bm25.json")
+    contingency.STATION_MAP_PATH = os.path.join(path, "contingency_stations.json")
+    contingency.client = None
+    contingency.collection = None
+    contingency.station_collections.clear()
+    contingency.station_map = None
+    contingency.keyword_index = None
+
+
+def resolve(station: str) -> str:
+    return station_partitions.resolve_station(contingency.get_station_map(), station)
+
+
+def search_hybrid(query: str, station: str, n_results: int) -> tuple[list[str], list[str]]:
+    return contingency.search_contingency(query, station=station, n_results=n_results)
+
+
+def search_vectors(query: str, station: str, n_results: int) -> tuple[list[str], list[str]]:
+    partition = resolve(station)
+    if station and partition is None:
+        return [], []
+    results = (contingency.get_station_collection(partition) if partition else contingency.get_collection()).query(
+        query_embeddings=contingency.embed_query(query),
+        n_results=n_results
+    )
+    return results["documents"][0], [metadata["source"] for metadata in results["metadatas"][0]]
+
+
+def search_keywords(query: str, station: str, n_results: int) -> tuple[list[str], list[str]]:
+    partition = resolve(station)
+    if station and partition is None:
+        return [], []
+    index = contingency.get_keyword_index()
+    chunk_ids = [chunk_id for chunk_id, _ in index.search(query, partition, n_results)]
+    return [index.chunks[chunk_id]["document"] for chunk_id in chunk_ids], [index.chunks[chunk_id]["source"] for chunk_id in chunk_ids]
+
+
+class FilteredCollection:
+    """
+    Stands in for a station's collection by filtering the global one, as searches did before partitioning.
+    """
+    def __init__(self, partition: str) -> None:
+        self.partition = partition
+
+    def query(self, **kwargs) -> dict:
+        return contingency.get_collection().query(where={"station": self.partition}, **kwargs)
+
+
+# Retriever name to its search and the patches it runs under
+RETRIEVERS = {
+    "hybrid": (search_hybrid, {}),
+    "hybrid-filtered": (search_hybrid, {"get_station_collection": FilteredCollection}),
+    "vector": (search_vectors, {}),
+    "keyword": (search_keywords, {}),
+}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def evaluate(search, questions: list[dict], n_results: int, repeats: int) -> dict:
+    """
+    Ask every question, repeating the whole set to steady the latency percentiles.
+    :return: The recall, mean reciprocal rank and latencies in milliseconds, and the questions not answered.
+    """
+    ranks = []
+    timings = []
+    for repeat in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            chunks, sources = search(question["question"], question["station"], n_results)
+            timings.append((time.perf_counter() - start) * 1000)
+            if repeat == 0:
+                ranks.append(next((rank for rank, (chunk, source) in enumerate(zip(chunks, sources), start=1)
+                                   if source == f"{question['plan']}.docx" and question["section"] in chunk), None))
+
+    return {
+        "recall": sum(rank is not None for rank in ranks) / len(ranks),
+        "mrr": sum(1 / rank for rank in ranks if rank) / len(ranks),
+        "latency_ms": {
+            "mean": statistics.mean(timings),
+            "p50": percentile(timings, 50),
+            "p95": percentile(timings, 95),
+            "p99": percentile(timings, 99),
+        },
+        "misses": [question["question"] for question, rank in zip(questions, ranks) if rank is None],
+    }
+
+
+def load_store_settings() -> dict:
+    """
+    :return: The chunking settings and plans the current store was ingested with, from its manifest.
+    """
+    try:
+        with open(contingency.MANIFEST_PATH, mode="r") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"chunking": None, "plans": None}
+    return {"chunking": manifest.get("chunking"), "plans": len(manifest.get("files", {}))}
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args: argparse.Namespace) -> dict:
+    check_embedding_model()
+    questions = load_questions(args.questions)
+    stores = dict(store.split("=", 1) if "=" in store else (store, store) for store in args.store)
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "questions": len(questions),
+        "repeats": args.repeats,
+        "stores": {},
+        "results": [],
+    }
+
+    table = sys.stderr if args.output is None else sys.stdout
+    print(f"{'store':<10} {'retriever':<16} {'cand':>4} {'k':>3} {'recall':>7} {'mrr':>6} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8}", file=table)
+    for store, path in stores.items():
+        if not os.path.exists(os.path.join(path, "chroma.sqlite3")):
+            sys.exit(f"No Chroma store at {path}; ingest the plans into it first")
+        use_store(path)
+        contingency.warm_up()
+        report["stores"][store] = {"path": path, "chunks": contingency.get_collection().count(), **load_store_settings()}
+
+        for retriever in args.retriever:
+            search, patches = RETRIEVERS[retriever]
+            # Only the fused searches take candidates from each retriever
+            for candidates in args.candidates if search is search_hybrid else [None]:
+                for n_results in args.k:
+                    with mock.patch.multiple(contingency, SEARCH_CANDIDATES=candidates or contingency.SEARCH_CANDIDATES, **patches):
+                        result = evaluate(search, questions, n_results, args.repeats)
+                    report["results"].append({"store": store, "retriever": retriever, "candidates": candidates,
+                                              "k": n_results, **result})
+                    latency = result["latency_ms"]
+                    print(f"{store:<10} {retriever:<16} {candidates or '-':>4} {n_results:>3} {result['recall']:>7.2f} "
+                          f"{result['mrr']:>6.2f} {latency['p50']:>6.1f}ms {latency['p95']:>6.1f}ms "
+                          f"{latency['p99']:>6.1f}ms", file=table)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", action="append", help="a store to evaluate, as label=path (default ./chroma_db)")
+    parser.add_argument("--retriever", nargs="+", choices=list(RETRIEVERS), default=list(RETRIEVERS))
+    parser.add_argument("--candidates", type=int, nargs="+", default=[contingency.SEARCH_CANDIDATES],
+                        help="candidates taken from each retriever before fusing")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="numbers of results to ask for")
+    parser.add_argument("--repeats", type=int, default=3, help="times to ask each question, for the latencies")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--output", help="file to write the JSON results to, instead of stdout")
+    args = parser.parse_args()
+    args.store = args.store or [f"default={contingency.CHROMA_PATH}"]
+
+    report = main(args)
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
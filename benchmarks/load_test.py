@@ -0,0 +1,90 @@
+"""
+Drive /chat with concurrent synthetic conversations and report throughput and tail latency.
+Start the server first, with PISCES_LLM_BACKEND=stub to measure everything but the model:
+    PISCES_LLM_BACKEND=stub python src/chatbot/server.py
+then run from the repository root:
+    python benchmarks/load_test.py --users 50 --duration 60
+"""
+
+import argparse, asyncio, random, statistics, time, uuid
+from collections import Counter
+import aiohttp
+
+# Each conversation is the messages one user sends in order, within one session
+CONVERSATIONS = [
+    ["does Norwich have toilets"],
+    ["is there wifi at the station", "Ely"],
+    ["what is the address of Cambridge station"],
+    ["how do I get from Norwich to Ely"],
+    ["will my train be delayed", "at 17:30"],
+    ["book a ticket from Norwich to Cambridge", "tomorrow at 10am"],
+    ["what should staff do if the line is blocked at Fleet"],
+    ["hello"],
+]
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def run_user(http: aiohttp.ClientSession, url: str, user: int, deadline: float, think_time: float,
+                   latencies: list, statuses: Counter) -> None:
+    """
+    Hold one conversation after another until the deadline, each in a new session.
+    """
+    rng = random.Random(user)
+    while time.monotonic() < deadline:
+        session_id = uuid.uuid4().hex
+        for message in rng.choice(CONVERSATIONS):
+            start = time.perf_counter()
+            try:
+                async with http.post(f"{url}/chat", json={"message": message, "session_id": session_id}) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+                    if response.status == 200:
+                        latencies.append(time.perf_counter() - start)
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+            if think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * think_time))
+            if time.monotonic() >= deadline:
+                return
+
+
+async def main(args: argparse.Namespace) -> None:
+    latencies = []
+    statuses = Counter()
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.users)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            run_user(http, args.url, user, deadline, args.think_time, latencies, statuses)
+            for user in range(args.users)
+        ))
+        elapsed = time.monotonic() - start
+
+    total = sum(statuses.values())
+    print(f"{args.users} users for {elapsed:.1f}s against {args.url}")
+    print(f"requests     {total} ({total / elapsed:.1f}/s)")
+    print(f"successful   {len(latencies)} ({len(latencies) / elapsed:.1f}/s)")
+    print("statuses     " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+    if latencies:
+        print(f"latency      mean {statistics.mean(latencies) * 1000:.0f}ms"
+              f"  p50 {percentile(latencies, 50) * 1000:.0f}ms"
+              f"  p95 {percentile(latencies, 95) * 1000:.0f}ms"
+              f"  p99 {percentile(latencies, 99) * 1000:.0f}ms"
+              f"  max {max(latencies) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent conversations")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run for")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's messages")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a request is abandoned")
+    asyncio.run(main(parser.parse_args()))
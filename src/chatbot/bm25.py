@@ -0,0 +1,131 @@
+"""
+BM25 keyword index over the contingency plan chunks.
+Postings are partitioned by station, so a query about one station only scores that station's chunks,
+while term statistics are shared across the whole corpus. The index is kept as JSON next to the Chroma store.
+"""
+
+import os, re, json, math, heapq
+
+K1 = 1.5
+B = 0.75
+
+
+def tokenise(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class BM25Index:
+    def __init__(self, collection_id: str = None) -> None:
+        # The Chroma collection the index was built alongside
+        self.collection_id = collection_id
+        self.chunks = {}  # Chunk id to its document, source, station and length in tokens
+        self.sources = {}  # Source file to its chunk ids
+        self.partitions = {}  # Station to term to chunk id to term frequency
+        self.document_frequency = {}
+        self.total_length = 0
+
+    def add_document(self, source: str, records: list[dict]) -> None:
+        """
+        Index the chunks of a document, replacing any indexed before.
+        :param source: The document's file name.
+        :param records: The chunks, as from contingency.parse_document.
+        """
+        self.remove_document(source)
+        self.sources[source] = []
+        for record in records:
+            station = record["metadata"]["station"]
+            tokens = tokenise(record["document"])
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+
+            partition = self.partitions.setdefault(station, {})
+            for term, frequency in frequencies.items():
+                partition.setdefault(term, {})[record["id"]] = frequency
+                self.document_frequency[term] = self.document_frequency.get(term, 0) + 1
+
+            self.chunks[record["id"]] = {
+                "document": record["document"],
+                "source": source,
+                "station": station,
+                "length": len(tokens),
+            }
+            self.sources[source].append(record["id"])
+            self.total_length += len(tokens)
+
+    def remove_document(self, source: str) -> None:
+        for chunk_id in self.sources.pop(source, []):
+            chunk = self.chunks.pop(chunk_id)
+            partition = self.partitions[chunk["station"]]
+            for term in set(tokenise(chunk["document"])):
+                del partition[term][chunk_id]
+                if not partition[term]:
+                    del partition[term]
+                self.document_frequency[term] -= 1
+                if not self.document_frequency[term]:
+                    del self.document_frequency[term]
+            if not partition:
+                del self.partitions[chunk["station"]]
+            self.total_length -= chunk["length"]
+
+    def search(self, query: str, station: str = None, n_results=10) -> list[tuple[str, float]]:
+        """
+        Score the chunks against a query.
+        :param query: The question.
+        :param station: The station to search, or None for all of them.
+        :param n_results: The maximum number of chunks to return.
+        :return: The best chunk ids with their scores, best first.
+        """
+        if not self.chunks:
+            return []
+        partitions = [self.partitions.get(station, {})] if station else list(self.partitions.values())
+        chunk_count = len(self.chunks)
+        average_length = self.total_length / chunk_count
+
+        scores = {}
+        for term in set(tokenise(query)):
+            frequency = self.document_frequency.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (chunk_count - frequency + 0.5) / (frequency + 0.5))
+            for partition in partitions:
+                for chunk_id, term_frequency in partition.get(term, {}).items():
+                    length = self.chunks[chunk_id]["length"]
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * term_frequency * (K1 + 1) / (
+                        term_frequency + K1 * (1 - B + B * length / average_length))
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str) -> None:
+        """
+        Write the index atomically.
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, mode="w") as file:
+            json.dump({
+                "collection": self.collection_id,
+                "chunks": self.chunks,
+                "sources": self.sources,
+                "partitions": self.partitions,
+                "document_frequency": self.document_frequency,
+                "total_length": self.total_length,
+            }, file)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """
+        Load a saved index, or an empty one if there is none.
+        """
+        index = cls()
+        try:
+            with open(path, mode="r") as file:
+                saved = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return index
+        index.collection_id = saved["collection"]
+        index.chunks = saved["chunks"]
+        index.sources = saved["sources"]
+        index.partitions = saved["partitions"]
+        index.document_frequency = saved["document_frequency"]
+        index.total_length = saved["total_length"]
+        return index
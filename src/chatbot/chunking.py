@@ -0,0 +1,187 @@
+"""
+Split contingency plans into chunks for retrieval.
+Chunks follow the plan's sections, but long sections are split and short ones merged, so every chunk is
+between CHUNK_MIN_TOKENS and CHUNK_MAX_TOKENS. Consecutive chunks of one section overlap by up to
+CHUNK_OVERLAP_TOKENS, table rows are never split, and each chunk carries the path of headings above it.
+"""
+
+import os, re, math
+
+CHUNK_MIN_TOKENS = int(os.getenv("PISCES_CHUNK_MIN_TOKENS", 64))
+CHUNK_MAX_TOKENS = int(os.getenv("PISCES_CHUNK_MAX_TOKENS", 256))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("PISCES_CHUNK_OVERLAP_TOKENS", 32))
+# Bumped whenever the chunks produced for the same settings change, so stores are re-ingested
+CHUNKING_VERSION = 1
+
+# Short paragraphs in these styles head a subsection
+SUBHEADING_STYLES = {"Subheader"}
+MAX_HEADING_WORDS = 10
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def get_settings() -> dict:
+    return {
+        "version": CHUNKING_VERSION,
+        "min_tokens": CHUNK_MIN_TOKENS,
+        "max_tokens": CHUNK_MAX_TOKENS,
+        "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+    }
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text by counting its words and punctuation,
+    which tracks the LLM's tokenizer closely for English without having to load it.
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def get_heading_level(block: dict) -> int:
+    """
+    :return: 1 for a section heading, 2 for a subsection heading, or 0 for body text.
+    """
+    if block["type"] != "paragraph":
+        return 0
+    if "Heading" in block["style"] or block["text"].isupper():
+        return 1
+    text = block["text"]
+    if block["style"] in SUBHEADING_STYLES and len(text.split()) <= MAX_HEADING_WORDS and not text.endswith((".", ":")):
+        return 2
+    return 0
+
+
+def split_into_sections(blocks: list[dict]) -> list[dict]:
+    """
+    Group blocks under the headings above them. The table of contents and empty table rows are dropped.
+    :return: A list of sections, each with its heading path and body blocks.
+    """
+    sections = []
+    path = ["General"]
+    for block in blocks:
+        if block["style"].startswith("TOC") or not re.search(r"\w", block["text"]):
+            continue
+
+        level = get_heading_level(block)
+        if level == 1:
+            path = [block["text"]]
+        elif level == 2:
+            path = [path[0], block["text"]]
+        else:
+            if not sections or sections[-1]["path"] != path:
+                sections.append({"path": path, "blocks": []})
+            sections[-1]["blocks"].append(block)
+    return sections
+
+
+def split_text(text: str, max_tokens: int) -> list[str]:
+    """
+    Split a paragraph into pieces of at most max_tokens, at sentence ends where possible.
+    """
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = []
+        for word in sentence.split():
+            if words and count_tokens(" ".join(words + [word])) > max_tokens:
+                pieces.append(" ".join(words))
+                words = []
+            words.append(word)
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def get_overlap(units: list[dict], overlap_tokens: int) -> list[dict]:
+    """
+    Get the end of a chunk to repeat at the start of the next: whole units while they fit,
+    otherwise the last words of a paragraph.
+    """
+    overlap = []
+    tokens = 0
+    for unit in reversed(units):
+        if tokens + unit["tokens"] > overlap_tokens:
+            if not overlap and unit["type"] == "paragraph":
+                words = []
+                for word in reversed(unit["text"].split()):
+                    if count_tokens(" ".join([word] + words)) > overlap_tokens:
+                        break
+                    words.insert(0, word)
+                if words:
+                    text = " ".join(words)
+                    overlap.append({"type": "paragraph", "text": text, "tokens": count_tokens(text)})
+            break
+        overlap.insert(0, unit)
+        tokens += unit["tokens"]
+    return overlap
+
+
+def pack_section(section: dict, max_tokens: int, overlap_tokens: int) -> list[list[dict]]:
+    """
+    Pack a section's blocks into evenly sized runs of at most max_tokens, each overlapping the one before.
+    Paragraphs too long for one chunk are split; table rows never are, even if that makes a chunk too long.
+    :return: The runs of units, each with its text and token count.
+    """
+    units = []
+    for block in section["blocks"]:
+        pieces = split_text(block["text"], max_tokens) if block["type"] == "paragraph" else [block["text"]]
+        units.extend({"type": block["type"], "text": piece, "tokens": count_tokens(piece)} for piece in pieces)
+
+    total = sum(unit["tokens"] for unit in units)
+    # Aim for equal runs, so a section just over the limit is not split into one large and one tiny chunk
+    target = min(max_tokens, math.ceil(total / math.ceil(total / max_tokens)) + overlap_tokens)
+
+    runs = []
+    current = []
+    tokens = 0
+    for unit in units:
+        if current and (tokens + unit["tokens"] > max_tokens or tokens >= target):
+            runs.append(current)
+            current = get_overlap(current, overlap_tokens)
+            tokens = sum(overlap["tokens"] for overlap in current)
+            if tokens + unit["tokens"] > max_tokens:
+                current, tokens = [], 0
+        current.append(unit)
+        tokens += unit["tokens"]
+    if current:
+        runs.append(current)
+    return runs
+
+
+def chunk_blocks(blocks: list[dict], min_tokens: int = CHUNK_MIN_TOKENS, max_tokens: int = CHUNK_MAX_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[dict]:
+    """
+    Split a plan's blocks into chunks.
+    :param blocks: The blocks from contingency.read_blocks.
+    :param min_tokens: Chunks smaller than this are merged with a neighbour, where the result fits.
+    :param max_tokens: The maximum size of a chunk, including its heading path.
+    :param overlap_tokens: The most text repeated from the end of one chunk at the start of the next.
+    :return: A list of chunks, each with its heading, heading path, text and token count.
+    """
+    chunks = []
+    for section in split_into_sections(blocks):
+        heading_path = " > ".join(section["path"])
+        budget = max(1, max_tokens - count_tokens(heading_path) - 1)
+        for run in pack_section(section, budget, min(overlap_tokens, budget // 2)):
+            text = " ".join(unit["text"] for unit in run)
+            chunks.append({
+                "heading": section["path"][-1],
+                "heading_path": heading_path,
+                "text": text,
+                "tokens": count_tokens(f"{heading_path}: {text}"),
+            })
+
+    # Merge neighbouring chunks when either is too small and the result still fits
+    merged = []
+    for chunk in chunks:
+        previous = merged[-1] if merged else None
+        if previous and (previous["tokens"] < min_tokens or chunk["tokens"] < min_tokens):
+            text = chunk["text"] if chunk["heading_path"] == previous["heading_path"] \
+                else f"{chunk['heading_path']}: {chunk['text']}"
+            tokens = previous["tokens"] + count_tokens(text)
+            if tokens <= max_tokens:
+                previous["text"] = f"{previous['text']} {text}"
+                previous["tokens"] = tokens
+                continue
+        merged.append(dict(chunk))
+    return merged
@@ -0,0 +1,105 @@
+"""
+Token-budgeted window over a conversation's message history.
+The system prompt and the most recent turns are kept within the budget. Older turns are dropped
+and replaced by a short summary of the slots already filled, appended to the system prompt.
+"""
+
+import os
+
+CONTEXT_TOKENS = int(os.getenv("PISCES_CONTEXT_TOKENS", 1536))
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def get_budget(n_ctx: int, max_reply_tokens: int) -> int:
+    """
+    :param n_ctx: The model's context size.
+    :param max_reply_tokens: The number of tokens kept free for the reply.
+    :return: The number of tokens the prompt may use.
+    """
+    return min(CONTEXT_TOKENS, n_ctx - max_reply_tokens)
+
+
+def split_turns(messages: list) -> list:
+    """
+    Group messages into turns, each starting at a user message.
+    Messages before the first user message form a turn of their own.
+    :param messages: The messages after the system prompt.
+    :return: A list of turns, each a list of messages.
+    """
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def get_message_tokens(message: dict, count_tokens) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def add_summary(system: dict, summary: str) -> dict:
+    if not summary:
+        return system
+    return {**system, "content": f"{system['content']}\n{summary}"}
+
+
+def fit_history(messages: list, count_tokens, budget: int, summary: str = "", compacted: bool = False) -> tuple[list, int]:
+    """
+    Choose the messages to send to the model.
+    The system prompt and the latest turn are always kept, even if they alone go over the budget.
+    :param messages: The full message history, starting with the system prompt.
+    :param count_tokens: A callable returning the number of tokens in a string.
+    :param budget: The maximum number of prompt tokens.
+    :param summary: A summary of the earlier conversation, added to the system prompt when turns are left out.
+    :param compacted: Whether earlier turns have already been removed from the history.
+    :return: The messages to send, and how many messages after the system prompt were left out.
+    """
+    turns = split_turns(messages[1:])
+    turn_tokens = [sum(get_message_tokens(message, count_tokens) for message in turn) for turn in turns]
+    system_tokens = get_message_tokens(messages[0], count_tokens)
+
+    if not compacted and system_tokens + sum(turn_tokens) <= budget:
+        return list(messages), 0
+
+    system = add_summary(messages[0], summary)
+    used = get_message_tokens(system, count_tokens)
+    kept = 0
+    for tokens in reversed(turn_tokens):
+        if kept and used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+
+    kept_turns = turns[len(turns) - kept:]
+    dropped = sum(len(turn) for turn in turns[:len(turns) - kept])
+    return [system] + [message for turn in kept_turns for message in turn], dropped
+
+
+def format_slot(value) -> str:
+    # Journey times are stored as the DATE and TIME entities found in the message
+    if isinstance(value, dict):
+        return " ".join(str(part) for parts in value.values() for part in parts)
+    return str(value)
+
+
+def summarise_slots(completed: list, info: dict) -> str:
+    """
+    Summarise the requests already answered and the slots collected so far.
+    :param completed: A list of (intent, slots) for the answered requests, oldest first.
+    :param info: The slots collected for the request in progress.
+    :return: The summary, or an empty string if there is nothing to summarise.
+    """
+    parts = []
+    for intent, slots in completed:
+        details = ", ".join(f"{key}: {format_slot(value)}" for key, value in slots.items())
+        parts.append(f"{intent} ({details})" if details else intent)
+
+    summary = ""
+    if parts:
+        summary += "Earlier in the conversation the user asked about: " + "; ".join(parts) + "."
+    if info:
+        details = ", ".join(f"{key}: {format_slot(value)}" for key, value in info.items())
+        summary += (" " if summary else "") + f"Details already given: {details}."
+    return summary
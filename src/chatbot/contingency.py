@@ -1,92 +1,483 @@
 # contingency_rag.py
 
-import os
+import os, sys, json, time, hashlib, threading, zipfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import xml.etree.ElementTree as ElementTree
 import chromadb
-from docx import Document
-from docx.oxml.ns import qn
+from chromadb.utils import embedding_functions
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.data_versions import mark_rebuilt
+from utils.embedding_cache import EmbeddingCache, normalise_query
+from chatbot.bm25 import BM25Index
+from chatbot import chunking, station_partitions
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+CHROMA_PATH = "./chroma_db"
+COLLECTION_NAME = "railway_contingency"
+# Content hashes of the ingested plans, kept with the store they describe
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "contingency_manifest.json")
+# The keyword index searched alongside the vectors
+BM25_PATH = os.path.join(CHROMA_PATH, "contingency_bm25.json")
+# Each plan's station, its collection and the names it is known by
+STATION_MAP_PATH = os.path.join(CHROMA_PATH, "contingency_stations.json")
+# Candidates taken from each retriever before fusing, and the reciprocal rank fusion constant
+SEARCH_CANDIDATES = int(os.getenv("PISCES_CONTINGENCY_CANDIDATES", 10))
+RRF_K = 60
+# Processes parsing plans, and chunks embedded and written per call, when ingesting
+INGEST_PROCESSES = int(os.getenv("PISCES_INGEST_PROCESSES", os.cpu_count() or 1))
+INGEST_BATCH_SIZE = int(os.getenv("PISCES_INGEST_BATCH_SIZE", 256))
+
+# One client and collection handle for the whole process, so the store and its index stay loaded.
+# Every chunk is in the collection of all plans and in the collection of its station's plan.
+client = None
+collection = None
+station_collections = {}
+station_map = None
+keyword_index = None
+embedding_cache = None
+embedding_function = None
+client_lock = threading.Lock()
+
+
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            client = chromadb.PersistentClient(path=CHROMA_PATH)
+        return client
+
+
+def get_collection():
+    """
+    Get the contingency collection, opening it on first use.
+    Chroma's client is safe to query from several threads, so only opening the handle is locked.
+    :return: The collection.
+    """
+    global collection
+    if collection is None:
+        chroma = get_client()
+        with client_lock:
+            if collection is None:
+                collection = chroma.get_collection(COLLECTION_NAME)
+    return collection
+
+
+def get_station_map() -> dict:
+    global station_map
+    if station_map is None:
+        with client_lock:
+            if station_map is None:
+                station_map = station_partitions.load_station_map(STATION_MAP_PATH)
+    return station_map
+
+
+def get_station_collection(partition: str):
+    """
+    Get the collection of one station's plan, opening it on first use.
+    :param partition: The partition, as from station_partitions.resolve_station.
+    :return: The collection.
+    """
+    name = get_station_map()["partitions"][partition]["collection"]
+    if name not in station_collections:
+        chroma = get_client()
+        with client_lock:
+            if name not in station_collections:
+                station_collections[name] = chroma.get_or_create_collection(name)
+    return station_collections[name]
+
+
+def drop_collection(chroma, name: str) -> None:
+    # Deleting a collection that does not exist raises, and which error depends on the Chroma version
+    chroma.get_or_create_collection(name)
+    chroma.delete_collection(name)
+
+
+def get_keyword_index() -> BM25Index:
+    global keyword_index
+    if keyword_index is None:
+        with client_lock:
+            if keyword_index is None:
+                keyword_index = BM25Index.load(BM25_PATH)
+    return keyword_index
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global embedding_cache, embedding_function
+    if embedding_cache is None:
+        with client_lock:
+            if embedding_cache is None:
+                embedding_function = embedding_functions.DefaultEmbeddingFunction()
+                model_id = getattr(embedding_function, "MODEL_NAME", type(embedding_function).__name__)
+                embedding_cache = EmbeddingCache(model_id)
+    return embedding_cache
+
+
+def embed(texts: list[str]) -> list[list[float]]:
+    """
+    Embed chunks with Chroma's default model, reusing vectors cached on disk for the same text.
+    :param texts: The chunks.
+    :return: The vectors.
+    """
+    return get_embedding_cache().embed(texts, embedding_function)
+
+
+def embed_query(query: str) -> list[list[float]]:
+    """
+    Embed a question with Chroma's default model, reusing the vectors of recent questions held in memory.
+    :param query: The question, normalised here.
+    :return: The vector, as the query embeddings Chroma takes.
+    """
+    return [get_embedding_cache().embed_query(normalise_query(query), embedding_function)]
+
+
+def warm_up():
+    """
+    Open the collection and run one search, loading the embedding model, the vector index and the keyword index into memory.
+    """
+    search_contingency("warm up")
+    # The search may have been answered from the question cache, so make sure the model itself is loaded
+    embedding_function(["warm up"])
+
+def get_text(element) -> str:
+    return "".join(node.text or "" for node in element.iter(f"{W}t"))
+
+
+def get_blocks(element) -> list[dict]:
+    """
+    Get the blocks of one top-level body element: a paragraph, or each row of a table.
+    Works on both python-docx and ElementTree elements.
+    :param element: A child of the document body.
+    :return: A list of blocks, each with a type, text and the paragraph's style id.
+    """
+    blocks = []
+    if element.tag == f"{W}p":
+        text = get_text(element).strip()
+        style = element.find(f"{W}pPr/{W}pStyle")
+        if text:
+            blocks.append({"type": "paragraph", "text": text, "style": style.get(f"{W}val") if style is not None else ""})
+
+    elif element.tag == f"{W}tbl":
+        for row in element.iter(f"{W}tr"):
+            row_text = " | ".join(get_text(cell) for cell in row.iter(f"{W}tc")).strip()
+            if row_text:
+                blocks.append({"type": "table_row", "text": row_text, "style": ""})
+    return blocks
+
 
 def get_blocks_in_order(doc):
     """Returns paragraphs and table rows in document reading order."""
+    return [block for element in doc.element.body for block in get_blocks(element)]
+
+
+def read_blocks(path: str) -> list[dict]:
+    """
+    Read the paragraphs and table rows of a .docx file in reading order, as get_blocks_in_order does.
+    Only word/document.xml is read, streamed one body element at a time, so the images that make up
+    most of each plan are never loaded.
+    :param path: The path to the .docx file.
+    :return: The blocks.
+    """
     blocks = []
-    for block in doc.element.body:
-        if block.tag == qn("w:p"):
-            text = "".join(node.text or "" for node in block.iter() if node.tag == qn("w:t")).strip()
-            style = block.style if block.style is not None else ""
-            if text:
-                blocks.append({"type": "paragraph", "text": text, "style": style})
-
-        elif block.tag == qn("w:tbl"):
-            for row in block.findall(".//" + qn("w:tr")):
-                cells = row.findall(".//" + qn("w:tc"))
-                row_text = " | ".join(
-                    "".join(node.text or "" for node in cell.iter() if node.tag == qn("w:t"))
-                    for cell in cells
-                ).strip()
-                if row_text:
-                    blocks.append({"type": "table_row", "text": row_text, "style": ""})
+    depth = 0
+    body = None
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2:
+                    body = element
+                continue
+
+            depth -= 1
+            # Depth 2 is back in w:body, so a whole top-level element has been parsed
+            if depth == 2:
+                blocks.extend(get_blocks(element))
+                body.remove(element)
     return blocks
 
 
-def ingest_documents(docs_folder="src/data/contingency_plans"):
-    client = chromadb.PersistentClient(path="./chroma_db")
-    client.delete_collection("railway_contingency")
-    collection = client.create_collection("railway_contingency")
-
-    for filename in os.listdir(docs_folder):
-        if filename.endswith(".docx"):
-            station_name = filename.replace(".docx", "")
-            doc = Document(f"{docs_folder}/{filename}")
-            blocks = get_blocks_in_order(doc)
-
-            # Split into chunks at every heading
-            chunks = []
-            current_heading = "General"
-            current_text = []
-
-            for block in blocks:
-                is_heading = "Heading" in block["style"] or block["text"].isupper()
-                if is_heading and current_text:
-                    chunks.append({
-                        "heading": current_heading,
-                        "text": " ".join(current_text)
-                    })
-                    current_heading = block["text"]
-                    current_text = []
-                else:
-                    current_text.append(block["text"])
-
-            # Don't forget the last section
-            if current_text:
-                chunks.append({
-                    "heading": current_heading,
-                    "text": " ".join(current_text)
-                })
-
-            for i, chunk in enumerate(chunks):
-                collection.add(
-                    documents=[f"{chunk['heading']}: {chunk['text']}"],
-                    ids=[f"{filename}_chunk_{i}"],
-                    metadatas=[{
-                        "source": filename,
-                        "station": station_name,
-                        "section": chunk["heading"],
-                        "chunk": i
-                    }]
-                )
-            print(f"Ingested: {filename} ({len(chunks)} chunks)")
+def get_file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, mode="rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def get_partition_collections(station_map: dict) -> dict[str, str]:
+    """
+    :return: A dictionary of each plan's file name to the station collection its chunks are written to.
+    """
+    return {f"{plan}.docx": partition["collection"] for plan, partition in station_map["partitions"].items()}
+
+
+def load_manifest(collection_id: str, partition_collections: dict[str, str]) -> dict[str, str]:
+    """
+    Load the content hashes of the documents already in the collection.
+    A manifest left from a deleted collection, from other chunking settings or from before the plans were
+    partitioned by station is ignored, and plans written to another station collection are left out.
+    :param collection_id: The id of the collection.
+    :param partition_collections: The station collection of each plan, from get_partition_collections.
+    :return: A dictionary of file name to content hash.
+    """
+    try:
+        with open(MANIFEST_PATH, mode="r") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("collection") != collection_id or manifest.get("chunking") != chunking.get_settings() \
+            or "partitions" not in manifest:
+        return {}
+    # Removed plans are kept, so their chunks are deleted
+    written_to = manifest["partitions"]
+    return {
+        filename: file_hash for filename, file_hash in manifest["files"].items()
+        if written_to.get(filename) == partition_collections.get(filename, written_to.get(filename))
+    }
+
+
+def save_manifest(collection_id: str, files: dict[str, str], partition_collections: dict[str, str]) -> None:
+    """
+    Write the manifest atomically, so a crash never leaves it half-written.
+    """
+    temp_path = f"{MANIFEST_PATH}.tmp"
+    with open(temp_path, mode="w") as file:
+        json.dump({
+            "collection": collection_id,
+            "chunking": chunking.get_settings(),
+            "partitions": {filename: partition_collections[filename] for filename in files if filename in partition_collections},
+            "files": files,
+        }, file, indent=1, sort_keys=True)
+    os.replace(temp_path, MANIFEST_PATH)
+
+
+def parse_document(docs_folder: str, filename: str) -> tuple[str, list[dict]]:
+    """
+    Parse a plan into the records to store, with ids stable across runs.
+    Runs in the ingestion worker processes, so it only takes and returns picklable values.
+    :return: The file name and its records, each with an id, document and metadata.
+    """
+    station_name = filename.replace(".docx", "")
+    chunks = chunking.chunk_blocks(read_blocks(f"{docs_folder}/{filename}"))
+    return filename, [{
+        "id": f"{filename}_chunk_{i}",
+        "document": f"{chunk['heading_path']}: {chunk['text']}",
+        "metadata": {
+            "source": filename,
+            "station": station_name,
+            "section": chunk["heading"],
+            "heading_path": chunk["heading_path"],
+            "chunk": i
+        }
+    } for i, chunk in enumerate(chunks)]
+
+
+def parse_documents(docs_folder: str, filenames: list[str], processes: int):
+    """
+    Parse the plans in a pool of worker processes, yielding each as soon as it is ready.
+    :return: A generator of (file name, records).
+    """
+    if processes <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield parse_document(docs_folder, filename)
+        return
+
+    # Spawned rather than forked, as the parent may already hold the Chroma client and its threads
+    with ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context("spawn")) as executor:
+        futures = [executor.submit(parse_document, docs_folder, filename) for filename in filenames]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_batch(batch: list[dict]) -> None:
+    """
+    Write chunks to the collection of all plans and to their stations' collections, embedding each once.
+    """
+    embeddings = embed([record["document"] for record in batch])
+    partitions = {}
+    for record, embedding in zip(batch, embeddings):
+        partitions.setdefault(record["metadata"]["station"], []).append((record, embedding))
+
+    targets = [(collection, list(zip(batch, embeddings)))]
+    targets += [(get_station_collection(partition), items) for partition, items in partitions.items()]
+    for target, items in targets:
+        target.upsert(
+            ids=[record["id"] for record, _ in items],
+            documents=[record["document"] for record, _ in items],
+            embeddings=[embedding for _, embedding in items],
+            metadatas=[record["metadata"] for record, _ in items]
+        )
+
+
+def ingest_documents(docs_folder="src/data/contingency_plans", rebuild=False,
+                     processes=INGEST_PROCESSES, batch_size=INGEST_BATCH_SIZE) -> dict:
+    """
+    Bring the collection up to date with the plans in the folder.
+    Only new or changed documents are parsed and embedded, and the chunks of removed documents are deleted.
+    Documents are parsed in parallel, and their chunks are written, and so embedded, in batches.
+    The manifest is saved as each document is fully written, so an interrupted run carries on where it stopped.
+    :param docs_folder: The folder of .docx plans.
+    :param rebuild: Whether to drop the collection and ingest every document again.
+    :param processes: The number of processes parsing documents.
+    :param batch_size: The number of chunks written to the collection at once.
+    :return: The numbers of documents and chunks ingested, and the seconds taken.
+    """
+    global collection, keyword_index, station_map
+    start = time.perf_counter()
+    filenames = sorted(filename for filename in os.listdir(docs_folder) if filename.endswith(".docx"))
+    # Without a station map the station collections may never have been written, so every plan is ingested again
+    has_station_map = os.path.exists(STATION_MAP_PATH)
+    old_station_map = station_partitions.load_station_map(STATION_MAP_PATH)
+    new_station_map = station_partitions.build_station_map(
+        [filename.replace(".docx", "") for filename in filenames], COLLECTION_NAME)
+
+    chroma = get_client()
+    with client_lock:
+        if rebuild:
+            drop_collection(chroma, COLLECTION_NAME)
+            for partition in old_station_map["partitions"].values():
+                drop_collection(chroma, partition["collection"])
+            old_station_map = {"partitions": {}, "names": {}, "other_names": []}
+        collection = chroma.get_or_create_collection(COLLECTION_NAME)
+        station_collections.clear()
+        station_map = new_station_map
+    station_partitions.save_station_map(new_station_map, STATION_MAP_PATH)
+
+    collection_id = str(collection.id)
+    partition_collections = get_partition_collections(new_station_map)
+    manifest = load_manifest(collection_id, partition_collections) if has_station_map else {}
+    # Built on a copy loaded from disk, so searches never see it half-updated
+    index = BM25Index.load(BM25_PATH)
+    if index.collection_id != collection_id:
+        # The keyword index is missing or from another collection, so every plan is ingested again
+        manifest = {}
+        index = BM25Index(collection_id)
+
+    def save_progress() -> None:
+        # The keyword index is saved first, so the manifest never lists a plan it is missing
+        index.save(BM25_PATH)
+        save_manifest(collection_id, manifest, partition_collections)
+
+    # Collections of removed plans, or of plans moved to another station, are dropped; load_manifest left the
+    # moved plans out, so they are written again
+    for partition, old in old_station_map["partitions"].items():
+        new = new_station_map["partitions"].get(partition)
+        if new is None or new["collection"] != old["collection"]:
+            drop_collection(chroma, old["collection"])
+
+    removed = 0
+    for filename in sorted(set(manifest) - set(filenames)):
+        collection.delete(where={"source": filename})
+        index.remove_document(filename)
+        del manifest[filename]
+        save_progress()
+        removed += 1
+        print(f"- Removed: {filename}")
+
+    hashes = {filename: get_file_hash(f"{docs_folder}/{filename}") for filename in filenames}
+    changed = [filename for filename in filenames if manifest.get(filename) != hashes[filename]]
+
+    pending = []  # Records waiting to be written
+    unwritten = {}  # The number of records of each document still waiting
+    chunk_count = 0
+
+    def flush(records: list[dict]) -> None:
+        write_batch(records)
+        for record in records:
+            source = record["metadata"]["source"]
+            unwritten[source] -= 1
+            if unwritten[source] == 0:
+                del unwritten[source]
+                manifest[source] = hashes[source]
+        save_progress()
+
+    for filename, records in parse_documents(docs_folder, changed, processes):
+        # Chunks beyond the document's new length are left over from a longer version
+        stale = {"$and": [{"source": filename}, {"chunk": {"$gte": len(records)}}]}
+        collection.delete(where=stale)
+        get_station_collection(filename.replace(".docx", "")).delete(where=stale)
+        index.add_document(filename, records)
+        chunk_count += len(records)
+        print(f"Ingested: {filename} ({len(records)} chunks)")
+        if not records:
+            manifest[filename] = hashes[filename]
+            save_progress()
+            continue
+
+        unwritten[filename] = len(records)
+        pending.extend(records)
+        while len(pending) >= batch_size:
+            flush(pending[:batch_size])
+            pending = pending[batch_size:]
+
+    if pending:
+        flush(pending)
+    if changed or removed:
+        save_progress()
+    keyword_index = index
+
+    seconds = time.perf_counter() - start
+    print(f"+ Contingency plans up to date: {len(changed)} ingested, {removed} removed, "
+          f"{len(filenames) - len(changed)} unchanged")
+    if changed:
+        print(f"+ {chunk_count} chunks in {seconds:.1f}s: {len(changed) / seconds:.1f} documents/s, "
+              f"{chunk_count / seconds:.1f} chunks/s")
+    if changed or removed:
+        mark_rebuilt("contingency")
+    return {"documents": len(changed), "chunks": chunk_count, "seconds": seconds}
+
+
+def fuse_rankings(rankings: list[list[str]]) -> list[str]:
+    """
+    Merge rankings by reciprocal rank fusion, so a chunk ranked well by either retriever comes near the top.
+    :param rankings: Lists of chunk ids, best first.
+    :return: The chunk ids, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
 
 def search_contingency(query: str, station: str = None, n_results=1):
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection("railway_contingency")
-    where = {"station": station} if station else None
-
-    results = collection.query(
-        query_texts=[query],
-        n_results=n_results,
-        where=where
+    """
+    Find the plan chunks that best answer a question, fusing vector search with keyword search.
+    When the station has a plan, only that plan's collection and keyword partition are searched.
+    :param query: The question.
+    :param station: The station whose plan to search, written in any way station_partitions can resolve,
+    or None to search every plan. A station without a plan finds nothing.
+    :param n_results: The number of chunks to return.
+    :return: The chunks and the file each came from.
+    """
+    partition = station_partitions.resolve_station(get_station_map(), station)
+    if station and partition is None:
+        # The station has no plan, and another station's plan would not answer for it
+        return [], []
+    candidates = max(n_results, SEARCH_CANDIDATES)
+
+    results = (get_station_collection(partition) if partition else get_collection()).query(
+        query_embeddings=embed_query(query),
+        n_results=candidates
     )
-    chunks = results["documents"][0]
-    sources = [m["source"] for m in results["metadatas"][0]]
+    found = {
+        chunk_id: (document, metadata["source"])
+        for chunk_id, document, metadata in zip(results["ids"][0], results["documents"][0], results["metadatas"][0])
+    }
+
+    index = get_keyword_index()
+    keyword_ids = [chunk_id for chunk_id, _ in index.search(query, partition, candidates)]
+    for chunk_id in keyword_ids:
+        if chunk_id not in found:
+            found[chunk_id] = (index.chunks[chunk_id]["document"], index.chunks[chunk_id]["source"])
+
+    ranked = fuse_rankings([results["ids"][0], keyword_ids])[:n_results]
+    chunks = [found[chunk_id][0] for chunk_id in ranked]
+    sources = [found[chunk_id][1] for chunk_id in ranked]
     return chunks, sources
 
 
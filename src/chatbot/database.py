@@ -1,4 +1,4 @@
-import json
+import json, hashlib
 
 INTENTIONS_PATH = "./src/data/json/intentions.json"
 EXTRACTION_PATH = "./src/data/json/extraction_patterns.json"
@@ -185,6 +185,17 @@ def get_constraint_training_data() -> list:
             intent_labels.append(key.lower())
     return training_sentences, intent_labels
 
+def get_training_data_hash() -> str:
+    """
+    Get a content hash of the classifier training files.
+    :return: The SHA-256 hex digest of the intentions, constraints and FAQ files.
+    """
+    digest = hashlib.sha256()
+    for path in [INTENTIONS_PATH, CONSTRAINTS_path, FAQ_PATH]:
+        with open(path, mode="rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
 def get_faq_training_data() -> list:
     training_sentences = []
     intent_labels = []
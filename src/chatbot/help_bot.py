@@ -4,16 +4,14 @@ The reasoning engine will be responsible for asking the user for information
 and storing it in the info dictionary.
 '''
 import os
-from llama_cpp import Llama 
 import json
-from llama_cpp import Llama
 from dotenv import load_dotenv
-import nlp
+import nlp, llm_backends
 import chatbot.journey_planner as journey_planner 
 import knowledge_base as kb
 import interface
 
-llm = Llama(model_path=os.getenv("LLAMA_PATH"), verbose=False)
+llm = llm_backends.load_backend()
 messages = [""]
 
 # Info memory
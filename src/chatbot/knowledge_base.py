@@ -10,6 +10,10 @@ from pathlib import Path
 from dotenv import load_dotenv
 import xml.etree.ElementTree as ET
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.data_versions import mark_rebuilt
+
 load_dotenv()
 
 STATION_CODES_PATH = "./src/data/csv/enhanced_stations.csv"
@@ -443,6 +447,7 @@ def generate_station_codes_table() -> None:
     """
     create_station_codes_table()
     process_station_csv()
+    mark_rebuilt("station_codes")
     print("+ Station codes table created and populated successfully.")
 
 #endregion Station Codes Table Creation ---
@@ -0,0 +1,152 @@
+"""
+Interchangeable LLM backends, selected by PISCES_LLM_BACKEND:
+    llama   the GGUF model loaded in this process (the default)
+    pool    a pool of model worker processes, see llm_pool
+    stub    canned replies at a configurable latency and token rate, for load tests without a model
+"""
+
+import os, threading, time
+import multiprocessing as mp
+from abc import ABC, abstractmethod
+import llm_service
+
+LLM_BACKEND = os.getenv("PISCES_LLM_BACKEND", "")
+STUB_LATENCY = float(os.getenv("PISCES_STUB_LATENCY", 0.2))
+STUB_TOKENS_PER_SECOND = float(os.getenv("PISCES_STUB_TOKENS_PER_SECOND", 20))
+STUB_REPLY = os.getenv(
+    "PISCES_STUB_REPLY",
+    "Thank you for your question. This is a placeholder reply from the test model, "
+    "standing in for the railway assistant so the rest of the service can be measured.",
+)
+
+
+class LLMBackend(ABC):
+    """
+    Chat completion with optional streaming, independent of where the model runs.
+    """
+    @abstractmethod
+    def chat(self, messages: list, route_key: str = None, max_tokens: int = None) -> tuple[str, dict]:
+        """
+        Generate a reply to the conversation.
+        :param messages: The chat messages, starting with the system prompt.
+        :param route_key: A key, such as the session id, for backends that keep per-conversation state.
+        :param max_tokens: The maximum reply length, PISCES_MAX_REPLY_TOKENS by default.
+        :return: The reply text and the token counts for the request.
+        """
+
+    @abstractmethod
+    def stream(self, messages: list, route_key: str = None, stats: dict = None, max_tokens: int = None):
+        """
+        Generate a reply token by token. Closing the generator early stops the generation.
+        :param stats: An optional dictionary filled with the token counts once the stream is finished.
+        :return: A generator of reply tokens.
+        """
+
+    @abstractmethod
+    def count_tokens(self, text: str) -> int:
+        pass
+
+    def n_ctx(self) -> int:
+        return llm_service.LLAMA_N_CTX
+
+    def stop(self) -> None:
+        pass
+
+    def create_chat_completion(self, messages: list, max_tokens: int = None) -> dict:
+        """
+        Generate a reply in the shape returned by Llama.create_chat_completion, for frontends written against it.
+        """
+        text, stats = self.chat(messages, max_tokens=max_tokens)
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "total_tokens": stats["prompt_tokens"] + stats["completion_tokens"],
+            },
+        }
+
+
+class LlamaBackend(LLMBackend):
+    def __init__(self) -> None:
+        self.llm = llm_service.load_llm()
+        # A single model instance cannot run two generations at once
+        self.lock = threading.Lock()
+
+    def chat(self, messages: list, route_key: str = None, max_tokens: int = None) -> tuple[str, dict]:
+        with self.lock:
+            return llm_service.chat_completion(self.llm, messages, max_tokens)
+
+    def stream(self, messages: list, route_key: str = None, stats: dict = None, max_tokens: int = None):
+        with self.lock:
+            yield from llm_service.stream_chat_completion(self.llm, messages, stats, max_tokens)
+
+    def count_tokens(self, text: str) -> int:
+        return llm_service.count_tokens(self.llm, text)
+
+    def n_ctx(self) -> int:
+        return self.llm.n_ctx()
+
+
+class StubBackend(LLMBackend):
+    """
+    Replies with the same canned text every time, one word per token, after a fixed time to first token.
+    """
+    def __init__(self, latency: float = STUB_LATENCY, tokens_per_second: float = STUB_TOKENS_PER_SECOND,
+                 reply: str = STUB_REPLY) -> None:
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.words = reply.split()
+
+    def get_tokens(self, max_tokens: int = None) -> list[str]:
+        words = self.words[:max_tokens or llm_service.LLAMA_MAX_TOKENS]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def get_stats(self, messages: list, completion_tokens: int) -> dict:
+        prompt_tokens = sum(self.count_tokens(message["content"]) for message in messages)
+        stats = {
+            "prompt_tokens": prompt_tokens,
+            "reused_tokens": 0,
+            "evaluated_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+        llm_service.add_stats(stats)
+        return stats
+
+    def chat(self, messages: list, route_key: str = None, max_tokens: int = None) -> tuple[str, dict]:
+        tokens = self.get_tokens(max_tokens)
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return "".join(tokens), self.get_stats(messages, len(tokens))
+
+    def stream(self, messages: list, route_key: str = None, stats: dict = None, max_tokens: int = None):
+        tokens = self.get_tokens(max_tokens)
+        time.sleep(self.latency)
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_second)
+            yield token
+        if stats is not None:
+            stats.update(self.get_stats(messages, len(tokens)))
+
+    def count_tokens(self, text: str) -> int:
+        return len(str(text).split())
+
+
+def load_backend() -> LLMBackend:
+    """
+    Load the backend named by PISCES_LLM_BACKEND. Without one, a worker pool is used when
+    PISCES_LLM_PROCESSES is set, otherwise the in-process model.
+    Worker processes re-import the frontend's main module when they start, and get None here.
+    :return: The backend.
+    """
+    if mp.parent_process() is not None:
+        return None
+
+    import llm_pool
+    backend = LLM_BACKEND or ("pool" if llm_pool.LLM_PROCESSES > 0 else "llama")
+    if backend == "llama":
+        return LlamaBackend()
+    if backend == "pool":
+        return llm_pool.LLMPool(max(1, llm_pool.LLM_PROCESSES), llm_pool.LLM_THREADS).start()
+    if backend == "stub":
+        return StubBackend()
+    raise ValueError(f"Unknown LLM backend: {backend}")
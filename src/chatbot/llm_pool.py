@@ -0,0 +1,299 @@
+"""
+Pool of model worker processes.
+Each worker loads the memory-mapped GGUF model, so the weights are shared through the page cache rather than
+copied per process, and is pinned to its own subset of cores with a matching number of threads.
+Frontends send requests over a per-worker IPC queue, and every session is routed to the same worker so its
+prompt prefix stays in that worker's cache, unless that worker is busy and another is free.
+A worker that dies, or sends nothing for LLM_REQUEST_TIMEOUT seconds, fails its requests and is replaced.
+Each worker sends its results over its own pipe, so a worker dying mid-write never blocks the others.
+"""
+
+import os, queue, threading, time, zlib
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import llm_service
+from llm_backends import LLMBackend
+
+LLM_PROCESSES = int(os.getenv("PISCES_LLM_PROCESSES", 0))
+# Threads per worker, by default the cores available divided evenly between the workers
+LLM_THREADS = int(os.getenv("PISCES_LLM_THREADS", 0))
+WORKER_START_TIMEOUT = 600
+# Requests a worker may hold before a session routed to it goes to a less busy worker instead
+LLM_WORKER_CAPACITY = int(os.getenv("PISCES_LLM_WORKER_CAPACITY", 1))
+# Seconds a request waits for the next result from its worker before the worker is taken to have hung
+LLM_REQUEST_TIMEOUT = float(os.getenv("PISCES_LLM_REQUEST_TIMEOUT", 300))
+POLL_SECONDS = 1
+
+
+def get_core_sets(workers: int) -> list[list[int]]:
+    """
+    Split the cores this process may run on into one contiguous set per worker.
+    :param workers: The number of workers.
+    :return: A list of core ids for each worker.
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    size = max(1, len(cores) // workers)
+    return [cores[(i * size) % len(cores):(i * size) % len(cores) + size] for i in range(workers)]
+
+
+def worker_main(worker_id: int, cores: list[int], n_threads: int, requests, results, cancelled) -> None:
+    """
+    Serve requests from the worker's queue until it receives None.
+    Requests are (request_id, messages, stream, max_tokens); results are sent back over the results pipe as
+    (request_id, "token", text), (request_id, "done", (text, stats)) or (request_id, "error", message).
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    llm = llm_service.load_llm(n_threads=n_threads, n_threads_batch=n_threads)
+    results.send((None, "ready", worker_id))
+
+    while (request := requests.get()) is not None:
+        request_id, messages, stream, max_tokens = request
+        try:
+            if stream:
+                stats = {}
+                tokens = []
+                for token in llm_service.stream_chat_completion(llm, messages, stats, max_tokens):
+                    # Stop generating for a stream the frontend has abandoned
+                    if cancelled.value == request_id:
+                        break
+                    tokens.append(token)
+                    results.send((request_id, "token", token))
+                results.send((request_id, "done", ("".join(tokens), stats)))
+            else:
+                results.send((request_id, "done", llm_service.chat_completion(llm, messages, max_tokens)))
+        except Exception as e:
+            results.send((request_id, "error", str(e)))
+
+
+class LLMPool(LLMBackend):
+    def __init__(self, workers: int, threads_per_worker: int = 0) -> None:
+        """
+        :param workers: The number of worker processes.
+        :param threads_per_worker: The number of threads each worker generates with, 0 to split the cores evenly.
+        """
+        self.workers = workers
+        self.core_sets = get_core_sets(workers)
+        self.threads_per_worker = threads_per_worker or len(self.core_sets[0])
+        self.processes = []
+        self.requests = []
+        self.cancelled = []
+        self.context = None
+        self.readers = set()  # The ends of the workers' result pipes, until each worker exits
+        self.stopping = False
+        self.pending = {}  # Request id to its worker and the queue its results are handed to
+        self.in_flight = [0] * workers
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.vocab = None
+        self.dispatcher = None
+        # The function the worker processes run, replaceable so the pool can be tested without a model
+        self.worker_target = worker_main
+
+    def spawn_worker(self, worker_id: int):
+        """
+        Start a worker process, with its own request queue and result pipe, in the worker's slot.
+        :return: The end of the result pipe the worker's results are read from.
+        """
+        requests = self.context.Queue()
+        cancelled = self.context.Value("q", -1)
+        reader, writer = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=self.worker_target,
+            args=(worker_id, self.core_sets[worker_id], self.threads_per_worker, requests, writer, cancelled),
+            name=f"llm-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # Only the worker holds the writing end, so the pipe reports the end of file once the worker exits
+        writer.close()
+        self.readers.add(reader)
+        if worker_id < len(self.processes):
+            self.processes[worker_id] = process
+            self.requests[worker_id] = requests
+            self.cancelled[worker_id] = cancelled
+        else:
+            self.processes.append(process)
+            self.requests.append(requests)
+            self.cancelled.append(cancelled)
+        return reader
+
+    def start(self) -> "LLMPool":
+        """
+        Start the workers and wait until each has loaded the model.
+        """
+        from llama_cpp import Llama
+
+        self.start_workers()
+        # Prompts are fitted to the context window here, so the frontend needs the tokenizer but not the weights
+        self.vocab = Llama(model_path=os.getenv("LLAMA_PATH"), vocab_only=True, verbose=False)
+        return self
+
+    def start_workers(self) -> None:
+        self.context = mp.get_context("spawn")
+        starting = [self.spawn_worker(worker_id) for worker_id in range(self.workers)]
+
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while starting:
+            ready = wait(starting, timeout=1)
+            if not ready and (time.monotonic() > deadline or not all(process.is_alive() for process in self.processes)):
+                self.terminate()
+                raise RuntimeError("An LLM worker failed to start")
+            for reader in ready:
+                try:
+                    _, kind, worker_id = reader.recv()
+                except EOFError:
+                    self.terminate()
+                    raise RuntimeError("An LLM worker failed to start") from None
+                starting.remove(reader)
+                print(f"+ LLM worker {worker_id} ready on cores {self.core_sets[worker_id]}")
+
+        self.dispatcher = threading.Thread(target=self.dispatch, name="llm-pool-dispatch", daemon=True)
+        self.dispatcher.start()
+
+    def stop(self) -> None:
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.stopping = True
+        self.dispatcher.join(timeout=5)
+
+    def terminate(self) -> None:
+        for process in self.processes:
+            process.terminate()
+
+    def dispatch(self) -> None:
+        """
+        Hand each result from the workers to the request waiting for it.
+        """
+        while not self.stopping:
+            with self.lock:
+                readers = list(self.readers)
+            # Polled, so the pipes of workers started since are picked up
+            for reader in wait(readers, timeout=POLL_SECONDS):
+                try:
+                    request_id, kind, value = reader.recv()
+                except (EOFError, OSError):
+                    # The worker has exited; a request waiting on it notices and replaces it
+                    with self.lock:
+                        self.readers.discard(reader)
+                    reader.close()
+                    continue
+                if kind == "ready":
+                    print(f"+ LLM worker {value} ready again")
+                    continue
+                with self.lock:
+                    pending = self.pending.get(request_id)
+                if pending is not None:
+                    pending[1].put((kind, value))
+
+    def restart_worker(self, worker_id: int, process, reason: str) -> None:
+        """
+        Replace a dead or hung worker and fail every request it held.
+        :param process: The process found to have failed, so a worker already replaced is not replaced again.
+        :param reason: Why the worker is replaced, for the failed requests.
+        """
+        with self.lock:
+            if self.processes[worker_id] is not process:
+                return
+            print(f"- LLM worker {worker_id} {reason}, restarting it")
+            if process.is_alive():
+                process.terminate()
+            self.spawn_worker(worker_id)
+            for pending_worker, waiting in self.pending.values():
+                if pending_worker == worker_id:
+                    waiting.put(("error", f"LLM worker {worker_id} {reason}"))
+
+    def wait(self, worker_id: int, waiting: queue.Queue) -> tuple[str, object]:
+        """
+        Wait for the next result of a request, checking meanwhile that its worker is still alive.
+        :return: The kind of result and its value; an error if the worker died or hung.
+        """
+        process = self.processes[worker_id]
+        deadline = time.monotonic() + LLM_REQUEST_TIMEOUT
+        while True:
+            try:
+                return waiting.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not process.is_alive():
+                    self.restart_worker(worker_id, process, "died")
+                elif time.monotonic() > deadline:
+                    self.restart_worker(worker_id, process, f"sent nothing for {LLM_REQUEST_TIMEOUT:.0f}s")
+
+    def get_worker(self, route_key: str = None) -> int:
+        least_busy = min(range(self.workers), key=lambda worker_id: self.in_flight[worker_id])
+        if route_key is not None:
+            # The session's own worker has its prompt prefix cached, but is not worth queueing behind
+            worker_id = zlib.crc32(route_key.encode()) % self.workers
+            if self.in_flight[worker_id] < LLM_WORKER_CAPACITY or self.in_flight[worker_id] <= self.in_flight[least_busy]:
+                return worker_id
+        return least_busy
+
+    def send(self, messages: list, route_key: str, stream: bool, max_tokens: int) -> tuple[int, int, queue.Queue]:
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            worker_id = self.get_worker(route_key)
+            self.in_flight[worker_id] += 1
+            waiting = queue.Queue()
+            self.pending[request_id] = (worker_id, waiting)
+            self.requests[worker_id].put((request_id, messages, stream, max_tokens))
+        return request_id, worker_id, waiting
+
+    def finish(self, request_id: int, worker_id: int) -> None:
+        with self.lock:
+            self.pending.pop(request_id, None)
+            self.in_flight[worker_id] -= 1
+
+    def chat(self, messages: list, route_key: str = None, max_tokens: int = None) -> tuple[str, dict]:
+        """
+        Generate a reply on a worker.
+        :param messages: The chat messages, starting with the system prompt.
+        :param route_key: A key, such as the session id, whose requests all go to the same worker.
+        :param max_tokens: The maximum reply length.
+        :return: The reply text and the token counts for the request.
+        """
+        request_id, worker_id, waiting = self.send(messages, route_key, False, max_tokens)
+        try:
+            kind, value = self.wait(worker_id, waiting)
+        finally:
+            self.finish(request_id, worker_id)
+        if kind == "error":
+            raise RuntimeError(value)
+        llm_service.add_stats(value[1])
+        return value
+
+    def stream(self, messages: list, route_key: str = None, stats: dict = None, max_tokens: int = None):
+        """
+        Generate a reply on a worker token by token.
+        Closing the generator early stops the generation on the worker.
+        :param messages: The chat messages, starting with the system prompt.
+        :param route_key: A key, such as the session id, whose requests all go to the same worker.
+        :param stats: An optional dictionary filled with the token counts once the stream is finished.
+        :param max_tokens: The maximum reply length.
+        :return: A generator of reply tokens.
+        """
+        request_id, worker_id, waiting = self.send(messages, route_key, True, max_tokens)
+        finished = False
+        try:
+            while True:
+                kind, value = self.wait(worker_id, waiting)
+                if kind == "token":
+                    yield value
+                elif kind == "error":
+                    finished = True
+                    raise RuntimeError(value)
+                else:
+                    finished = True
+                    llm_service.add_stats(value[1])
+                    if stats is not None:
+                        stats.update(value[1])
+                    return
+        finally:
+            if not finished:
+                self.cancelled[worker_id].value = request_id
+            self.finish(request_id, worker_id)
+
+    def count_tokens(self, text: str) -> int:
+        return llm_service.count_tokens(self.vocab, text)
@@ -0,0 +1,130 @@
+"""
+Bounded work queue for LLM generations.
+Jobs are served by a fixed number of model workers, each running in its own thread,
+so slow generations never block the event loop or any work that does not need the model.
+"""
+
+import asyncio, math, time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("The LLM work queue is full")
+        self.retry_after = retry_after
+
+
+class LLMQueue:
+    def __init__(self, workers: int, max_size: int) -> None:
+        """
+        :param workers: The number of generations that run at the same time.
+        :param max_size: The maximum number of jobs waiting for a worker.
+        """
+        self.workers = workers
+        self.max_size = max_size
+        self.queue = None
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-worker")
+        self.tasks = []
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dequeued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running event loop.
+        """
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_retry_after(self) -> int:
+        """
+        Estimate how many seconds until a queue slot frees up, from the average generation time.
+        """
+        average_service = self.total_service / self.completed if self.completed else 5.0
+        return max(1, math.ceil(average_service * (self.pending + 1) / self.workers))
+
+    def admit(self) -> None:
+        """
+        Reserve a place in the queue before doing the work that leads up to a generation,
+        so a request is turned away before it changes any conversation state.
+        Every admitted request must be followed by submit() or release().
+        :raises QueueFullError: If the queue is already at capacity.
+        """
+        if self.pending >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(self.get_retry_after())
+        self.pending += 1
+
+    def release(self) -> None:
+        """
+        Give back a reservation that will not be submitted.
+        """
+        self.pending -= 1
+
+    async def submit(self, fn, *args) -> object:
+        """
+        Queue a blocking call to run on a model worker and wait for its result.
+        The caller must have been admitted first.
+        :param fn: The function to run.
+        :return: The function's return value.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((fn, args, future, time.perf_counter()))
+        return await future
+
+    async def worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, future, queued_at = await self.queue.get()
+            self.pending -= 1
+            wait = time.perf_counter() - queued_at
+            self.dequeued += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            if future.cancelled():
+                self.queue.task_done()
+                continue
+
+            self.active += 1
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self.executor, fn, *args)
+                if not future.done():
+                    future.set_result(result)
+                self.completed += 1
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                self.failed += 1
+            finally:
+                self.total_service += time.perf_counter() - start
+                self.active -= 1
+                self.queue.task_done()
+
+    def get_stats(self) -> dict:
+        started = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "depth": self.pending,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "average_wait_seconds": round(self.total_wait / self.dequeued, 3) if self.dequeued else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "average_service_seconds": round(self.total_service / started, 3) if started else 0.0,
+        }
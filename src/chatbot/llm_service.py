@@ -0,0 +1,151 @@
+"""
+Access to the local llama.cpp model.
+The model keeps a prompt-prefix cache of llama.cpp states, so a turn only evaluates the tokens
+that follow the longest prefix already seen: the static system prompts shared by every session,
+and each session's own history from its previous turn.
+"""
+
+import os, threading
+
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", 2048))
+LLAMA_MAX_TOKENS = int(os.getenv("PISCES_MAX_REPLY_TOKENS", 256))
+LLAMA_CACHE = os.getenv("PISCES_LLAMA_CACHE", "ram")
+LLAMA_CACHE_MB = int(os.getenv("PISCES_LLAMA_CACHE_MB", 2048))
+LLAMA_CACHE_DIR = "./src/data/cache/llama"
+
+TOKEN_MEMO_SIZE = 4096
+
+token_memo = {}
+stats_lock = threading.Lock()
+totals = {"requests": 0, "prompt_tokens": 0, "reused_tokens": 0, "evaluated_tokens": 0, "completion_tokens": 0}
+
+
+def load_llm(**kwargs):
+    """
+    Load the GGUF model from LLAMA_PATH and attach the prompt cache selected by PISCES_LLAMA_CACHE (ram, disk or none).
+    The weights are memory-mapped, so processes loading the same file share them through the page cache.
+    :param kwargs: Extra arguments for Llama, such as n_threads.
+    :return: The loaded model.
+    """
+    from llama_cpp import Llama, LlamaRAMCache, LlamaDiskCache
+
+    llm = Llama(model_path=os.getenv("LLAMA_PATH"), n_ctx=LLAMA_N_CTX, use_mmap=True, verbose=False, **kwargs)
+    capacity = LLAMA_CACHE_MB * 1024 * 1024
+
+    if LLAMA_CACHE == "ram":
+        llm.set_cache(LlamaRAMCache(capacity_bytes=capacity))
+    elif LLAMA_CACHE == "disk":
+        llm.set_cache(LlamaDiskCache(cache_dir=LLAMA_CACHE_DIR, capacity_bytes=capacity))
+    return llm
+
+
+def count_tokens(llm, text: str) -> int:
+    """
+    Count the tokens in a piece of text with the model's tokenizer.
+    Counts are memoised, as most of a conversation is counted again every turn.
+    :param llm: The loaded model.
+    :param text: The text to count.
+    :return: The number of tokens.
+    """
+    count = token_memo.get(text)
+    if count is None:
+        count = len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+        if len(token_memo) >= TOKEN_MEMO_SIZE:
+            token_memo.clear()
+        token_memo[text] = count
+    return count
+
+
+def get_cached_prefixes(llm) -> list:
+    """
+    Get the token sequences the model can resume from: its current context and every cached state.
+    :param llm: The loaded model.
+    :return: A list of token sequences.
+    """
+    prefixes = [list(llm._input_ids)]
+    cache = getattr(llm, "cache", None)
+    if cache is None:
+        return prefixes
+
+    # LlamaRAMCache keeps an ordered dict of states, LlamaDiskCache a diskcache.Cache
+    keys = getattr(cache, "cache_state", None) or getattr(cache, "cache", None) or []
+    try:
+        prefixes.extend(list(key) for key in keys)
+    except TypeError:
+        pass
+    return prefixes
+
+
+def get_prefix_stats(llm, prefixes: list, prompt_tokens: int, completion_tokens: int) -> dict:
+    """
+    Work out how many prompt tokens were resumed from a cached prefix and how many had to be evaluated.
+    :param llm: The model after the generation.
+    :param prefixes: The token sequences available before the generation.
+    :param prompt_tokens: The number of tokens in the prompt.
+    :param completion_tokens: The number of generated tokens.
+    :return: A dictionary of token counts for the request.
+    """
+    prompt = list(llm._input_ids[:prompt_tokens])
+    # llama.cpp always re-evaluates the last prompt token to get fresh logits
+    reused = max((llm.longest_token_prefix(prefix, prompt[:-1]) for prefix in prefixes), default=0)
+
+    stats = {
+        "prompt_tokens": prompt_tokens,
+        "reused_tokens": reused,
+        "evaluated_tokens": prompt_tokens - reused,
+        "completion_tokens": completion_tokens,
+    }
+    add_stats(stats)
+    return stats
+
+
+def add_stats(stats: dict) -> None:
+    with stats_lock:
+        totals["requests"] += 1
+        for key, value in stats.items():
+            totals[key] += value
+
+
+def chat_completion(llm, messages: list, max_tokens: int = None) -> tuple[str, dict]:
+    """
+    Generate a reply to the conversation.
+    :param llm: The loaded model.
+    :param messages: The chat messages, starting with the system prompt.
+    :param max_tokens: The maximum reply length, PISCES_MAX_REPLY_TOKENS by default.
+    :return: The reply text and the token counts for the request.
+    """
+    prefixes = get_cached_prefixes(llm)
+    completion = llm.create_chat_completion(messages, max_tokens=max_tokens or LLAMA_MAX_TOKENS)
+    usage = completion["usage"]
+    stats = get_prefix_stats(llm, prefixes, usage["prompt_tokens"], usage["completion_tokens"])
+    return completion["choices"][0]["message"]["content"], stats
+
+
+def stream_chat_completion(llm, messages: list, stats: dict = None, max_tokens: int = None):
+    """
+    Generate a reply to the conversation token by token.
+    :param llm: The loaded model.
+    :param messages: The chat messages, starting with the system prompt.
+    :param stats: An optional dictionary filled with the token counts once the stream is finished.
+    :param max_tokens: The maximum reply length, PISCES_MAX_REPLY_TOKENS by default.
+    :return: A generator of reply tokens.
+    """
+    prefixes = get_cached_prefixes(llm)
+    completion_tokens = 0
+
+    for chunk in llm.create_chat_completion(messages, max_tokens=max_tokens or LLAMA_MAX_TOKENS, stream=True):
+        token = chunk["choices"][0]["delta"].get("content")
+        if token:
+            completion_tokens += 1
+            yield token
+
+    # Streamed chunks carry no usage, so the prompt length is taken from the model's context
+    prompt_tokens = max(llm.n_tokens - completion_tokens, 0)
+    result = get_prefix_stats(llm, prefixes, prompt_tokens, completion_tokens)
+    if stats is not None:
+        stats.update(result)
+
+
+def get_stats() -> dict:
+    with stats_lock:
+        return dict(totals)
@@ -6,12 +6,13 @@
     - No children
 """
 
-import sys, os, re, spacy
+import sys, os, re, time, shutil, hashlib, joblib, sklearn, spacy
 from spacy.matcher import Matcher
 from rapidfuzz import process
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
 
 # Merge the parent directory to the system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -34,12 +35,9 @@ def create_pipeline() -> Pipeline:
 def setup() -> None:
     add_stations_to_vocab()
     add_to_vocabulary(get_dates())
-    add_series_entity_ruler()
-    add_station_entity_ruler()
+    add_entity_rulers()
     add_matcher_patterns()
-    train_intent_classifier()
-    train_constraint_classifier()
-    train_faq_classifier()
+    load_classifiers()
 
 def add_stations_to_vocab() -> None:
     """
@@ -51,9 +49,10 @@ def add_stations_to_vocab() -> None:
     add_to_vocabulary(station_words)
     add_to_vocabulary(stations_list)
 
-def add_station_entity_ruler() -> None:
+def add_station_entity_ruler(stations: list[str] = None) -> None:
     """
     Add a custom entity ruler to the spaCy pipeline for station names.
+    :param stations: The station names to add, defaults to every station in the database.
     :return: None
     """
     ruler = nlp.add_pipe(
@@ -63,7 +62,7 @@ def add_station_entity_ruler() -> None:
         after="ner",
     )
 
-    stations = [station.upper() for station in get_all_station_names()]
+    stations = [station.upper() for station in (stations or get_all_station_names())]
     places = {processed.upper() for station in stations for processed in process_station_name(station, nlp)}
 
     # Remove any overlapping names
@@ -87,6 +86,88 @@ def add_series_entity_ruler() -> None:
     month_pattern = [{"label": "MONTH", "pattern": get_month_patterns()}]
     ruler.add_patterns(month_pattern)
 
+def get_ruler_cache_key(stations: list[str]) -> str:
+    """
+    Get the cache key for the compiled entity rulers.
+    The key changes whenever the station table, the extraction patterns or the spaCy version change.
+    :param stations: The station names used to build the rulers.
+    :return: A hex digest identifying the ruler contents.
+    """
+    digest = hashlib.sha256()
+    digest.update("\n".join(sorted(stations)).encode())
+    with open(EXTRACTION_PATH, mode="rb") as file:
+        digest.update(file.read())
+    digest.update(spacy.__version__.encode())
+    return digest.hexdigest()
+
+def remove_entity_rulers() -> None:
+    """
+    Remove any custom entity rulers from the spaCy pipeline.
+    :return: None
+    """
+    for name in RULER_NAMES:
+        if name in nlp.pipe_names:
+            nlp.remove_pipe(name)
+
+def load_entity_rulers(cache_dir: str) -> None:
+    """
+    Load the compiled entity rulers from disk, in the same pipeline positions they are built in.
+    :param cache_dir: The directory the rulers were saved to.
+    :return: None
+    """
+    nlp.add_pipe("entity_ruler", name="series_ruler", before="ner").from_disk(os.path.join(cache_dir, "series_ruler"))
+    nlp.add_pipe("entity_ruler", name="month_ruler", after="ner").from_disk(os.path.join(cache_dir, "month_ruler"))
+    nlp.add_pipe(
+        "entity_ruler",
+        config={"overwrite_ents": True},
+        name="station_ruler",
+        after="ner",
+    ).from_disk(os.path.join(cache_dir, "station_ruler"))
+
+def save_entity_rulers(cache_dir: str) -> None:
+    """
+    Save the entity rulers to disk, replacing any rulers compiled for older station data.
+    :param cache_dir: The directory to save the rulers to.
+    :return: None
+    """
+    parent_dir = os.path.dirname(cache_dir)
+    temp_dir = f"{cache_dir}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for name in RULER_NAMES:
+        nlp.get_pipe(name).to_disk(os.path.join(temp_dir, name))
+
+    # Clear the rulers of older versions, leaving the ones just written
+    for entry in os.listdir(parent_dir):
+        path = os.path.join(parent_dir, entry)
+        if path != temp_dir:
+            shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_dir, cache_dir)
+
+def add_entity_rulers() -> None:
+    """
+    Add the series, month and station entity rulers to the spaCy pipeline.
+    The rulers are loaded from disk when compiled for the current station table, otherwise they are built and saved.
+    :return: None
+    """
+    start = time.perf_counter()
+    stations = get_all_station_names()
+    cache_dir = os.path.join(RULER_CACHE_DIR, get_ruler_cache_key(stations))
+
+    if os.path.isdir(cache_dir):
+        try:
+            load_entity_rulers(cache_dir)
+            print(f"+ Loaded entity rulers from {cache_dir} in {time.perf_counter() - start:.2f}s")
+            return
+        except Exception as e:
+            print(f"- Could not load cached entity rulers: {e}")
+            remove_entity_rulers()
+
+    add_series_entity_ruler()
+    add_station_entity_ruler(stations)
+    save_entity_rulers(cache_dir)
+    print(f"+ Built and cached entity rulers in {time.perf_counter() - start:.2f}s")
+
 def add_matcher_patterns() -> None:
     """
     Add custom patterns to the spaCy matcher for train routes.
@@ -102,20 +183,96 @@ def add_matcher_patterns() -> None:
     preposition_matcher.add("PREPOSITIONS", get_extraction_patterns(), greedy="LONGEST")
     return_matcher.add("RETURN", get_return_patterns(), greedy="LONGEST")
 
-def train_intent_classifier() -> None:
-    global intent_classifier
-    training_sentences, intent_labels = get_intentions_training_data()
-    intent_classifier.fit(training_sentences, intent_labels)
+def train_intent_heads() -> None:
+    """
+    Fit one word count vectoriser over the training sets of every intent head, then for each head the TF-IDF
+    weights and classifier over the columns of its own training set's words only. Each head so scores exactly as
+    if it had its own vectoriser, while a message is tokenised and counted once for all of them.
+    :return: None
+    """
+    global intent_vectorizer, intent_heads
+    training_data = {"intent": get_intentions_training_data(), "faq": get_faq_training_data()}
+    intent_vectorizer = CountVectorizer()
+    intent_vectorizer.fit([sentence for sentences, _ in training_data.values() for sentence in sentences])
+
+    intent_heads = {}
+    for name, (sentences, labels) in training_data.items():
+        counts = intent_vectorizer.transform(sentences)
+        columns = counts.getnnz(axis=0).nonzero()[0]
+        counts = counts[:, columns]
+        tfidf = TfidfTransformer().fit(counts)
+        intent_heads[name] = {
+            "columns": columns,
+            "tfidf": tfidf,
+            "classifier": LogisticRegression().fit(tfidf.transform(counts), labels),
+        }
+
+def select_columns(matrix, columns):
+    return matrix[:, columns]
+
+def get_head_pipeline(head: dict) -> Pipeline:
+    """
+    Chain the intent vectoriser with a head, to classify raw text with it alone.
+    """
+    return Pipeline([
+        ("vectorizer", intent_vectorizer),
+        ("columns", FunctionTransformer(select_columns, kw_args={"columns": head["columns"]})),
+        ("tfidf", head["tfidf"]),
+        ("classifier", head["classifier"]),
+    ])
+
+def build_head_pipelines() -> None:
+    """
+    Expose each intent head as a pipeline from raw text.
+    :return: None
+    """
+    global intent_classifier, faq_classifier
+    intent_classifier = get_head_pipeline(intent_heads["intent"])
+    faq_classifier = get_head_pipeline(intent_heads["faq"])
 
 def train_constraint_classifier() -> None:
     global constraint_classifier
     training_sentences, constraint_labels = get_constraint_training_data()
     constraint_classifier.fit(training_sentences, constraint_labels)
 
-def train_faq_classifier() -> None:
-    global faq_classifier
-    training_sentences, faq_labels = get_faq_training_data()
-    faq_classifier.fit(training_sentences, faq_labels)
+def load_classifiers() -> None:
+    """
+    Load the fitted classifiers from disk, retraining them when the training data has changed.
+    The cache is keyed on a hash of the training files and the scikit-learn version.
+    :return: None
+    """
+    global intent_vectorizer, intent_heads, constraint_classifier
+
+    start = time.perf_counter()
+    cache_key = f"v{CLASSIFIER_CACHE_VERSION}-{get_training_data_hash()}-{sklearn.__version__}"
+
+    if os.path.exists(CLASSIFIER_CACHE_PATH):
+        try:
+            cached = joblib.load(CLASSIFIER_CACHE_PATH)
+        except Exception as e:
+            print(f"- Could not load cached classifiers: {e}")
+            cached = {}
+
+        if cached.get("key") == cache_key:
+            intent_vectorizer = cached["vectorizer"]
+            intent_heads = cached["heads"]
+            constraint_classifier = cached["constraint"]
+            build_head_pipelines()
+            print(f"+ Loaded classifiers from {CLASSIFIER_CACHE_PATH} in {time.perf_counter() - start:.2f}s")
+            return
+
+    train_intent_heads()
+    train_constraint_classifier()
+    build_head_pipelines()
+
+    os.makedirs(os.path.dirname(CLASSIFIER_CACHE_PATH), exist_ok=True)
+    joblib.dump({
+        "key": cache_key,
+        "vectorizer": intent_vectorizer,
+        "heads": intent_heads,
+        "constraint": constraint_classifier,
+    }, CLASSIFIER_CACHE_PATH)
+    print(f"+ Trained and cached classifiers in {time.perf_counter() - start:.2f}s")
 
 #endregion
 
@@ -128,9 +285,35 @@ def predict_classifier(text: str, classifier: Pipeline) -> tuple:
     :param classifier: The classifier to use for prediction.
     :return: A tuple containing the predicted label and its probability.
     """
-    prediction = classifier.predict([text.lower()])
-    probability = classifier.predict_proba([text])
-    return str(prediction[0]), probability
+    probability = classifier.predict_proba([text.lower()])
+    prediction = classifier.classes_[probability.argmax()]
+    return str(prediction), probability
+
+def predict_intents_batch(texts: list[str]) -> list[dict]:
+    """
+    Score every intent head for a batch of messages, tokenising and counting each message once for all heads.
+    :param texts: The input messages to classify.
+    :return: A list with one dictionary per message, mapping each head name to a (label, probabilities) tuple.
+    """
+    counts = intent_vectorizer.transform(texts)
+    results = [{} for _ in texts]
+
+    for name, head in intent_heads.items():
+        classifier = head["classifier"]
+        probabilities = classifier.predict_proba(head["tfidf"].transform(counts[:, head["columns"]]))
+        labels = classifier.classes_[probabilities.argmax(axis=1)]
+        for i, (label, probability) in enumerate(zip(labels, probabilities)):
+            results[i][name] = (str(label), probability)
+
+    return results
+
+def predict_intents(text: str) -> dict:
+    """
+    Score the intent and FAQ heads for a single message.
+    :param text: The input text to classify.
+    :return: A dictionary mapping each head name to a (label, probabilities) tuple.
+    """
+    return predict_intents_batch([text])[0]
 
 def get_time_constraints(text: str, split_index: tuple) -> str:
     """
@@ -315,13 +498,20 @@ def get_return_ticket(text: str) -> str:
 # Load spaCy's English model
 nlp = spacy.load("en_core_web_sm")
 
-intent_classifier = create_pipeline()
+intent_vectorizer = None
+intent_heads = {}
+intent_classifier = None
 constraint_classifier = create_pipeline()
-faq_classifier = create_pipeline()
+faq_classifier = None
 
 preposition_matcher = None
 return_matcher = None
 
+CLASSIFIER_CACHE_PATH = "./src/data/cache/classifiers.joblib"
+CLASSIFIER_CACHE_VERSION = 4
+RULER_CACHE_DIR = "./src/data/cache/rulers"
+RULER_NAMES = ["series_ruler", "month_ruler", "station_ruler"]
+
 TIME_ENTITIES = ["TIME", "DATE", "ORDINAL", "SERIES", "MONTH"]
 departure_terms = get_prepositions("departure")
 arrival_terms = get_prepositions("arrival")
@@ -334,8 +524,9 @@ if __name__ == "__main__":
 
     while True:
         user_input = input("You: ")
-        intent, confidence = predict_classifier(user_input, intent_classifier)
-        faq_intent, faq_confidence = predict_classifier(user_input, faq_classifier)
+        intents = predict_intents(user_input)
+        intent, confidence = intents["intent"]
+        faq_intent, faq_confidence = intents["faq"]
         split_index = get_return_ticket(user_input)
         departure, arrival, similar_stations = get_station_data(user_input)
         outbound, inbound = get_journey_times(user_input, split_index)
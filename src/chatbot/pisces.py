@@ -1,24 +1,45 @@
 from datetime import datetime
-from llama_cpp import Llama
+from importlib import import_module
 from dotenv import load_dotenv
-import prediction_model
-import os, nlp, journey_planner, knowledge_base, sys
-from contingency import search_contingency
+import os, sys, threading, time, startup, llm_service, llm_backends, context_window, responses, response_cache
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from utils.input_handler import *
 from utils.train_ticket_handler import *
+from utils import tracing
 from prompts import *
+from sessions import SessionStore
 
 load_dotenv()
-llm = Llama(model_path=os.getenv("LLAMA_PATH"), verbose=False)
 
 
-current_requirements = []
-request = ""
-info = {}
-current_stage = "waiting"
+def load_contingency():
+    module = import_module("contingency")
+    module.warm_up()
+    return module
+
+
+# Subsystems are loaded on first use, or in the background by startup.start_all().
+# Every call into them is timed as a stage of the turn.
+llm = startup.register("llm", llm_backends.load_backend)
+nlp = tracing.TracedModule(startup.register("nlp", lambda: import_module("nlp")))
+knowledge_base = tracing.TracedModule(startup.register("knowledge_base", lambda: import_module("knowledge_base")))
+journey_planner = tracing.TracedModule(startup.register("journey_planner", lambda: import_module("journey_planner")))
+prediction_model = tracing.TracedModule(startup.register("prediction_model", lambda: import_module("prediction_model")))
+contingency = tracing.TracedModule(startup.register("contingency", load_contingency))
+
+
+SESSION_TTL_SECONDS = int(os.getenv("PISCES_SESSION_TTL", 1800))
+MAX_SESSIONS = int(os.getenv("PISCES_MAX_SESSIONS", 1000))
+MAX_SESSION_BYTES = int(os.getenv("PISCES_MAX_SESSION_MB", 64)) * 1024 * 1024
+DEFAULT_SESSION_ID = "default"
+# How many answered requests are remembered for the summary of compacted turns
+MAX_COMPLETED_REQUESTS = 5
+
+def get_message_size(message):
+    return len(str(message["content"]))
+
 
 # --- Prompt Builders ---
 
@@ -28,18 +49,7 @@ def hello_prompt_builder():
         "role": "system",
         "content": "You are a railway assistant helping a user book a ticket. Just greet the user."
     }
-messages = [hello_prompt_builder()]
-
-
-
-# --- LLM ---
 
-def llm_generate():
-    print("GENERATED")
-    chat_question = llm.create_chat_completion(messages)
-    llm_response = chat_question["choices"][0]["message"]["content"]
-    messages.append({"role": "assistant", "content": llm_response})
-    return llm_response
 
 # --- NLP / Info Collection ---
 
@@ -63,116 +73,365 @@ question_requirements = {
 }
 
 
-def collect_info(user_input):
-    global current_requirements, info
-
-    if "station" in current_requirements:
-        station = nlp.extract_single_station(user_input)
-        if station:
-            info["station"] = station
-            current_requirements.remove("station")
-
-    if "departure_station" in current_requirements and "arrival_station" in current_requirements:
-        departure, arrival, similar_stations = nlp.get_station_data(user_input)
-        if departure:
-            info["departure_station"] = departure
-            current_requirements.remove("departure_station")
-        if arrival:
-            info["arrival_station"] = arrival
-            current_requirements.remove("arrival_station")
-
-    elif "departure_station" in current_requirements:
-        station = nlp.extract_single_station(user_input)
-        if station:
-            info["departure_station"] = station
-            current_requirements.remove("departure_station")
-
-    elif "arrival_station" in current_requirements:
-        station = nlp.extract_single_station(user_input)
-        if station:
-            info["arrival_station"] = station
-            current_requirements.remove("arrival_station")
-
-    if "departure_time" in current_requirements:
-        journey = nlp.extract_date_and_time(user_input)
-        if journey.get("DATE") != [] or journey.get("TIME") != []:
-            current_requirements.remove("departure_time")
-            info["departure_time"] = journey
-
-def complete_request():
-    global info, request, current_stage
-
-    if request[0] == "booking_tickets":
-        messages.append(add_ticket_followup())
-        departing_code = knowledge_base.get_station_code_from_name(info["departure_station"])
-        arriving_code  = knowledge_base.get_station_code_from_name(info["arrival_station"])
-        outbound, _    = parse_journey_times(info["departure_time"], None)
-        year, month, day, hour, minute = convert_datetime_to_tuple(str(outbound))
-        url = get_single_ticket_url(departing_code, arriving_code, "departing", f"{day}{month}{year}", hour, minute)
-        return url
-
-    elif request[0] in question_requirements and "station" in question_requirements[request[0]]:
-        columns = nlp.intent_to_function.get(request[0])
-        messages[0] = reply_prompt_builder(nlp.get_station_details_by_columns(info["station"], columns))
-
-    elif request[0] == "route_details":
-        route = journey_planner.get_optimal_path(info["departure_station"], info["arrival_station"])
-        messages[0] = route_prompt_builder(journey_planner.format_route(route))
-
-    elif request[0] == "train_delays":
-        outbound_date, _ = parse_journey_times(info["departure_time"], None)
-        _, _, _, hour, minute = convert_datetime_to_tuple(str(outbound_date))
-        delay = prediction_model.predict_delay_for_time(hour + ":" + minute)
-        messages[0] = reply_delay_builder(f"{delay:.2f}")
-    
-    elif request[0] == "contingency_info":
-        query = messages[-1]["content"]
-        station = info.get("station") or info.get("departure_station")
-        chunks, sources = search_contingency(query, station=station)
-
-        context = "\n\n".join(chunks)
-        source_list = ", ".join(set(sources))
-
-        messages[0] = contingency_prompt_builder(context, source_list)
-
-    current_stage = "waiting"
-    info = {}
-    request = ""
-
-# --- Main Entry Point ---
-
-def send_message(user_input):
-    global current_stage, current_requirements, info, request
-    response = []
-    user_input = user_input.strip()
-    if not user_input:
-        return "Please enter a message."
-
-    messages.append({"role": "user", "content": user_input})
-
-
-
-    if current_stage == "waiting":
-        intent = nlp.predict_classifier(user_input, nlp.intent_classifier)
-        if intent[0] == "station_faq":
-            intent = nlp.predict_classifier(user_input, nlp.faq_classifier)
-        current_stage = "data_collection"
-        current_requirements = list(question_requirements.get(intent[0], []))
-        request = intent
-        collect_info(user_input)
-
-    elif current_stage == "data_collection":
-        collect_info(user_input)
-
-    if current_requirements:
-        messages.append(add_focused_followup(current_requirements))
-    else:
-        response.append(complete_request())
-
-    print("________________________")
-    for msg in messages:
-        print(f"[{msg['role'].capitalize()}]: {msg['content']}\n")
-    print("________________________")
-
-    response.append(llm_generate())
-    return response
\ No newline at end of file
+class Session:
+    """
+    The conversation state of a single user: message history and slot-filling progress.
+    """
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.messages = []
+        self.message_bytes = 0
+        # Set by the session store, and called with the new size() whenever the history changes
+        self.on_resize = None
+        self.current_requirements = []
+        self.request = ""
+        self.info = {}
+        self.current_stage = "waiting"
+        self.completed = []
+        self.compacted = False
+        self.wants_llm = False
+        self.has_template = False
+        self.needs_llm = False
+        self.turn = None
+        self.cache_key = None
+        self.usage = {}
+        self.lock = threading.Lock()
+        self.add_message(hello_prompt_builder())
+
+    def size(self):
+        """
+        Approximate memory used by the session, in bytes of message and slot text.
+        """
+        return self.message_bytes + len(str(self.info))
+
+    # --- History ---
+    # The history only changes through these, so its size is kept without measuring it again
+
+    def resized(self):
+        if self.on_resize is not None:
+            self.on_resize(self.size())
+
+    def add_message(self, message):
+        self.messages.append(message)
+        self.message_bytes += get_message_size(message)
+        self.resized()
+
+    def pop_message(self):
+        self.message_bytes -= get_message_size(self.messages.pop())
+        self.resized()
+
+    def drop_messages(self, start, stop):
+        self.message_bytes -= sum(get_message_size(message) for message in self.messages[start:stop])
+        del self.messages[start:stop]
+        self.resized()
+
+    def set_system_prompt(self, message):
+        self.message_bytes += get_message_size(message) - get_message_size(self.messages[0])
+        self.messages[0] = message
+        self.resized()
+
+    # --- LLM ---
+
+    def get_prompt(self, backend):
+        """
+        Fit the history into the prompt budget. Turns that no longer fit are removed from the
+        history for good and replaced by a summary of the slots already filled.
+        :param backend: The LLM backend, used to count tokens.
+        :return: The messages to send to the model.
+        """
+        budget = context_window.get_budget(backend.n_ctx(), llm_service.LLAMA_MAX_TOKENS)
+        summary = context_window.summarise_slots(self.completed, self.info)
+        prompt, dropped = context_window.fit_history(
+            self.messages, backend.count_tokens, budget, summary, self.compacted
+        )
+        if dropped:
+            self.drop_messages(1, 1 + dropped)
+            self.compacted = True
+        return prompt
+
+    def llm_generate(self):
+        backend = startup.require("llm")
+        start = time.perf_counter()
+        with tracing.span("llm_generate"):
+            llm_response, self.usage = backend.chat(self.get_prompt(backend), self.session_id)
+        tracing.record_generation(self.usage, time.perf_counter() - start)
+        self.add_message({"role": "assistant", "content": llm_response})
+        if self.cache_key:
+            response_cache.cache.put(self.cache_key, [llm_response])
+        return llm_response
+
+    def llm_stream(self):
+        """
+        Generate a reply token by token.
+        Whatever was generated is kept in the history even if the stream is closed early.
+        """
+        tokens = []
+        self.usage = {}
+        backend = startup.require("llm")
+        start = time.perf_counter()
+        stream = backend.stream(self.get_prompt(backend), self.session_id, self.usage)
+        try:
+            for token in stream:
+                tokens.append(token)
+                yield token
+            # Only a reply that was generated to the end is worth reusing
+            if self.cache_key:
+                response_cache.cache.put(self.cache_key, ["".join(tokens)])
+        finally:
+            stream.close()
+            self.add_message({"role": "assistant", "content": "".join(tokens)})
+            tracing.observe_stage("llm_generate", time.perf_counter() - start)
+            tracing.record_generation(self.usage, time.perf_counter() - start)
+
+    # --- NLP / Info Collection ---
+
+    @tracing.traced("collect_info")
+    def collect_info(self, user_input):
+        current_requirements, info = self.current_requirements, self.info
+
+        if "station" in current_requirements:
+            station = nlp.extract_single_station(user_input)
+            if station:
+                info["station"] = station
+                current_requirements.remove("station")
+
+        if "departure_station" in current_requirements and "arrival_station" in current_requirements:
+            departure, arrival, similar_stations = nlp.get_station_data(user_input)
+            if departure:
+                info["departure_station"] = departure
+                current_requirements.remove("departure_station")
+            if arrival:
+                info["arrival_station"] = arrival
+                current_requirements.remove("arrival_station")
+
+        elif "departure_station" in current_requirements:
+            station = nlp.extract_single_station(user_input)
+            if station:
+                info["departure_station"] = station
+                current_requirements.remove("departure_station")
+
+        elif "arrival_station" in current_requirements:
+            station = nlp.extract_single_station(user_input)
+            if station:
+                info["arrival_station"] = station
+                current_requirements.remove("arrival_station")
+
+        if "departure_time" in current_requirements:
+            journey = nlp.extract_date_and_time(user_input)
+            if journey.get("DATE") != [] or journey.get("TIME") != []:
+                current_requirements.remove("departure_time")
+                info["departure_time"] = journey
+        self.resized()
+
+    def complete_request(self):
+        """
+        Look up the answer to the request and build the prompt for it.
+        :return: The booking link or None, the templated answer or None, and an instruction for the LLM or None.
+        """
+        request, info, messages = self.request, self.info, self.messages
+        url = None
+        answer = None
+        instruction = None
+
+        if request[0] == "booking_tickets":
+            instruction = add_ticket_followup()
+            departing_code = knowledge_base.get_station_code_from_name(info["departure_station"])
+            arriving_code  = knowledge_base.get_station_code_from_name(info["arrival_station"])
+            outbound, _    = parse_journey_times(info["departure_time"], None)
+            year, month, day, hour, minute = convert_datetime_to_tuple(str(outbound))
+            url = get_single_ticket_url(departing_code, arriving_code, "departing", f"{day}{month}{year}", hour, minute)
+            answer = responses.render_booking(info["departure_station"], info["arrival_station"], outbound)
+
+        elif request[0] in question_requirements and "station" in question_requirements[request[0]]:
+            columns = nlp.intent_to_function.get(request[0])
+            details = nlp.get_station_details_by_columns(info["station"], columns)
+            self.set_system_prompt(reply_prompt_builder(details))
+            answer = responses.render_station_details(info["station"], details)
+
+        elif request[0] == "route_details":
+            path = journey_planner.get_optimal_path(info["departure_station"], info["arrival_station"])
+            route = journey_planner.format_route(path)
+            self.set_system_prompt(route_prompt_builder(route))
+            answer = responses.render_route(route)
+
+        elif request[0] == "train_delays":
+            outbound_date, _ = parse_journey_times(info["departure_time"], None)
+            _, _, _, hour, minute = convert_datetime_to_tuple(str(outbound_date))
+            delay = prediction_model.predict_delay_for_time(hour + ":" + minute)
+            self.set_system_prompt(reply_delay_builder(f"{delay:.2f}"))
+            answer = responses.render_delay(delay)
+
+        elif request[0] == "contingency_info":
+            query = messages[-1]["content"]
+            station = info.get("station") or info.get("departure_station")
+            chunks, sources = contingency.search_contingency(query, station=station)
+
+            context = "\n\n".join(chunks)
+            source_list = ", ".join(set(sources))
+
+            self.set_system_prompt(contingency_prompt_builder(context, source_list))
+            answer = responses.render_contingency(chunks, source_list)
+
+        self.reset_request()
+        return url, answer, instruction
+
+    def reset_request(self):
+        self.completed = (self.completed + [(self.request[0], self.info)])[-MAX_COMPLETED_REQUESTS:]
+        self.current_stage = "waiting"
+        self.info = {}
+        self.request = ""
+        self.resized()
+
+    # --- Main Entry Point ---
+
+    def classify_turn(self, user_input):
+        """
+        Classify the message, fill slots and look up the answer, leaving who writes the reply to answer_turn.
+        Sets wants_llm when the reply is one the LLM should write, and has_template when it has a templated answer.
+        :param user_input: The stripped message from the user.
+        :return: The replies that are known before generation, such as a booking link or a cached reply.
+        """
+        replies = []
+        self.cache_key = None
+        self.turn = None
+        self.wants_llm = False
+        self.has_template = False
+        self.add_message({"role": "user", "content": user_input})
+
+        if self.current_stage == "waiting":
+            intents = nlp.predict_intents(user_input)
+            intent = intents["intent"]
+            if intent[0] == "station_faq":
+                intent = intents["faq"]
+            self.current_stage = "data_collection"
+            self.current_requirements = list(question_requirements.get(intent[0], []))
+            self.request = intent
+            self.collect_info(user_input)
+
+        elif self.current_stage == "data_collection":
+            self.collect_info(user_input)
+
+        if self.current_requirements:
+            intent = "followup"
+            answer = responses.render_followup(self.current_requirements)
+            instruction = add_focused_followup(self.current_requirements)
+        else:
+            intent = self.request[0]
+            self.cache_key = response_cache.get_key(intent, self.info, user_input)
+            cached = response_cache.cache.get(self.cache_key) if self.cache_key else None
+            if cached:
+                self.reset_request()
+                self.cache_key = None
+                for reply in cached:
+                    self.add_message({"role": "assistant", "content": reply})
+                return replies + cached
+
+            url, answer, instruction = self.complete_request()
+            if url:
+                replies.append(url)
+
+        self.turn = (intent, answer, instruction)
+        self.wants_llm = responses.get_policy(intent) == "llm"
+        self.has_template = answer is not None
+        return replies
+
+    def cancel_turn(self):
+        """
+        Forget a message classified by classify_turn that will not be answered, such as when the LLM queue is full,
+        so the user can send it again.
+        """
+        self.turn = None
+        self.cache_key = None
+        if self.messages[-1]["role"] == "user":
+            self.pop_message()
+
+    def answer_turn(self, templates_only=False):
+        """
+        Answer the message classified by classify_turn from its template, or build the prompt for the LLM.
+        Sets needs_llm when the reply still has to be generated.
+        :param templates_only: Whether to answer from templates only, such as when the LLM is under load.
+        :return: The templated reply, if there is one.
+        """
+        self.needs_llm = False
+        if self.turn is None:
+            return []
+        intent, answer, instruction = self.turn
+        self.turn = None
+
+        self.needs_llm = responses.uses_llm(intent, templates_only)
+        if self.needs_llm:
+            if instruction:
+                self.add_message(instruction)
+            return []
+
+        if answer is None:
+            answer = responses.render_fallback()
+        self.add_message({"role": "assistant", "content": answer})
+        # A template standing in for the LLM under load is not the answer to keep
+        if self.cache_key and responses.get_policy(intent) == "template":
+            response_cache.cache.put(self.cache_key, [answer])
+        self.cache_key = None
+        return [answer]
+
+    def prepare_turn(self, user_input, templates_only=False):
+        """
+        Classify the message, fill slots and either answer from a template or build the prompt for the LLM.
+        :param user_input: The stripped message from the user.
+        :param templates_only: Whether to answer from templates only, such as when the LLM is under load.
+        :return: The replies that are known before generation, such as a booking link.
+        """
+        return self.classify_turn(user_input) + self.answer_turn(templates_only)
+
+    def send_message(self, user_input):
+        user_input = user_input.strip()
+        if not user_input:
+            return "Please enter a message."
+
+        response = self.prepare_turn(user_input)
+        if self.needs_llm:
+            response.append(self.llm_generate())
+        return response
+
+    def stream_message(self, user_input):
+        """
+        Handle a message, yielding the reply as it is produced.
+        :param user_input: The message from the user.
+        :return: A generator of ("reply", text) for complete replies and ("token", text) for generated tokens.
+        """
+        user_input = user_input.strip()
+        if not user_input:
+            yield "reply", "Please enter a message."
+            return
+
+        for reply in self.prepare_turn(user_input):
+            yield "reply", reply
+        if self.needs_llm:
+            for token in self.llm_stream():
+                yield "token", token
+
+
+sessions = SessionStore(Session, SESSION_TTL_SECONDS, MAX_SESSIONS, MAX_SESSION_BYTES)
+
+
+def send_message(user_input, session_id=DEFAULT_SESSION_ID):
+    """
+    Handle a message in the given user's conversation.
+    :param user_input: The message from the user.
+    :param session_id: The id of the user's session.
+    :return: The list of replies.
+    """
+    session = sessions.get(session_id)
+    with session.lock:
+        return session.send_message(user_input)
+
+
+def stream_message(user_input, session_id=DEFAULT_SESSION_ID):
+    """
+    Handle a message in the given user's conversation, streaming the reply.
+    :param user_input: The message from the user.
+    :param session_id: The id of the user's session.
+    :return: A generator of (kind, text) tuples, see Session.stream_message.
+    """
+    session = sessions.get(session_id)
+    with session.lock:
+        yield from session.stream_message(user_input)
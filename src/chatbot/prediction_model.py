@@ -1,55 +1,56 @@
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
-from sklearn.neighbors import  KNeighborsRegressor
-from sklearn.metrics import mean_squared_error, r2_score
-import pandas as pd
+"""
+Predict how late a Norwich to London train will arrive from its planned departure time.
+The model is trained by train_delay_model.py, which writes the delay it predicts for every minute of the day
+to DELAY_MODEL_PATH. That table is loaded on the first prediction, so importing this module costs nothing.
+"""
 
-df = pd.read_csv("src/data/2024_service_details_Norwich_to_London.csv")
+import os, json, threading
+
+DELAY_MODEL_PATH = os.getenv("PISCES_DELAY_MODEL_PATH", "./src/data/models/delay_model.json")
+# Bumped whenever the layout of the model file changes, so an old file is rejected rather than misread
+DELAY_MODEL_FORMAT = 1
+MINUTES_PER_DAY = 1440
+
+model = None
+model_lock = threading.Lock()
 
 
 def time_to_minutes(t):
     """
-    Parses time from HH:MM format to hours and minutes (separated)
+    Parses time from HH:MM format to minutes since midnight
     """
     h, m = map(int, t.split(':'))
     return h * 60 + m
 
-# Drops any rows with missing planned_departure_time or actual_arrival_time fields
-df.dropna(subset=['planned_departure_time', 'actual_arrival_time'], inplace=True)
-
-df['planned_departure_time'] = df['planned_departure_time'].apply(time_to_minutes)
-df['actual_arrival_time'] = df['actual_arrival_time'].apply(time_to_minutes)
-
-df['actual_arrival_time'] = df.apply(
-    lambda row: row['actual_arrival_time'] + 1440 if row['actual_arrival_time'] < row['planned_departure_time'] else row['actual_arrival_time'],
-    axis=1
-)
-
-df['arrival_delay'] = df['actual_arrival_time'] - df['planned_departure_time']
-
-df = df[df['arrival_delay'] < 120]
-df = df[df['arrival_delay'] > -60]
-
-X = df[['planned_departure_time']]
-y = df['arrival_delay']
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-knn_regressor = KNeighborsRegressor(n_neighbors=3)
-knn_regressor.fit(X_train, y_train)
-
-y_pred = knn_regressor.predict(X_test)
-
-mse = mean_squared_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
+def load_model(path: str = DELAY_MODEL_PATH) -> dict:
+    """
+    Load a model written by train_delay_model.py.
+    :param path: The model file.
+    :return: The model, with its version, training details and the predicted delay for each minute of the day.
+    """
+    try:
+        with open(path, mode="r") as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No delay model at {path}; train one with python src/chatbot/train_delay_model.py") from None
+    if saved.get("format") != DELAY_MODEL_FORMAT or len(saved.get("delays", [])) != MINUTES_PER_DAY:
+        raise ValueError(f"The delay model at {path} is format {saved.get('format')}, expected {DELAY_MODEL_FORMAT}; "
+                         f"train it again with python src/chatbot/train_delay_model.py")
+    return saved
+
+
+def get_model() -> dict:
+    global model
+    if model is None:
+        with model_lock:
+            if model is None:
+                model = load_model()
+    return model
 
 
 def predict_delay_for_time(departure_time_str):
     """
     Predicts delay for given departure time (in format HH:MM)
     """
-    h, m = map(int, departure_time_str.split(':'))
-    departure_minutes = h * 60 + m
-
-    predicted_delay = knn_regressor.predict([[departure_minutes]])
-    return predicted_delay[0]
+    return get_model()["delays"][time_to_minutes(departure_time_str) % MINUTES_PER_DAY]
@@ -0,0 +1,140 @@
+"""
+Cache of finished replies to repeated questions.
+Replies are keyed by intent, the resolved slots and, where the wording matters, the normalised question.
+Entries expire after a TTL, the least recently used are evicted past the entry or memory limits,
+and entries are dropped once the data source they were built from has been rebuilt.
+"""
+
+import os, re, sys, threading, time
+from collections import OrderedDict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.data_versions import get_version
+
+RESPONSE_CACHE_TTL = int(os.getenv("PISCES_RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_SIZE = int(os.getenv("PISCES_RESPONSE_CACHE_SIZE", 4096))
+RESPONSE_CACHE_BYTES = int(os.getenv("PISCES_RESPONSE_CACHE_MB", 16)) * 1024 * 1024
+
+# The data source each cacheable intent's answer is built from
+intent_sources = {
+    "address_details":   "station_codes",
+    "train_operator":    "station_codes",
+    "ticket_off_hours":  "station_codes",
+    "ticket_machine":    "station_codes",
+    "seated_area":       "station_codes",
+    "waiting_area":      "station_codes",
+    "toilets":           "station_codes",
+    "baby_changing":     "station_codes",
+    "wifi":              "station_codes",
+    "ramp_access":       "station_codes",
+    "ticket_gates":      "station_codes",
+    "contingency_info":  "contingency",
+}
+# Intents whose answer depends on the wording of the question, not just the slots
+QUESTION_INTENTS = {"contingency_info"}
+
+
+def normalise_question(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", text.lower()).split())
+
+
+def get_key(intent: str, slots: dict, question: str) -> tuple | None:
+    """
+    Build the cache key for a request.
+    :param intent: The intent being answered.
+    :param slots: The slots resolved for the request.
+    :param question: The user's message.
+    :return: The key, or None if answers to the intent are not cached.
+    """
+    if intent not in intent_sources:
+        return None
+    resolved = tuple(sorted((key, str(value).lower()) for key, value in slots.items()))
+    return intent, resolved, normalise_question(question) if intent in QUESTION_INTENTS else ""
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int) -> None:
+        """
+        :param ttl_seconds: How long a reply is kept.
+        :param max_entries: The maximum number of replies kept at once.
+        :param max_bytes: The approximate memory budget for all replies, in bytes of reply text.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> list[str] | None:
+        """
+        :param key: A key from get_key().
+        :return: The cached replies, or None if there are none or they are stale.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            replies, expires_at, version, _ = entry
+            if time.monotonic() >= expires_at:
+                self.expirations += 1
+                self.remove(key)
+            elif version != get_version(intent_sources[key[0]]):
+                self.invalidations += 1
+                self.remove(key)
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return list(replies)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, replies: list[str]) -> None:
+        size = sum(len(reply) for reply in replies) + len(str(key))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            version = get_version(intent_sources[key[0]])
+            self.entries[key] = (list(replies), time.monotonic() + self.ttl_seconds, version, size)
+            self.bytes += size
+
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key: tuple) -> None:
+        self.bytes -= self.entries.pop(key)[3]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_BYTES)
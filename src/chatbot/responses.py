@@ -0,0 +1,113 @@
+"""
+Templated replies for answers that are fully determined before the LLM runs.
+A per-intent policy decides whether the LLM rephrases the answer or the template is sent as it is.
+Under load every intent falls back to its template, so replies never wait on the model.
+"""
+
+import re, threading
+
+# "template" answers are always rendered directly, "llm" answers are written by the model unless degraded
+response_policy = {
+    "followup":          "template",
+    "address_details":   "template",
+    "train_operator":    "template",
+    "platform_details":  "template",
+    "ticket_off_hours":  "template",
+    "ticket_machine":    "template",
+    "seated_area":       "template",
+    "waiting_area":      "template",
+    "toilets":           "template",
+    "baby_changing":     "template",
+    "wifi":              "template",
+    "ramp_access":       "template",
+    "ticket_gates":      "template",
+    "booking_tickets":   "template",
+    "train_delays":      "template",
+    "route_details":     "llm",
+    "contingency_info":  "llm",
+}
+DEFAULT_POLICY = "llm"
+
+SLOT_NAMES = {
+    "station": "the station",
+    "departure_station": "the station you are leaving from",
+    "arrival_station": "the station you are travelling to",
+    "departure_time": "when you want to travel",
+}
+
+stats_lock = threading.Lock()
+counts = {"template": 0, "llm": 0, "degraded": 0}
+
+
+def get_policy(intent: str) -> str:
+    return response_policy.get(intent, DEFAULT_POLICY)
+
+
+def uses_llm(intent: str, templates_only: bool = False) -> bool:
+    """
+    Decide whether the reply for an intent is written by the LLM, and count the decision.
+    :param intent: The intent being answered, or "followup" when asking for missing slots.
+    :param templates_only: Whether the service is degraded to templated replies.
+    :return: True if the LLM should write the reply.
+    """
+    wants_llm = get_policy(intent) == "llm"
+    with stats_lock:
+        if wants_llm and templates_only:
+            counts["degraded"] += 1
+        counts["llm" if wants_llm and not templates_only else "template"] += 1
+    return wants_llm and not templates_only
+
+
+def join_words(words: list[str]) -> str:
+    if len(words) < 2:
+        return "".join(words)
+    return ", ".join(words[:-1]) + " and " + words[-1]
+
+
+def render_followup(keys: list[str]) -> str:
+    return f"Could you tell me {join_words([SLOT_NAMES.get(key, key.replace('_', ' ')) for key in keys])}?"
+
+
+def render_station_details(station: str, details: str) -> str:
+    """
+    :param station: The station name.
+    :param details: The "Label: value" lines from get_station_details_by_columns.
+    """
+    if details in ("Invalid station name.", "Station not found."):
+        return f"Sorry, I couldn't find any details for {station.title()}."
+    details = re.sub(r": True$", ": Yes", details, flags=re.MULTILINE)
+    details = re.sub(r": False$", ": No", details, flags=re.MULTILINE)
+    return f"Here is what I found for {station.title()}:\n{details}"
+
+
+def render_booking(departure: str, arrival: str, outbound) -> str:
+    return (
+        f"You can buy a single ticket from {departure.title()} to {arrival.title()}, "
+        f"departing {outbound:%A %d %B at %H:%M}, using the link above."
+    )
+
+
+def render_delay(delay: float) -> str:
+    return f"I predict the train will be about {round(delay)} minutes delayed."
+
+
+def render_route(route: str) -> str:
+    return f"Here is your route:\n{route}"
+
+
+def render_contingency(chunks: list[str], sources: str) -> str:
+    if not chunks:
+        return "I don't have that information in the contingency plan."
+    return f"From the contingency plan ({sources}):\n{chunks[0]}"
+
+
+def render_fallback() -> str:
+    return (
+        "Sorry, I can't answer that right now. I can help with station facilities, "
+        "ticket bookings, train delays and routes."
+    )
+
+
+def get_stats() -> dict:
+    with stats_lock:
+        return dict(counts)
@@ -1,32 +1,296 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
-import pisces
-
-class ChatHandler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        if self.path == '/chat':
-            length = int(self.headers['Content-Length'])
-            body = json.loads(self.rfile.read(length))
-            result = pisces.send_message(body.get('message', ''))
-            replies = result if isinstance(result, list) else [result]
-            self._respond({'replies': replies})
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-    def _respond(self, data):
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
-
-    def log_message(self, *args): pass
-
-if __name__ == '__main__':
-    print('Pisces server running on http://localhost:8000')
-    HTTPServer(('localhost', 8000), ChatHandler).serve_forever()
\ No newline at end of file
+import asyncio, json, os, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import pisces, startup, llm_backends, llm_pool, llm_service, responses, response_cache
+from utils import tracing
+from llm_queue import LLMQueue, QueueFullError
+
+HOST = "localhost"
+PORT = 8000
+MAX_SESSION_ID_LENGTH = 128
+
+# NLP and database work runs in its own pool so it never waits behind a generation
+NLP_THREADS = int(os.getenv("PISCES_NLP_THREADS", 4))
+LLM_WORKERS = int(os.getenv("PISCES_LLM_WORKERS", max(1, llm_pool.LLM_PROCESSES)))
+LLM_QUEUE_SIZE = int(os.getenv("PISCES_LLM_QUEUE_SIZE", 8))
+# Past this many queued generations, replies come from templates only
+DEGRADE_QUEUE_DEPTH = int(os.getenv("PISCES_DEGRADE_QUEUE_DEPTH", max(1, LLM_QUEUE_SIZE // 2)))
+# Report each turn's stage timings in a Server-Timing header (or the final event of a stream)
+TIMING_HEADER = os.getenv("PISCES_TIMING_HEADER", "0") == "1"
+
+nlp_executor = ThreadPoolExecutor(max_workers=NLP_THREADS, thread_name_prefix="nlp")
+llm_queue = LLMQueue(LLM_WORKERS, LLM_QUEUE_SIZE)
+
+
+def get_session_id(body: dict) -> str:
+    return str(body.get("session_id") or uuid.uuid4().hex)[:MAX_SESSION_ID_LENGTH]
+
+
+def error_response(status: int, message: str, retry_after: int = None) -> web.Response:
+    headers = {"Retry-After": str(retry_after)} if retry_after else None
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+async def run_nlp(fn, *args) -> object:
+    return await asyncio.get_running_loop().run_in_executor(nlp_executor, tracing.bind(fn), *args)
+
+
+def add_timings(response: web.Response, trace: list) -> web.Response:
+    if TIMING_HEADER and trace:
+        response.headers["Server-Timing"] = tracing.format_server_timing(trace)
+    return response
+
+
+def admit_llm(has_template: bool) -> bool:
+    """
+    Reserve a place in the LLM queue. A turn with a templated answer is answered from it instead
+    once the queue is DEGRADE_QUEUE_DEPTH deep or full; one without can only wait for the LLM.
+    :param has_template: Whether the turn has a templated answer to fall back on.
+    :return: Whether a place was reserved.
+    :raises QueueFullError: If the queue is full and the turn has no templated answer.
+    """
+    if has_template and llm_queue.pending >= DEGRADE_QUEUE_DEPTH:
+        return False
+    try:
+        llm_queue.admit()
+        return True
+    except QueueFullError:
+        if has_template:
+            return False
+        raise
+
+
+async def begin_turn(request: web.Request) -> tuple:
+    """
+    Read a chat request and mark its session busy.
+    :return: The session id, the message, the session and an error response if the request was turned away.
+    """
+    body = await request.json()
+    session_id = get_session_id(body)
+    message = str(body.get("message", "")).strip()
+    session = pisces.sessions.get(session_id)
+
+    if getattr(session, "busy", False):
+        return session_id, message, session, error_response(429, "A message for this session is still being processed.", 1)
+
+    session.busy = True
+    return session_id, message, session, None
+
+
+async def prepare_turn(session, message: str) -> tuple[list[str], bool]:
+    """
+    Classify the message, then reserve a place in the LLM queue only if the LLM is to write the reply,
+    so turns answered from templates or the cache never hold one.
+    :return: The replies known before generation and whether a place was reserved.
+    :raises QueueFullError: If the LLM queue is full and the reply has no template, leaving the message unanswered.
+    """
+    replies = await run_nlp(session.classify_turn, message)
+    try:
+        admitted = session.wants_llm and admit_llm(session.has_template)
+    except QueueFullError:
+        session.cancel_turn()
+        raise
+    try:
+        return replies + session.answer_turn(not admitted), admitted
+    except Exception:
+        if admitted:
+            llm_queue.release()
+        raise
+
+
+async def chat(request: web.Request) -> web.Response:
+    trace = tracing.start_trace()
+    session_id, message, session, rejection = await begin_turn(request)
+    if rejection:
+        return rejection
+
+    admitted = False
+    submitted = False
+    try:
+        if not message:
+            return web.json_response({"replies": ["Please enter a message."], "session_id": session_id})
+
+        replies, admitted = await prepare_turn(session, message)
+        session.usage = {}
+        if session.needs_llm:
+            submitted = True
+            replies.append(await llm_queue.submit(tracing.bind(session.llm_generate)))
+        return add_timings(web.json_response({"replies": replies, "session_id": session_id, "usage": session.usage}), trace)
+    except QueueFullError as e:
+        return error_response(503, "The assistant is busy, please try again shortly.", e.retry_after)
+    finally:
+        if admitted and not submitted:
+            llm_queue.release()
+        session.busy = False
+
+
+async def write_event(response: web.StreamResponse, data: dict) -> None:
+    await response.write(json.dumps(data).encode() + b"\n")
+
+
+def done_event(session, trace: list) -> dict:
+    event = {"type": "done", "usage": session.usage}
+    if TIMING_HEADER:
+        event["server_timing"] = tracing.format_server_timing(trace)
+    return event
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    """
+    Send the reply as JSON lines, one per event: session, reply, token, then done with the token usage (or error).
+    """
+    trace = tracing.start_trace()
+    session_id, message, session, rejection = await begin_turn(request)
+    if rejection:
+        return rejection
+
+    admitted = False
+    submitted = False
+    job = None
+    cancelled = threading.Event()
+    try:
+        # Classified before the stream starts, so a full queue can still be answered with 503
+        replies = []
+        if message:
+            session.usage = {}
+            replies, admitted = await prepare_turn(session, message)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await write_event(response, {"type": "session", "session_id": session_id})
+
+        if not message:
+            await write_event(response, {"type": "reply", "text": "Please enter a message."})
+            await write_event(response, {"type": "done"})
+            return response
+
+        for reply in replies:
+            await write_event(response, {"type": "reply", "text": reply})
+        if not session.needs_llm:
+            await write_event(response, done_event(session, trace))
+            return response
+
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+
+        def generate():
+            stream = session.llm_stream()
+            try:
+                for token in stream:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(tokens.put_nowait, token)
+            finally:
+                stream.close()
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        submitted = True
+        job = asyncio.ensure_future(llm_queue.submit(tracing.bind(generate)))
+
+        while (token := await tokens.get()) is not None:
+            await write_event(response, {"type": "token", "text": token})
+
+        try:
+            await job
+            await write_event(response, done_event(session, trace))
+        except Exception as e:
+            await write_event(response, {"type": "error", "error": str(e)})
+        return response
+
+    except QueueFullError as e:
+        return error_response(503, "The assistant is busy, please try again shortly.", e.retry_after)
+    except (ConnectionResetError, asyncio.CancelledError):
+        # The client went away, so stop generating for it
+        cancelled.set()
+        raise
+    finally:
+        if admitted and not submitted:
+            llm_queue.release()
+        if job is not None and not job.done():
+            # Keep the session busy until the abandoned generation has stopped
+            job.add_done_callback(lambda finished: end_turn(session, finished))
+        else:
+            session.busy = False
+
+
+def end_turn(session, job: asyncio.Future) -> None:
+    session.busy = False
+    if not job.cancelled():
+        job.exception()
+
+
+async def ready(request: web.Request) -> web.Response:
+    is_ready = startup.is_ready()
+    return web.json_response({"ready": is_ready}, status=200 if is_ready else 503)
+
+
+async def status(request: web.Request) -> web.Response:
+    return web.json_response({
+        "ready": startup.is_ready(),
+        "subsystems": startup.get_status(),
+        "sessions": pisces.sessions.get_stats(),
+        "llm_queue": llm_queue.get_stats(),
+        "llm_tokens": llm_service.get_stats(),
+        "responses": responses.get_stats(),
+        "response_cache": response_cache.cache.get_stats(),
+    })
+
+
+async def metrics(request: web.Request) -> web.Response:
+    queue_stats = llm_queue.get_stats()
+    cache_stats = response_cache.cache.get_stats()
+    gauges = {
+        "pisces_llm_queue_depth": queue_stats["depth"],
+        "pisces_llm_queue_active": queue_stats["active"],
+        "pisces_llm_queue_rejected": queue_stats["rejected"],
+        "pisces_sessions": pisces.sessions.get_stats()["sessions"],
+        "pisces_response_cache_hits": cache_stats["hits"],
+        "pisces_response_cache_misses": cache_stats["misses"],
+        "pisces_ready": int(startup.is_ready()),
+    }
+    return web.Response(text=tracing.render_metrics(gauges), content_type="text/plain", charset="utf-8")
+
+
+async def preflight(request: web.Request) -> web.Response:
+    return web.Response(headers={
+        "Access-Control-Allow-Methods": "GET, POST",
+        "Access-Control-Allow-Headers": "Content-Type",
+    })
+
+
+async def add_cors_headers(request: web.Request, response: web.StreamResponse) -> None:
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    if TIMING_HEADER:
+        response.headers["Timing-Allow-Origin"] = "*"
+
+
+async def on_startup(app: web.Application) -> None:
+    llm_queue.start()
+    startup.start_all()
+
+
+async def on_cleanup(app: web.Application) -> None:
+    await llm_queue.stop()
+    nlp_executor.shutdown(wait=False, cancel_futures=True)
+    backend = getattr(startup.subsystems.get("llm"), "value", None)
+    if isinstance(backend, llm_backends.LLMBackend):
+        backend.stop()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/status", status)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_route("OPTIONS", "/{tail:.*}", preflight)
+    app.on_response_prepare.append(add_cors_headers)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    print(f"Pisces server running on http://{HOST}:{PORT}")
+    web.run_app(create_app(), host=HOST, port=PORT, print=None)
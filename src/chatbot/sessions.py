@@ -0,0 +1,100 @@
+"""
+In-memory store for per-user conversation sessions.
+Sessions are kept in least-recently-used order, expire after a period of inactivity,
+and the oldest are evicted when the store goes over its session or memory limits.
+"""
+
+import threading, time
+from collections import OrderedDict
+
+
+class SessionStore:
+    def __init__(self, factory, ttl_seconds: float, max_sessions: int, max_bytes: int) -> None:
+        """
+        :param factory: A callable creating a new session from a session id.
+        :param ttl_seconds: How long an idle session is kept.
+        :param max_sessions: The maximum number of sessions kept at once.
+        :param max_bytes: The approximate memory budget for all sessions, based on each session's size().
+            Sessions report changes in size through their on_resize attribute, so the total is kept as they change.
+        """
+        self.factory = factory
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()
+        self.last_used = {}
+        self.sizes = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> object:
+        """
+        Get a session by id, creating it if it does not exist or has expired.
+        :param session_id: The id of the session.
+        :return: The session.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.evict_expired(now)
+
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.factory(session_id)
+                self.sessions[session_id] = session
+                self.sizes[session_id] = session.size()
+                self.total_bytes += self.sizes[session_id]
+                session.on_resize = lambda size: self.resize(session_id, session, size)
+            else:
+                self.sessions.move_to_end(session_id)
+            self.last_used[session_id] = now
+
+            self.evict_over_limit(session_id)
+            return session
+
+    def remove(self, session_id: str) -> None:
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            self.last_used.pop(session_id, None)
+            self.total_bytes -= self.sizes.pop(session_id, 0)
+
+    def resize(self, session_id: str, session: object, size: int) -> None:
+        """
+        Record a session's new size.
+        :param session_id: The id of the session.
+        :param session: The session, so a session that was already evicted or replaced is ignored.
+        :param size: The session's size() after the change.
+        """
+        with self.lock:
+            if self.sessions.get(session_id) is session:
+                self.total_bytes += size - self.sizes[session_id]
+                self.sizes[session_id] = size
+
+    def evict_expired(self, now: float) -> None:
+        # Sessions are in last-used order, so stop at the first one still alive
+        while self.sessions:
+            session_id = next(iter(self.sessions))
+            if now - self.last_used[session_id] < self.ttl_seconds:
+                break
+            self.evict(session_id)
+
+    def evict_over_limit(self, keep_id: str) -> None:
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            session_id = next(iter(self.sessions))
+            if session_id == keep_id:
+                break
+            self.evict(session_id)
+
+    def evict(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+        self.last_used.pop(session_id)
+        self.total_bytes -= self.sizes.pop(session_id)
+        self.evictions += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+            }
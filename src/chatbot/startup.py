@@ -0,0 +1,120 @@
+"""
+Staged startup for the chatbot subsystems.
+Each subsystem is registered with a loader and is initialised on first use,
+or warmed up in the background by start_all().
+"""
+
+import threading, time
+
+subsystems = {}
+
+
+class Subsystem:
+    def __init__(self, name: str, loader) -> None:
+        self.name = name
+        self.loader = loader
+        self.value = None
+        self.state = "cold"
+        self.error = None
+        self.seconds = None
+        self.lock = threading.Lock()
+
+    def load(self) -> object:
+        """
+        Run the loader once, blocking any other caller until it has finished.
+        :return: The loaded subsystem.
+        """
+        with self.lock:
+            if self.state == "warm":
+                return self.value
+
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                self.value = self.loader()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                self.seconds = time.perf_counter() - start
+                print(f"- Failed to load {self.name}: {e}")
+                raise
+
+            self.state = "warm"
+            self.error = None
+            self.seconds = time.perf_counter() - start
+            print(f"+ Loaded {self.name} in {self.seconds:.2f}s")
+            return self.value
+
+
+class LazySubsystem:
+    """
+    Stand-in for a subsystem that loads it on the first attribute access.
+    """
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __getattr__(self, attr: str) -> object:
+        return getattr(require(self._name), attr)
+
+
+def register(name: str, loader) -> LazySubsystem:
+    """
+    Register a subsystem loader.
+    :param name: The name of the subsystem.
+    :param loader: A callable returning the loaded subsystem.
+    :return: A lazy stand-in for the subsystem.
+    """
+    if name not in subsystems:
+        subsystems[name] = Subsystem(name, loader)
+    return LazySubsystem(name)
+
+
+def require(name: str) -> object:
+    """
+    Get a subsystem, loading it first if it is not warm yet.
+    :param name: The name of the subsystem.
+    :return: The loaded subsystem.
+    """
+    subsystem = subsystems[name]
+    if subsystem.state == "warm":
+        return subsystem.value
+    return subsystem.load()
+
+
+def warm_up(name: str) -> None:
+    try:
+        require(name)
+    except Exception:
+        pass
+
+
+def start_all() -> list[threading.Thread]:
+    """
+    Load every registered subsystem concurrently in background threads.
+    :return: The started threads.
+    """
+    threads = []
+    for name in subsystems:
+        thread = threading.Thread(target=warm_up, args=(name,), name=f"startup-{name}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def is_ready() -> bool:
+    return all(subsystem.state == "warm" for subsystem in subsystems.values())
+
+
+def get_status() -> dict[str, dict]:
+    """
+    Report which subsystems are warm and how long each took to load.
+    :return: A dictionary keyed by subsystem name.
+    """
+    return {
+        name: {
+            "state": subsystem.state,
+            "seconds": round(subsystem.seconds, 3) if subsystem.seconds is not None else None,
+            "error": subsystem.error,
+        }
+        for name, subsystem in subsystems.items()
+    }
@@ -0,0 +1,166 @@
+"""
+Route contingency questions to the plan of the station they are about.
+Each plan is matched to its station in the station codes data when the plans are ingested, and every
+name the station goes by, such as "Ashford (Surrey)", "ASHFORD SURREY", "Ashford" or its CRS code "AFS",
+is mapped to the plan's partition. Names spelled differently are matched fuzzily.
+"""
+
+import os, re, csv, json
+from rapidfuzz import process, fuzz
+
+STATION_CODES_PATH = "./src/data/csv/enhanced_stations.csv"
+OLD_STATIONS_PATH = "./src/data/csv/stations.csv"
+# The operators running the stations the plans cover, preferred when a name is shared
+PLAN_OPERATORS = {"SW", "IL"}
+STATION_MATCH_CUTOFF = int(os.getenv("PISCES_STATION_MATCH_CUTOFF", 85))
+
+abbreviations = {"jct": "junction", "jn": "junction", "rd": "road"}
+
+
+def normalise_station_name(name: str) -> str:
+    name = name.lower().replace("&", " and ")
+    name = re.sub(r"\brail station\b|\bstation\b", " ", name)
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(abbreviations.get(word, word) for word in name.split())
+
+
+def get_base_name(name: str) -> str:
+    """
+    Normalise a station name without its qualifier, as in "Ashford (Surrey)".
+    """
+    return normalise_station_name(re.sub(r"\(.*?\)", " ", name))
+
+
+def load_stations() -> list[dict]:
+    """
+    Load every station with the names it is known by, from the files the station codes table is built from.
+    :return: A list of stations, each with its CRS code, name, operator and other names.
+    """
+    stations = {}
+    with open(STATION_CODES_PATH, mode="r") as file:
+        for row in csv.DictReader(file):
+            stations[row["CRS Code"]] = {
+                "crs": row["CRS Code"],
+                "name": row["Station Name"],
+                "operator": row["Station Operator"],
+                "normalised_name": normalise_station_name(row["Station Name"]),
+                "base_name": get_base_name(row["Station Name"]),
+                "aliases": [row["Station Name"], row["Sixteen Character Name"].rstrip(".")],
+            }
+
+    with open(OLD_STATIONS_PATH, mode="r") as file:
+        for row in csv.DictReader(file):
+            if row["crs"] in stations:
+                stations[row["crs"]]["aliases"] += [alias for alias in (row["name"], row["longname.name_alias"]) if alias != "\\N"]
+    return list(stations.values())
+
+
+def match_plan(plan_name: str, stations: list[dict]) -> dict:
+    """
+    Find the station a plan is for. Plans are named loosely, as in "Smallbrook Jct" or "Porchester",
+    so names are compared with and without their qualifiers, and ties go to the plans' own operators.
+    :param plan_name: The plan's file name without its extension.
+    :param stations: The stations from load_stations.
+    :return: The station, or None if nothing is close.
+    """
+    query = normalise_station_name(plan_name)
+    candidates = {
+        i for key in ("normalised_name", "base_name")
+        for _, _, i in process.extract(query, [station[key] for station in stations], scorer=fuzz.token_set_ratio, limit=25)
+    }
+
+    def get_score(station: dict) -> tuple:
+        similarity = max(fuzz.token_set_ratio(query, station["normalised_name"]), fuzz.token_set_ratio(query, station["base_name"]))
+        return similarity, station["base_name"] == query, station["operator"] in PLAN_OPERATORS, fuzz.ratio(query, station["base_name"])
+
+    best = max((stations[i] for i in candidates), key=get_score, default=None)
+    if best is None or get_score(best)[0] < STATION_MATCH_CUTOFF:
+        return None
+    return best
+
+
+def get_collection_name(prefix: str, partition: str, station: dict = None) -> str:
+    # Chroma collection names are 3 to 63 characters of letters, digits, dots, dashes and underscores
+    suffix = station["crs"].lower() if station else re.sub(r"[^a-z0-9]+", "_", partition.lower()).strip("_")
+    return f"{prefix}_{suffix}"[:63]
+
+
+def build_station_map(plan_names: list[str], collection_prefix: str) -> dict:
+    """
+    Match each plan to its station and map all of the station's names to the plan.
+    :param plan_names: The plans' file names without their extensions, which name their partitions.
+    :param collection_prefix: The prefix of the per-station collection names.
+    :return: The partitions, with their station and collection, the map of normalised names to partitions,
+    and the names of stations without a plan.
+    """
+    stations = load_stations()
+    partitions = {}
+    names = {}
+    planned = set()
+
+    # Plan names first, so a station's other names never take over another plan's name
+    for plan_name in plan_names:
+        names.setdefault(normalise_station_name(plan_name), plan_name)
+
+    for plan_name in plan_names:
+        station = match_plan(plan_name, stations)
+        partitions[plan_name] = {
+            "crs": station["crs"] if station else None,
+            "name": station["name"] if station else plan_name,
+            "collection": get_collection_name(collection_prefix, plan_name, station),
+        }
+        if station:
+            planned.add(station["crs"])
+            for alias in station["aliases"]:
+                for name in (normalise_station_name(alias), get_base_name(alias)):
+                    if name:
+                        names.setdefault(name, plan_name)
+
+    for plan_name, partition in partitions.items():
+        if partition["crs"]:
+            names.setdefault(partition["crs"].lower(), plan_name)
+
+    # Kept so a station without a plan is never mistaken for a similarly named one with a plan
+    other_names = {
+        name for station in stations if station["crs"] not in planned
+        for alias in station["aliases"] for name in (normalise_station_name(alias), get_base_name(alias), station["crs"].lower())
+        if name and name not in names
+    }
+    return {"partitions": partitions, "names": names, "other_names": sorted(other_names)}
+
+
+def save_station_map(station_map: dict, path: str) -> None:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, mode="w") as file:
+        json.dump(station_map, file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def load_station_map(path: str) -> dict:
+    try:
+        with open(path, mode="r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"partitions": {}, "names": {}, "other_names": []}
+
+
+def resolve_station(station_map: dict, station: str) -> str:
+    """
+    Find the partition of the plan for a station, however its name is written.
+    A misspelt name is only routed to a plan when it is closer to that plan's station than to any station without one.
+    :param station_map: The map from build_station_map.
+    :param station: The station name, such as "ASHFORD SURREY" from nlp.extract_single_station, or a CRS code.
+    :return: The partition, or None if no plan covers the station.
+    """
+    if not station:
+        return None
+    name = normalise_station_name(station)
+    if name in station_map["names"]:
+        return station_map["names"][name]
+
+    other_names = station_map.get("other_names", [])
+    if name in other_names:
+        return None
+
+    match = process.extractOne(name, list(station_map["names"]) + other_names, scorer=fuzz.ratio, score_cutoff=STATION_MATCH_CUTOFF)
+    return station_map["names"].get(match[0]) if match else None
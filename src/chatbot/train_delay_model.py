@@ -0,0 +1,117 @@
+"""
+Train the delay model on the 2024 Norwich to London service details and write it for prediction_model to load.
+A k-nearest neighbours regressor predicts the arrival delay from the planned departure time. As that is its only
+input, the model is saved as the delay it predicts for every minute of the day, which needs neither pandas nor
+scikit-learn to use. Run from the repository root after the service details change:
+    python src/chatbot/train_delay_model.py
+"""
+
+import os, sys, json, time, hashlib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from prediction_model import DELAY_MODEL_PATH, DELAY_MODEL_FORMAT, MINUTES_PER_DAY
+
+SERVICE_DETAILS_PATH = "./src/data/2024_service_details_Norwich_to_London.csv"
+N_NEIGHBORS = 3
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+# Delays outside these bounds, in minutes, are treated as bad data
+MIN_DELAY = -60
+MAX_DELAY = 120
+
+
+def parse_minutes(times: pd.Series) -> pd.Series:
+    """
+    Convert a column of HH:MM times to minutes since midnight.
+    """
+    parts = times.str.split(":", expand=True).astype(int)
+    return parts[0] * 60 + parts[1]
+
+
+def load_service_details(path: str = SERVICE_DETAILS_PATH) -> pd.DataFrame:
+    """
+    Load the planned departure time and arrival delay, in minutes, of every stop with both recorded.
+    :param path: The service details CSV.
+    :return: The stops, with delays outside MIN_DELAY and MAX_DELAY dropped.
+    """
+    df = pd.read_csv(path, usecols=["planned_departure_time", "actual_arrival_time"])
+    df = df.dropna(subset=["planned_departure_time", "actual_arrival_time"])
+
+    departure = parse_minutes(df["planned_departure_time"])
+    arrival = parse_minutes(df["actual_arrival_time"])
+    # An arrival earlier in the day than the departure was after midnight
+    arrival = arrival.where(arrival >= departure, arrival + MINUTES_PER_DAY)
+
+    df = pd.DataFrame({"planned_departure_time": departure, "arrival_delay": arrival - departure})
+    return df[(df["arrival_delay"] < MAX_DELAY) & (df["arrival_delay"] > MIN_DELAY)]
+
+
+def train(df: pd.DataFrame) -> tuple[KNeighborsRegressor, dict]:
+    """
+    Fit the regressor on a training split and score it on the rest.
+    :param df: The stops from load_service_details.
+    :return: The fitted regressor and its mean squared error and R² on the test split.
+    """
+    X = df[["planned_departure_time"]]
+    y = df["arrival_delay"]
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+
+    knn_regressor = KNeighborsRegressor(n_neighbors=N_NEIGHBORS)
+    knn_regressor.fit(X_train, y_train)
+
+    y_pred = knn_regressor.predict(X_test)
+    return knn_regressor, {
+        "mse": float(mean_squared_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+    }
+
+
+def get_file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, mode="rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def save_model(knn_regressor: KNeighborsRegressor, metrics: dict, source: str, path: str = DELAY_MODEL_PATH) -> dict:
+    """
+    Write the delay predicted for every minute of the day, with what the model was trained on, atomically.
+    :return: The saved model.
+    """
+    minutes = pd.DataFrame({"planned_departure_time": np.arange(MINUTES_PER_DAY)})
+    saved = {
+        "format": DELAY_MODEL_FORMAT,
+        "version": time.strftime("%Y%m%d%H%M%S"),
+        "source": os.path.basename(source),
+        "source_sha256": get_file_hash(source),
+        "n_neighbors": N_NEIGHBORS,
+        "sklearn_version": sklearn.__version__,
+        "metrics": metrics,
+        "delays": knn_regressor.predict(minutes).tolist(),
+    }
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, mode="w") as file:
+        json.dump(saved, file)
+    os.replace(temp_path, path)
+    return saved
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    knn_regressor, metrics = train(load_service_details(SERVICE_DETAILS_PATH))
+    saved = save_model(knn_regressor, metrics, SERVICE_DETAILS_PATH)
+    print(f"+ Trained delay model {saved['version']} on {metrics['train_rows']} stops in {time.perf_counter() - start:.1f}s: "
+          f"MSE {metrics['mse']:.2f}, R² {metrics['r2']:.3f}")
+    print(f"+ Wrote {DELAY_MODEL_PATH}")
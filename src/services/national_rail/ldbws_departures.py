@@ -2,6 +2,17 @@ import os, chatbot.journey_planner as journey_planner
 from zeep import Client
 from dotenv import load_dotenv
 
+client = None
+
+def get_client():
+    """
+    Get the LDBWS SOAP client, fetching the WSDL on first use.
+    """
+    global client
+    if client is None:
+        client = setup_client()
+    return client
+
 def setup_client():
     load_dotenv()
     API_KEY = os.getenv("OPENLDBWS_API_KEY")
@@ -58,7 +69,7 @@ def get_next_departure(from_station, to_station):
 def get_direct_depature_board(from_station, to_station):
     try:
         # Get departure board info
-        response = client.service.GetDepBoardWithDetails(
+        response = get_client().service.GetDepBoardWithDetails(
             numRows=10,
             crs=from_station,
             filterCrs=to_station,
@@ -71,9 +82,7 @@ def get_direct_depature_board(from_station, to_station):
 
 def get_departure_board(from_station):
     try:
-        response = client.service.GetDepBoardWithDetails(numRows=10, crs=from_station,filterType="from")
+        response = get_client().service.GetDepBoardWithDetails(numRows=10, crs=from_station,filterType="from")
         return response
     except Exception as e:
         return []
-
-client = setup_client()
\ No newline at end of file
@@ -0,0 +1,32 @@
+import os, time
+
+VERSIONS_DIR = "./src/data/cache/versions"
+
+
+def get_version_path(source: str) -> str:
+    return os.path.join(VERSIONS_DIR, source)
+
+
+def mark_rebuilt(source: str) -> None:
+    """
+    Record that a data source, such as the station_codes table, has been rebuilt.
+    :param source: The name of the data source.
+    """
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    path = get_version_path(source)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, mode="w") as file:
+        file.write(str(time.time_ns()))
+    os.replace(temp_path, path)
+
+
+def get_version(source: str) -> int:
+    """
+    Get the version stamp of a data source.
+    :param source: The name of the data source.
+    :return: The time the source was last rebuilt in nanoseconds, or 0 if it never has been.
+    """
+    try:
+        return os.stat(get_version_path(source)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,195 @@
+"""
+Persistent cache of text embeddings, one file per embedding model.
+Each record is a 16-byte hash of the model id and text followed by the float32 vector, appended to a
+memory-mapped file after a small header holding the dimension. Records are only ever appended, under a
+lock on a file beside it, so several processes can share a cache and a torn write at the end is simply ignored.
+Questions are not written to the file, which would grow with every new question; the vectors of recent ones
+are kept in memory instead.
+"""
+
+import os, re, hashlib, threading, contextlib
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, but can lock a byte range of a file with msvcrt
+    fcntl = None
+    import msvcrt
+
+EMBEDDING_CACHE_DIR = os.getenv("PISCES_EMBEDDING_CACHE_DIR", "./src/data/cache/embeddings")
+# The number of recent questions whose vectors are kept in memory
+QUERY_CACHE_SIZE = int(os.getenv("PISCES_QUERY_CACHE_SIZE", 1024))
+MAGIC = b"PEMB"
+HEADER_BYTES = 8
+
+
+def normalise_query(text: str) -> str:
+    """
+    Normalise the case and spacing of a question, which uncased models such as all-MiniLM-L6-v2 ignore anyway.
+    """
+    return " ".join(text.lower().split())
+
+
+@contextlib.contextmanager
+def lock_file(path: str):
+    """
+    Hold an exclusive lock between processes on a lock file, waiting until it is free.
+    """
+    with open(path, mode="a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    def __init__(self, model_id: str, cache_dir: str = EMBEDDING_CACHE_DIR, query_cache_size: int = QUERY_CACHE_SIZE) -> None:
+        """
+        :param model_id: The embedding model, so vectors from different models are never mixed.
+        :param cache_dir: The directory of cache files.
+        :param query_cache_size: The number of recent questions whose vectors are kept in memory.
+        """
+        self.model_id = model_id
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_id) + ".emb")
+        self.dim = None
+        self.records = None
+        self.rows = {}  # Key to record number
+        self.queries = OrderedDict()  # Question to its vector, least recently used first
+        self.query_cache_size = query_cache_size
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "query_hits": 0, "query_misses": 0}
+
+    def get_key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_id}\0{text}".encode(), digest_size=16).digest()
+
+    def get_dtype(self) -> np.dtype:
+        # Raw bytes rather than "S16", which would strip trailing zero bytes from the keys
+        return np.dtype([("key", "u1", (16,)), ("vector", "<f4", (self.dim,))])
+
+    def refresh(self) -> None:
+        """
+        Map any records added since the file was last read, by this or another process.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if self.dim is None:
+            with open(self.path, mode="rb") as file:
+                header = file.read(HEADER_BYTES)
+            if len(header) < HEADER_BYTES or header[:4] != MAGIC:
+                return
+            self.dim = int.from_bytes(header[4:], "little")
+
+        count = (size - HEADER_BYTES) // self.get_dtype().itemsize
+        known = len(self.records) if self.records is not None else 0
+        if count <= known:
+            return
+        self.records = np.memmap(self.path, dtype=self.get_dtype(), mode="r", offset=HEADER_BYTES, shape=(count,))
+        keys = self.records["key"][known:].tobytes()
+        for row in range(known, count):
+            offset = (row - known) * 16
+            self.rows[keys[offset:offset + 16]] = row
+
+    def get(self, texts: list[str]) -> list:
+        """
+        :return: The cached vector of each text, or None where there is none.
+        """
+        with self.lock:
+            self.refresh()
+            keys = [self.get_key(text) for text in texts]
+            vectors = [np.array(self.records[self.rows[key]]["vector"]) if key in self.rows else None for key in keys]
+            hits = sum(vector is not None for vector in vectors)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(texts) - hits
+        return vectors
+
+    def put(self, texts: list[str], vectors: np.ndarray) -> None:
+        """
+        Add vectors to the cache, skipping texts that are already in it.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock, lock_file(f"{self.path}.lock"), open(self.path, mode="ab") as file:
+            self.refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                file.truncate(0)
+                file.write(MAGIC + self.dim.to_bytes(4, "little"))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings for {self.model_id}, got {vectors.shape[1]}")
+
+            # Drop any torn record left at the end by a crash, so new records stay aligned
+            count = (file.seek(0, os.SEEK_END) - HEADER_BYTES) // self.get_dtype().itemsize
+            file.truncate(HEADER_BYTES + count * self.get_dtype().itemsize)
+            new_records = {}
+            for text, vector in zip(texts, vectors):
+                key = self.get_key(text)
+                if key not in self.rows and key not in new_records:
+                    new_records[key] = vector
+            if new_records:
+                records = np.empty(len(new_records), dtype=self.get_dtype())
+                records["key"] = np.frombuffer(b"".join(new_records), dtype=np.uint8).reshape(-1, 16)
+                records["vector"] = np.stack(list(new_records.values()))
+                file.write(records.tobytes())
+                file.flush()
+        with self.lock:
+            self.refresh()
+
+    def embed(self, texts: list[str], embedding_function) -> list[list[float]]:
+        """
+        Embed texts, only running the model on those not already cached.
+        :param texts: The texts to embed.
+        :param embedding_function: The model, called with a list of texts.
+        :return: The vectors, as lists for Chroma.
+        """
+        vectors = self.get(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = np.asarray(embedding_function(missing), dtype=np.float32)
+            self.put(missing, computed)
+            found = dict(zip(missing, computed))
+            vectors = [found[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str, embedding_function) -> list[float]:
+        """
+        Embed a question, reusing the vector of a recent one without writing it to the file.
+        :param text: The normalised question.
+        :param embedding_function: The model, called with a list of texts.
+        :return: The vector, as a list for Chroma.
+        """
+        with self.lock:
+            vector = self.queries.get(text)
+            if vector is not None:
+                self.queries.move_to_end(text)
+                self.stats["query_hits"] += 1
+                return vector
+            self.stats["query_misses"] += 1
+
+        vector = np.asarray(embedding_function([text])[0], dtype=np.float32).tolist()
+        with self.lock:
+            self.queries[text] = vector
+            if len(self.queries) > self.query_cache_size:
+                self.queries.popitem(last=False)
+        return vector
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self.rows), "queries": len(self.queries)}
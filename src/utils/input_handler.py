@@ -1,10 +1,15 @@
-import dateparser, re
+import os, sys, dateparser, re, threading
 from spellchecker import SpellChecker
-from datetime import datetime
+from datetime import datetime, timedelta, date as calendar_date, time as clock_time
 from spacy.lang.en.stop_words import STOP_WORDS
 from nltk.corpus import stopwords
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import tracing
+
 spell = SpellChecker()
+DATE_MEMO_SIZE = 4096
 merged_stopwords = set(STOP_WORDS).union(set(stopwords.words("english")))
 
 
@@ -27,6 +32,7 @@ def correct_spelling(word: str) -> str:
     return corrected_word if corrected_word else word
 
 
+@tracing.traced("spell_correction")
 def correct_sentence(sentence: str) -> str:
     """
     Correct the spelling of a sentence using the spell checker.
@@ -121,7 +127,188 @@ def preprocess_text(text: str, nlp: object, spell_check: bool = True, lemma: boo
     return cleaned_text.lower()
 
 
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+TIME_REGEX = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*(am|pm)?$")
+WEEKDAY_REGEX = re.compile(rf"^(?:(this|next)\s+)?({'|'.join(WEEKDAYS)})s?$")
+RELATIVE_REGEX = re.compile(r"^(?:in\s+)?(\d+|a|one)\s+(day|week)s?(?:\s+time)?$")
+DAY_MONTH_REGEX = re.compile(rf"^(?:the\s+)?(\d{{1,2}})(?:st|nd|rd|th)?(?:\s+of)?\s+({MONTH_NAMES})$")
+MONTH_DAY_REGEX = re.compile(rf"^({MONTH_NAMES})\s+(?:the\s+)?(\d{{1,2}})(?:st|nd|rd|th)?$")
+ORDINAL_REGEX = re.compile(r"^(?:the\s+)?(\d{1,2})(?:st|nd|rd|th)$")
+PREFIX_REGEX = re.compile(r"^(?:on|at|for)\s+")
+
+date_memo = {}
+# Held to check, fill and evict the memo, so threads parsing at once never read a phrase evicted meanwhile
+date_memo_lock = threading.Lock()
+
+
+def get_next_day_of_month(day: int, current_day: calendar_date) -> calendar_date:
+    """
+    Get the next date on or after the current day that falls on the given day of the month.
+    :param day: The day of the month.
+    :param current_day: The date to search from.
+    :return: The matching date, or None if the day does not exist in any month.
+    """
+    year, month = current_day.year, current_day.month
+    for _ in range(12):
+        try:
+            candidate = calendar_date(year, month, day)
+        except ValueError:
+            candidate = None
+        if candidate and candidate >= current_day:
+            return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+
+def get_next_month_day(month: int, day: int, current_day: calendar_date) -> calendar_date:
+    """
+    Get the next date on or after the current day with the given month and day.
+    :param month: The month number.
+    :param day: The day of the month.
+    :param current_day: The date to search from.
+    :return: The matching date, or None if the date does not exist.
+    """
+    for year in range(current_day.year, current_day.year + 5):
+        try:
+            candidate = calendar_date(year, month, day)
+        except ValueError:
+            continue
+        if candidate >= current_day:
+            return candidate
+    return None
+
+
+def parse_fast_time(phrase: str) -> clock_time:
+    """
+    Parse the clock times we extract from messages, e.g. "10:00 am", "5pm", "17:45", "noon", "midnight".
+    :param phrase: The normalised phrase.
+    :return: The parsed time, or None if the phrase is not a clock time.
+    """
+    if phrase == "noon" or phrase == "midday":
+        return clock_time(12, 0)
+    if phrase == "midnight":
+        return clock_time(0, 0)
+
+    match = TIME_REGEX.match(phrase)
+    if not match or (match.group(2) is None and match.group(3) is None):
+        return None
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+
+    if hour > 23 or minute > 59:
+        return None
+    return clock_time(hour, minute)
+
+
+def parse_fast_date(phrase: str, current_day: calendar_date) -> tuple:
+    """
+    Parse the date phrases we extract from messages, e.g. "tomorrow", "next monday", "may 15th", "the 20th", "in 5 weeks".
+    :param phrase: The normalised phrase.
+    :param current_day: The day the phrase is relative to.
+    :return: A tuple of the parsed date and whether the current time of day is kept, or None if the phrase is unknown.
+    """
+    if phrase == "today":
+        return current_day, True
+    if phrase == "tomorrow":
+        return current_day + timedelta(days=1), True
+
+    if match := WEEKDAY_REGEX.match(phrase):
+        modifier, weekday = match.groups()
+        days_ahead = (WEEKDAYS.index(weekday) - current_day.weekday()) % 7
+        if days_ahead == 0 and modifier != "this":
+            days_ahead = 7
+        return current_day + timedelta(days=days_ahead), False
+
+    if match := RELATIVE_REGEX.match(phrase):
+        amount, unit = match.groups()
+        amount = 1 if amount in ("a", "one") else int(amount)
+        return current_day + timedelta(days=amount * (7 if unit == "week" else 1)), True
+
+    if match := DAY_MONTH_REGEX.match(phrase):
+        result = get_next_month_day(MONTHS[match.group(2)], int(match.group(1)), current_day)
+        return (result, False) if result else None
+
+    if match := MONTH_DAY_REGEX.match(phrase):
+        result = get_next_month_day(MONTHS[match.group(1)], int(match.group(2)), current_day)
+        return (result, False) if result else None
+
+    if match := ORDINAL_REGEX.match(phrase):
+        result = get_next_day_of_month(int(match.group(1)), current_day)
+        return (result, False) if result else None
+
+    return None
+
+
+def fast_parse_datestring(phrase: str, current_day: calendar_date) -> tuple:
+    """
+    Parse a normalised date or time phrase without dateparser.
+    :param phrase: The normalised phrase.
+    :param current_day: The day the phrase is relative to.
+    :return: ("time", time), ("date", date, keep_time) or None if the phrase is not recognised.
+    """
+    if (parsed_time := parse_fast_time(phrase)) is not None:
+        return ("time", parsed_time)
+    if (parsed_date := parse_fast_date(phrase, current_day)) is not None:
+        return ("date", *parsed_date)
+    return None
+
+
+def apply_parsed_date(parsed: tuple, current_date: datetime) -> datetime:
+    """
+    Apply a fast-path parse result to the current date.
+    Times earlier than the current time of day roll over to the next day, as dateparser does with future dates.
+    :param parsed: The result of fast_parse_datestring.
+    :param current_date: The date the phrase is relative to.
+    :return: The resulting datetime.
+    """
+    if parsed[0] == "time":
+        result = datetime.combine(current_date.date(), parsed[1])
+        return result + timedelta(days=1) if parsed[1] < current_date.time() else result
+
+    _, parsed_date, keep_time = parsed
+    return datetime.combine(parsed_date, current_date.time() if keep_time else clock_time(0, 0))
+
+
+def normalise_datestring(date_string: str) -> str:
+    phrase = re.sub(r"\s+", " ", date_string.lower()).strip(" .,")
+    return PREFIX_REGEX.sub("", phrase)
+
+
 def parse_datestring(date_string: str, current_date) -> str:
+    """
+    Parse a date or time phrase relative to the current date.
+    Common phrasings are handled by a compiled fast path and memoised per (phrase, day);
+    anything else falls through to dateparser.
+    :param date_string: The phrase to parse.
+    :param current_date: The datetime the phrase is relative to.
+    :return: The parsed datetime, or the current date if the phrase could not be parsed.
+    """
+    phrase = normalise_datestring(date_string)
+    key = (phrase, current_date.date())
+
+    with date_memo_lock:
+        if key not in date_memo:
+            date_memo[key] = fast_parse_datestring(phrase, current_date.date())
+            if len(date_memo) > DATE_MEMO_SIZE:
+                date_memo.pop(next(iter(date_memo)))
+        parsed = date_memo[key]
+    if parsed == "unparsed":
+        return current_date
+    if parsed is not None:
+        return apply_parsed_date(parsed, current_date)
+
     settings = {
         "PREFER_DATES_FROM": "future",
         "RELATIVE_BASE": current_date,
@@ -129,6 +316,11 @@ def parse_datestring(date_string: str, current_date) -> str:
         "DATE_ORDER": "DMY",
     }
     result = dateparser.parse(date_string, settings=settings)
+    if result is None:
+        # Remember phrases dateparser cannot parse, as those are the slowest to reject
+        with date_memo_lock:
+            if key in date_memo:
+                date_memo[key] = "unparsed"
     return result if result else current_date
 
 def parse_journey_dict(journey_dict: dict, current_date) -> tuple:
@@ -0,0 +1,174 @@
+"""
+Lightweight tracing for chat turns.
+Spans time a stage of the turn and add it to a per-stage latency histogram. Within a trace started by
+start_trace() the spans are also collected for the request, so they can be reported back with it.
+Everything is exported in the Prometheus text format by render_metrics().
+"""
+
+import contextvars, functools, threading, time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        prefix = f"{labels}," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+stage_seconds = {}
+token_rate = Histogram(TOKEN_RATE_BUCKETS)
+token_totals = {"prompt": 0, "completion": 0, "reused": 0}
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    with lock:
+        if name not in stage_seconds:
+            stage_seconds[name] = Histogram(LATENCY_BUCKETS)
+        stage_seconds[name].observe(seconds)
+
+    trace = current_trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time the enclosed block as a stage of the current turn.
+    :param name: The stage name, such as "nlp.predict_intents".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def traced(name: str):
+    """
+    Decorator timing every call of a function as a stage.
+    :param name: The stage name.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedModule:
+    """
+    Stand-in for a module that times every call to its functions, each as a stage named after
+    the module the function is defined in, such as "knowledge_base.get_station_details_by_columns".
+    """
+    def __init__(self, module: object) -> None:
+        self._module = module
+        self._wrappers = {}
+
+    def __getattr__(self, attr: str) -> object:
+        value = getattr(self._module, attr)
+        if not callable(value):
+            return value
+        wrapper = self._wrappers.get(attr)
+        if wrapper is None or wrapper.__wrapped__ is not value:
+            module = getattr(value, "__module__", None) or "unknown"
+            wrapper = traced(f"{module.rsplit('.', 1)[-1]}.{attr}")(value)
+            self._wrappers[attr] = wrapper
+        return wrapper
+
+
+def record_generation(stats: dict, seconds: float) -> None:
+    """
+    Record the token counts and generation speed of an LLM reply.
+    :param stats: The token counts from llm_service.
+    :param seconds: How long the generation took.
+    """
+    with lock:
+        token_totals["prompt"] += stats.get("prompt_tokens", 0)
+        token_totals["completion"] += stats.get("completion_tokens", 0)
+        token_totals["reused"] += stats.get("reused_tokens", 0)
+        if seconds > 0 and stats.get("completion_tokens"):
+            token_rate.observe(stats["completion_tokens"] / seconds)
+
+
+def start_trace() -> list:
+    """
+    Start collecting the spans of a request in the current context.
+    :return: The list the spans are added to, as (stage, seconds).
+    """
+    trace = []
+    current_trace.set(trace)
+    return trace
+
+
+def bind(fn):
+    """
+    Bind a function to the current context, so spans it records in another thread join the current trace.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def format_server_timing(trace: list) -> str:
+    """
+    Format a trace as a Server-Timing header, summing repeated stages.
+    """
+    totals = {}
+    for name, seconds in trace:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name.replace('.', '_')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def render_metrics(gauges: dict = None) -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+    :param gauges: Extra point-in-time values to include, keyed by metric name.
+    """
+    lines = ["# HELP pisces_stage_seconds Time spent in each stage of a chat turn.", "# TYPE pisces_stage_seconds histogram"]
+    with lock:
+        for name, histogram in sorted(stage_seconds.items()):
+            lines.extend(histogram.render("pisces_stage_seconds", f'stage="{name}"'))
+
+        lines.append("# HELP pisces_llm_tokens_total Tokens processed by the LLM.")
+        lines.append("# TYPE pisces_llm_tokens_total counter")
+        for kind, total in token_totals.items():
+            lines.append(f'pisces_llm_tokens_total{{kind="{kind}"}} {total}')
+
+        lines.append("# HELP pisces_llm_tokens_per_second Generation speed of each LLM reply.")
+        lines.append("# TYPE pisces_llm_tokens_per_second histogram")
+        lines.extend(token_rate.render("pisces_llm_tokens_per_second"))
+
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,21 +1,33 @@
-const API_URL = 'http://localhost:8000/chat';
+const STREAM_URL = 'http://localhost:8000/chat/stream';
 const messagesEl = document.getElementById('messages');
 const inputEl    = document.getElementById('user-input');
 const sendBtn    = document.getElementById('send-btn');
+let sessionId    = null;
 
 
 
-async function sendToBot(message) {
-  const res = await fetch(API_URL, {
+async function streamFromBot(message, onEvent) {
+  const res = await fetch(STREAM_URL, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ message })
+    body: JSON.stringify({ message, session_id: sessionId })
   });
 
   if (!res.ok) throw new Error(`Server error ${res.status}`);
 
-  const data = await res.json();
-  return data.replies;
+  // The server sends one JSON event per line
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+  }
 }
 
 
@@ -45,6 +57,7 @@ function appendMessage(role, text) {
   wrap.appendChild(ts);
   messagesEl.appendChild(wrap);
   messagesEl.scrollTop = messagesEl.scrollHeight;
+  return bubble;
 }
 
 function showTyping() {
@@ -82,10 +95,29 @@ async function handleSend() {
   appendMessage('user', text);
   showTyping();
 
+  let streamed = null;
+  let streamedText = '';
+
   try {
-    const replies = await sendToBot(text);
+    await streamFromBot(text, event => {
+      if (event.type === 'session') {
+        sessionId = event.session_id;
+      } else if (event.type === 'reply') {
+        removeTyping();
+        appendMessage('bot', event.text);
+      } else if (event.type === 'token') {
+        removeTyping();
+        streamedText += event.text;
+        if (!streamed) streamed = appendMessage('bot', '');
+        streamed.innerHTML = linkify(streamedText);
+        messagesEl.scrollTop = messagesEl.scrollHeight;
+      } else if (event.type === 'error') {
+        // The reply failed part way, so say so rather than leave it cut short
+        removeTyping();
+        appendMessage('bot', "Sorry, something went wrong while answering. Please try again.");
+      }
+    });
     removeTyping();
-    replies.forEach(reply => appendMessage('bot', reply));
   } catch (err) {
     removeTyping();
     appendMessage('bot', "Sorry, I couldn't reach the station right now. Make sure the Python server is running on port 8000.");
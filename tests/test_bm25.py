@@ -0,0 +1,54 @@
+import sys, os, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.bm25 import *
+
+
+def make_records(station, sections):
+    return [{
+        "id": f"{station}.docx_chunk_{i}",
+        "document": f"{heading}: {text}",
+        "metadata": {"source": f"{station}.docx", "station": station, "section": heading, "chunk": i},
+    } for i, (heading, text) in enumerate(sections)]
+
+
+@pytest.fixture
+def index():
+    index = BM25Index("collection")
+    index.add_document("Fleet.docx", make_records("Fleet", [
+        ("TICKET ACCEPTANCE", "Tickets are accepted on local buses during disruption."),
+        ("ALTERNATIVE TRANSPORT", "Rail replacement buses leave from the station forecourt."),
+    ]))
+    index.add_document("Ascot.docx", make_records("Ascot", [
+        ("TICKET ACCEPTANCE", "Tickets are accepted by other train operators."),
+    ]))
+    return index
+
+
+def test_search_ranks_keyword_matches_first(index):
+    assert index.search("rail replacement buses", "Fleet")[0][0] == "Fleet.docx_chunk_1"
+
+
+def test_search_only_scores_the_station_partition(index):
+    assert [chunk_id for chunk_id, _ in index.search("ticket acceptance", "Ascot")] == ["Ascot.docx_chunk_0"]
+    assert len(index.search("ticket acceptance")) == 2
+
+
+def test_add_document_replaces_previous_chunks(index):
+    index.add_document("Fleet.docx", make_records("Fleet", [("GATELINES", "Open the gates.")]))
+    assert index.search("rail replacement", "Fleet") == []
+    assert index.sources["Fleet.docx"] == ["Fleet.docx_chunk_0"]
+
+    index.remove_document("Fleet.docx")
+    assert "Fleet" not in index.partitions
+    assert index.total_length == sum(chunk["length"] for chunk in index.chunks.values())
+
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.collection_id == "collection"
+    assert loaded.search("ticket acceptance", "Fleet") == index.search("ticket acceptance", "Fleet")
+    assert BM25Index.load(str(tmp_path / "missing.json")).chunks == {}
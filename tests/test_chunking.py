@@ -0,0 +1,65 @@
+import sys, os, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.chunking import *
+
+
+def paragraph(text, style=""):
+    return {"type": "paragraph", "text": text, "style": style}
+
+
+def table_row(text):
+    return {"type": "table_row", "text": text, "style": ""}
+
+
+def sentences(count, word="word"):
+    return " ".join(f"{word} {i} goes here." for i in range(count))
+
+
+def test_sections_carry_the_heading_path():
+    sections = split_into_sections([
+        paragraph("Fleet", "Heading1"),
+        paragraph("Introduction text."),
+        paragraph("INTRODUCTION3", "TOC1"),
+        paragraph("COLLEAGUE WELFARE"),
+        paragraph("Hot Weather", "Subheader"),
+        paragraph("Drink water."),
+        paragraph("Risk factors to consider:", "Subheader"),
+        table_row("|  |"),
+    ])
+    assert [(section["path"], len(section["blocks"])) for section in sections] == [
+        (["Fleet"], 1),
+        (["COLLEAGUE WELFARE", "Hot Weather"], 2),
+    ]
+
+
+def test_long_sections_are_split_evenly_with_overlap():
+    blocks = [paragraph("TICKET ACCEPTANCE")] + [paragraph(sentences(10, f"p{i}")) for i in range(6)]
+    chunks = chunk_blocks(blocks, min_tokens=20, max_tokens=100, overlap_tokens=10)
+
+    assert len(chunks) > 3
+    assert all(chunk["tokens"] <= 100 for chunk in chunks)
+    assert all(chunk["heading_path"] == "TICKET ACCEPTANCE" for chunk in chunks)
+    # Each chunk starts with the last two sentences of the one before
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["text"].startswith(" ".join(previous["text"].split()[-8:]))
+
+
+def test_table_rows_are_kept_whole():
+    row = " | ".join(f"cell {i}" for i in range(40))
+    chunks = chunk_blocks([paragraph("CSL2 OVERVIEW"), table_row(row)], min_tokens=0, max_tokens=50, overlap_tokens=0)
+    assert [chunk["text"] for chunk in chunks] == [row]
+
+
+def test_small_chunks_are_merged_with_their_neighbours():
+    chunks = chunk_blocks([
+        paragraph("COMMUNICATION WITH CONTROL"),
+        paragraph("Information Flow During Disruption"),
+        paragraph("LOCAL COMMUNICATIONS"),
+        paragraph(sentences(5)),
+    ], min_tokens=20, max_tokens=200, overlap_tokens=0)
+
+    assert len(chunks) == 1
+    assert chunks[0]["heading_path"] == "COMMUNICATION WITH CONTROL"
+    assert chunks[0]["text"].startswith("Information Flow During Disruption LOCAL COMMUNICATIONS: word 0")
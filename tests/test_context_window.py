@@ -0,0 +1,68 @@
+import sys, os, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.context_window import *
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def make_history(turns):
+    messages = [{"role": "system", "content": "You are a railway assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " * 5})
+        messages.append({"role": "assistant", "content": f"answer {i} " * 5})
+    return messages
+
+
+def test_history_within_budget_is_unchanged():
+    messages = make_history(2)
+    prompt, dropped = fit_history(messages, count_words, 1000, "summary")
+    assert prompt == messages
+    assert dropped == 0
+
+
+@pytest.mark.parametrize("budget, kept_turns", [
+    (50, 1),
+    (80, 2),
+    (110, 3),
+])
+def test_oldest_turns_are_dropped(budget, kept_turns):
+    messages = make_history(5)
+    prompt, dropped = fit_history(messages, count_words, budget, "Earlier: toilets.")
+
+    assert dropped == (5 - kept_turns) * 2
+    assert prompt[0]["content"].endswith("Earlier: toilets.")
+    assert prompt[1:] == messages[1 + dropped:]
+    assert sum(count_words(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in prompt) <= budget
+
+
+def test_latest_turn_is_kept_over_budget():
+    messages = make_history(3)
+    prompt, dropped = fit_history(messages, count_words, 1)
+    assert prompt[1:] == messages[-2:]
+    assert dropped == 4
+
+
+def test_compacted_history_keeps_summary():
+    messages = make_history(1)
+    prompt, dropped = fit_history(messages, count_words, 1000, "Earlier: toilets.", compacted=True)
+    assert dropped == 0
+    assert prompt[0]["content"].endswith("Earlier: toilets.")
+
+
+def test_summarise_slots():
+    completed = [("toilets", {"station": "Norwich"}), ("booking_tickets", {
+        "departure_station": "Norwich",
+        "arrival_station": "Ely",
+        "departure_time": {"DATE": ["tomorrow"], "TIME": ["10am"]},
+    })]
+    summary = summarise_slots(completed, {"station": "Diss"})
+    assert summary == (
+        "Earlier in the conversation the user asked about: toilets (station: Norwich); "
+        "booking_tickets (departure_station: Norwich, arrival_station: Ely, departure_time: tomorrow 10am). "
+        "Details already given: station: Diss."
+    )
+    assert summarise_slots([], {}) == ""
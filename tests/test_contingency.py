@@ -0,0 +1,219 @@
+import sys, os, json, shutil, pytest
+from docx import Document
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot import contingency
+from src.chatbot.contingency import *
+
+PLANS_FOLDER = os.path.join(os.path.dirname(__file__), "..", "src", "data", "contingency_plans")
+CSV_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "data", "csv"))
+
+
+@pytest.mark.parametrize("filename", ["Aldershot.docx", "Fleet.docx", "Andover.docx"])
+def test_read_blocks_matches_python_docx(filename):
+    path = os.path.join(PLANS_FOLDER, filename)
+    blocks = read_blocks(path)
+    assert blocks
+    assert blocks == get_blocks_in_order(Document(path))
+
+
+def test_fuse_rankings_rewards_agreement():
+    assert fuse_rankings([["a", "b"], ["b", "c"]]) == ["b", "a", "c"]
+
+
+class FakeCollection:
+    """
+    Stands in for a Chroma collection, keeping the metadata of each chunk written to it.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.id = f"{name}-id"
+        self.metadatas = {}
+        self.documents = {}
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.metadatas.update(zip(ids, metadatas))
+        self.documents.update(zip(ids, documents))
+
+    def query(self, query_embeddings, n_results):
+        ids = list(self.metadatas)[:n_results]
+        return {"ids": [ids], "documents": [[self.documents[i] for i in ids]], "metadatas": [[self.metadatas[i] for i in ids]]}
+
+    def delete(self, where):
+        self.metadatas = {chunk_id: metadata for chunk_id, metadata in self.metadatas.items() if not matches(metadata, where)}
+        self.documents = {chunk_id: self.documents[chunk_id] for chunk_id in self.metadatas}
+
+    def get_sources(self):
+        return sorted({metadata["source"] for metadata in self.metadatas.values()})
+
+
+class FakeClient:
+    def __init__(self):
+        self.collections = {}
+
+    def get_or_create_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(name))
+
+    def delete_collection(self, name):
+        del self.collections[name]
+
+
+def matches(metadata, where):
+    if "$and" in where:
+        return all(matches(metadata, condition) for condition in where["$and"])
+    (key, value), = where.items()
+    return metadata[key] >= value["$gte"] if isinstance(value, dict) else metadata[key] == value
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    An empty store in a temporary folder, with a plans folder of copies of three plans.
+    :return: The plans folder and the names of the plans parsed by each ingest.
+    """
+    docs_folder = tmp_path / "plans"
+    docs_folder.mkdir()
+    for filename in ["Aldershot.docx", "Fleet.docx", "Andover.docx"]:
+        shutil.copy(os.path.join(PLANS_FOLDER, filename), docs_folder / filename)
+
+    monkeypatch.setattr(contingency.station_partitions, "STATION_CODES_PATH", os.path.join(CSV_DIR, "enhanced_stations.csv"))
+    monkeypatch.setattr(contingency.station_partitions, "OLD_STATIONS_PATH", os.path.join(CSV_DIR, "stations.csv"))
+    monkeypatch.setattr(contingency, "MANIFEST_PATH", str(tmp_path / "contingency_manifest.json"))
+    monkeypatch.setattr(contingency, "BM25_PATH", str(tmp_path / "contingency_bm25.json"))
+    monkeypatch.setattr(contingency, "STATION_MAP_PATH", str(tmp_path / "contingency_stations.json"))
+    monkeypatch.setattr(contingency, "client", FakeClient())
+    monkeypatch.setattr(contingency, "collection", None)
+    monkeypatch.setattr(contingency, "station_collections", {})
+    monkeypatch.setattr(contingency, "station_map", None)
+    monkeypatch.setattr(contingency, "keyword_index", None)
+    monkeypatch.setattr(contingency, "embed", lambda texts: [[0.0] for _ in texts])
+    monkeypatch.setattr(contingency, "embed_query", lambda query: [[0.0]])
+    monkeypatch.setattr(contingency, "mark_rebuilt", lambda source: None)
+
+    parsed = []
+    parse = contingency.parse_documents
+
+    def record_parsed(docs_folder, filenames, processes):
+        parsed.append(list(filenames))
+        return parse(docs_folder, filenames, 1)
+
+    monkeypatch.setattr(contingency, "parse_documents", record_parsed)
+    return str(docs_folder), parsed
+
+
+def read_manifest():
+    with open(contingency.MANIFEST_PATH, mode="r") as file:
+        return json.load(file)
+
+
+def test_unchanged_plans_are_skipped(store):
+    docs_folder, parsed = store
+    assert ingest_documents(docs_folder)["documents"] == 3
+    assert ingest_documents(docs_folder)["documents"] == 0
+    assert parsed == [["Aldershot.docx", "Andover.docx", "Fleet.docx"], []]
+
+
+def test_changed_plans_are_ingested_again(store):
+    docs_folder, parsed = store
+    ingest_documents(docs_folder)
+    # Aldershot's plan is shorter than Fleet's, so the chunks past its end must go
+    shutil.copy(os.path.join(PLANS_FOLDER, "Aldershot.docx"), os.path.join(docs_folder, "Fleet.docx"))
+    assert ingest_documents(docs_folder)["documents"] == 1
+    assert parsed[-1] == ["Fleet.docx"]
+
+    fleet = [metadata for metadata in contingency.collection.metadatas.values() if metadata["source"] == "Fleet.docx"]
+    assert len(fleet) == len(parse_document(docs_folder, "Fleet.docx")[1])
+    assert read_manifest()["files"]["Fleet.docx"] == get_file_hash(os.path.join(docs_folder, "Fleet.docx"))
+
+
+def test_removed_plans_are_deleted(store):
+    docs_folder, parsed = store
+    ingest_documents(docs_folder)
+    andover = get_station_map()["partitions"]["Andover"]["collection"]
+    os.remove(os.path.join(docs_folder, "Andover.docx"))
+    assert ingest_documents(docs_folder)["documents"] == 0
+
+    assert contingency.collection.get_sources() == ["Aldershot.docx", "Fleet.docx"]
+    assert andover not in contingency.client.collections
+    assert "Andover.docx" not in read_manifest()["files"]
+    assert "Andover.docx" not in get_keyword_index().sources
+
+
+def test_manifest_of_another_collection_is_ignored(store):
+    docs_folder, parsed = store
+    ingest_documents(docs_folder)
+    manifest = read_manifest()
+    manifest["collection"] = "another-collection-id"
+    with open(contingency.MANIFEST_PATH, mode="w") as file:
+        json.dump(manifest, file)
+
+    assert ingest_documents(docs_folder)["documents"] == 3
+    assert read_manifest()["collection"] == contingency.collection.id
+
+
+def test_plans_are_recorded_only_once_all_their_chunks_are_written(store, monkeypatch):
+    docs_folder, parsed = store
+    chunk_ids = {filename: {record["id"] for record in parse_document(docs_folder, filename)[1]}
+                 for filename in os.listdir(docs_folder)}
+    written = set()
+    batches = []
+    write = contingency.write_batch
+    save = contingency.save_manifest
+
+    def record_batch(batch):
+        write(batch)
+        batches.append(len(batch))
+        written.update(record["id"] for record in batch)
+
+    def check_manifest(collection_id, files, partition_collections):
+        for filename in files:
+            assert chunk_ids[filename] <= written
+        save(collection_id, files, partition_collections)
+
+    monkeypatch.setattr(contingency, "write_batch", record_batch)
+    monkeypatch.setattr(contingency, "save_manifest", check_manifest)
+    # Batches of 7 chunks split every plan across a batch boundary
+    ingest_documents(docs_folder, batch_size=7)
+
+    assert max(batches) == 7
+    assert set(read_manifest()["files"]) == set(chunk_ids)
+
+
+def test_an_interrupted_ingest_carries_on_where_it_stopped(store, monkeypatch):
+    docs_folder, parsed = store
+    write = contingency.write_batch
+
+    def fail_on_fleet(batch):
+        if any(record["metadata"]["source"] == "Fleet.docx" for record in batch):
+            raise RuntimeError("interrupted")
+        write(batch)
+
+    monkeypatch.setattr(contingency, "write_batch", fail_on_fleet)
+    with pytest.raises(RuntimeError):
+        ingest_documents(docs_folder, batch_size=1)
+    assert set(read_manifest()["files"]) == {"Aldershot.docx", "Andover.docx"}
+
+    monkeypatch.setattr(contingency, "write_batch", write)
+    assert ingest_documents(docs_folder, batch_size=1)["documents"] == 1
+    assert parsed[-1] == ["Fleet.docx"]
+    assert set(read_manifest()["files"]) == {"Aldershot.docx", "Andover.docx", "Fleet.docx"}
+
+
+def test_plans_without_chunks_are_recorded(store):
+    docs_folder, parsed = store
+    Document().save(os.path.join(docs_folder, "Alton.docx"))
+    ingest_documents(docs_folder)
+
+    assert "Alton.docx" in read_manifest()["files"]
+    assert "Alton.docx" not in contingency.collection.get_sources()
+    assert ingest_documents(docs_folder)["documents"] == 0
+
+
+def test_stations_without_a_plan_find_nothing(store):
+    docs_folder, parsed = store
+    ingest_documents(docs_folder)
+
+    assert search_contingency("What happens if the line is blocked?", station="Reading", n_results=3) == ([], [])
+    chunks, sources = search_contingency("What happens if the line is blocked?", station="Fleet", n_results=3)
+    assert chunks and set(sources) == {"Fleet.docx"}
@@ -0,0 +1,67 @@
+import sys, os, pytest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.embedding_cache import *
+
+
+class CountingModel:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [np.full(4, len(text), dtype=np.float64) for text in texts]
+
+
+def test_embed_only_runs_the_model_on_new_texts(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("model", str(tmp_path))
+    assert cache.embed(["a", "bb", "a"], model) == [[1.0] * 4, [2.0] * 4, [1.0] * 4]
+    assert cache.embed(["bb", "ccc"], model) == [[2.0] * 4, [3.0] * 4]
+    assert model.texts == ["a", "bb", "ccc"]
+
+
+def test_cache_is_shared_through_the_file_and_kept_per_model(tmp_path):
+    model = CountingModel()
+    EmbeddingCache("model", str(tmp_path)).embed(["text 0", "text 340"], model)
+
+    # The key of "text 340" ends in a zero byte, which must not be lost
+    assert EmbeddingCache("model", str(tmp_path)).embed(["text 0", "text 340"], model)[1] == [8.0] * 4
+    assert len(model.texts) == 2
+
+    EmbeddingCache("other-model", str(tmp_path)).embed(["text 0"], model)
+    assert len(model.texts) == 3
+
+
+def test_torn_record_is_ignored(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("model", str(tmp_path))
+    cache.embed(["a"], model)
+    with open(cache.path, mode="ab") as file:
+        file.write(b"torn")
+
+    cache = EmbeddingCache("model", str(tmp_path))
+    assert cache.embed(["a", "bb"], model) == [[1.0] * 4, [2.0] * 4]
+    assert EmbeddingCache("model", str(tmp_path)).get(["a", "bb"])[1].tolist() == [2.0] * 4
+
+
+def test_normalise_query():
+    assert normalise_query("  Ticket   ACCEPTANCE ") == "ticket acceptance"
+
+
+def test_questions_are_kept_in_memory_only(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("model", str(tmp_path), query_cache_size=2)
+    assert cache.embed_query("a", model) == [1.0] * 4
+    cache.embed_query("bb", model)
+    cache.embed_query("a", model)
+    # "bb" is the least recently used, so a third question evicts it
+    cache.embed_query("ccc", model)
+    cache.embed_query("a", model)
+    cache.embed_query("bb", model)
+
+    assert model.texts == ["a", "bb", "ccc", "bb"]
+    assert list(cache.queries) == ["a", "bb"]
+    assert not os.path.exists(cache.path)
@@ -1,4 +1,6 @@
 import sys, os, pytest, spacy
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -33,5 +35,43 @@ def test_format_time(input_time, expected) -> None:
     assert format_time(input_time) == expected
 
 
+# Friday 16th October 2026, 14:30
+BASE_DATE = datetime(2026, 10, 16, 14, 30)
+
+@pytest.mark.parametrize("phrase, expected", [
+    ("5:00 pm", datetime(2026, 10, 16, 17, 0)),
+    ("10:00 am", datetime(2026, 10, 17, 10, 0)),
+    ("17:45", datetime(2026, 10, 16, 17, 45)),
+    ("noon", datetime(2026, 10, 17, 12, 0)),
+    ("midnight", datetime(2026, 10, 17, 0, 0)),
+    ("tomorrow", datetime(2026, 10, 17, 14, 30)),
+    ("friday", datetime(2026, 10, 23, 0, 0)),
+    ("this saturday", datetime(2026, 10, 17, 0, 0)),
+    ("next monday", datetime(2026, 10, 19, 0, 0)),
+    ("may 15th", datetime(2027, 5, 15, 0, 0)),
+    ("the 20th", datetime(2026, 10, 20, 0, 0)),
+    ("5 week", datetime(2026, 11, 20, 14, 30)),
+])
+def test_parse_datestring_fast_path(phrase, expected) -> None:
+    assert fast_parse_datestring(normalise_datestring(phrase), BASE_DATE.date()) is not None
+    assert parse_datestring(phrase, BASE_DATE) == expected
+
+
+def test_parse_datestring_from_many_threads(monkeypatch) -> None:
+    from src.utils import input_handler
+
+    # A memo this small evicts on almost every call, so unguarded threads would read evicted phrases
+    monkeypatch.setattr(input_handler, "DATE_MEMO_SIZE", 2)
+    monkeypatch.setattr(input_handler, "date_memo", {})
+    phrases = [f"{hour}:{minute:02d}" for hour in range(15, 24) for minute in range(0, 60, 5)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda phrase: parse_datestring(phrase, BASE_DATE), phrases * 4))
+
+    for phrase, result in zip(phrases * 4, results):
+        hour, minute = map(int, phrase.split(":"))
+        assert result == datetime(2026, 10, 16, hour, minute)
+    assert len(input_handler.date_memo) <= 2
+
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
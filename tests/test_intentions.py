@@ -55,5 +55,18 @@ def test_get_intentions(text: str, expected_output: list) -> None:
         assert False
     assert True
 
+def test_predict_intents_batch_matches_separately_trained_classifiers() -> None:
+    texts = ["where are the toilets at Paddington?", "are there train delayed?", "hello", "Ticket office hours?"]
+    baselines = {
+        "intent": create_pipeline().fit(*get_intentions_training_data()),
+        "faq": create_pipeline().fit(*get_faq_training_data()),
+    }
+    batch = predict_intents_batch(texts)
+    for text, result in zip(texts, batch):
+        for name, baseline in baselines.items():
+            probability = baseline.predict_proba([text])[0]
+            assert result[name][0] == baseline.predict([text])[0]
+            assert result[name][1] == pytest.approx(probability)
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
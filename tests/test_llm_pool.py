@@ -0,0 +1,67 @@
+import sys, os, time, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'chatbot')))
+
+from src.chatbot import llm_pool
+from src.chatbot.llm_pool import *
+
+
+def fake_worker(worker_id, cores, n_threads, requests, results, cancelled):
+    """
+    Stands in for worker_main without a model: replies at once, dies on "die" and hangs on "hang".
+    """
+    results.send((None, "ready", worker_id))
+    while (request := requests.get()) is not None:
+        request_id, messages, stream, max_tokens = request
+        if messages == "die":
+            os._exit(1)
+        if messages == "hang":
+            time.sleep(60)
+        results.send((request_id, "done", (f"reply from {worker_id}", {})))
+
+
+@pytest.fixture
+def pool():
+    pool = LLMPool(1)
+    pool.worker_target = fake_worker
+    pool.start_workers()
+    yield pool
+    pool.stop()
+    pool.terminate()
+
+
+def test_a_killed_worker_fails_its_request_and_is_replaced(pool):
+    assert pool.chat("hello")[0] == "reply from 0"
+    process = pool.processes[0]
+    process.kill()
+
+    with pytest.raises(RuntimeError, match="died"):
+        pool.chat("hello")
+    assert pool.processes[0] is not process
+    assert pool.chat("hello")[0] == "reply from 0"
+    assert pool.in_flight == [0]
+
+
+def test_a_worker_dying_mid_request_fails_the_stream(pool):
+    with pytest.raises(RuntimeError, match="died"):
+        list(pool.stream("die"))
+    assert pool.chat("hello")[0] == "reply from 0"
+
+
+def test_a_hung_worker_is_replaced(pool, monkeypatch):
+    monkeypatch.setattr(llm_pool, "LLM_REQUEST_TIMEOUT", 1)
+    with pytest.raises(RuntimeError, match="sent nothing"):
+        pool.chat("hang")
+    assert pool.chat("hello")[0] == "reply from 0"
+
+
+def test_sessions_leave_their_worker_only_when_it_is_busy():
+    pool = LLMPool(2)
+    key = next(key for key in map(str, range(100)) if zlib.crc32(key.encode()) % 2 == 0)
+    assert pool.get_worker(key) == 0
+
+    pool.in_flight = [LLM_WORKER_CAPACITY, 0]
+    assert pool.get_worker(key) == 1
+    pool.in_flight = [LLM_WORKER_CAPACITY, LLM_WORKER_CAPACITY]
+    assert pool.get_worker(key) == 0
@@ -64,5 +64,22 @@ def test_find_closest_stations(query, expected_stations):
     results = find_closest_stations(query)
     assert any(expected_station in results for expected_station in expected_stations)
 
+
+def test_entity_rulers_are_saved_and_loaded_with_an_empty_cache(tmp_path):
+    from src.chatbot import nlp as nlp_module
+    patterns = {name: nlp_module.nlp.get_pipe(name).patterns for name in RULER_NAMES}
+    cache_dir = str(tmp_path / "rulers" / "key")
+
+    save_entity_rulers(cache_dir)
+    assert os.listdir(tmp_path / "rulers") == ["key"]
+
+    remove_entity_rulers()
+    load_entity_rulers(cache_dir)
+    assert {name: nlp_module.nlp.get_pipe(name).patterns for name in RULER_NAMES} == patterns
+
+    # Saving a newer version replaces the older one
+    save_entity_rulers(str(tmp_path / "rulers" / "newer"))
+    assert os.listdir(tmp_path / "rulers") == ["newer"]
+
 if __name__ == "__main__":
     pytest.main()
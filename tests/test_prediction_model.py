@@ -0,0 +1,35 @@
+import sys, os, json, subprocess, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot import prediction_model
+from src.chatbot.prediction_model import *
+
+CHATBOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'chatbot'))
+
+
+def write_model(path, **fields):
+    model = {"format": DELAY_MODEL_FORMAT, "version": "1", "delays": [minute / 60 for minute in range(MINUTES_PER_DAY)]}
+    model.update(fields)
+    path.write_text(json.dumps(model))
+    return str(path)
+
+
+def test_import_does_not_load_training_libraries():
+    code = "import sys, prediction_model; print(any(name in sys.modules for name in ('pandas', 'sklearn', 'matplotlib')))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=CHATBOT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_model_is_loaded_on_first_prediction(tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction_model, "model", None)
+    monkeypatch.setattr(prediction_model, "load_model", lambda: load_model(write_model(tmp_path / "model.json")))
+    assert predict_delay_for_time("17:30") == pytest.approx(17.5)
+    assert predict_delay_for_time("00:00") == 0
+
+
+def test_models_of_another_format_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        load_model(write_model(tmp_path / "model.json", format=DELAY_MODEL_FORMAT + 1))
+    with pytest.raises(FileNotFoundError):
+        load_model(str(tmp_path / "missing.json"))
@@ -0,0 +1,65 @@
+import sys, os, time, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.response_cache import *
+from utils import data_versions
+
+
+@pytest.fixture(autouse=True)
+def versions_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_versions, "VERSIONS_DIR", str(tmp_path))
+
+
+@pytest.mark.parametrize("intent, slots, question, expected_output", [
+    ("toilets", {"station": "Norwich"}, "Does Norwich have toilets?", ("toilets", (("station", "norwich"),), "")),
+    ("contingency_info", {"station": "Fleet"}, "What happens if the line is BLOCKED?",
+     ("contingency_info", (("station", "fleet"),), "what happens if the line is blocked")),
+    ("booking_tickets", {"departure_station": "Norwich"}, "book a ticket", None),
+])
+def test_get_key(intent, slots, question, expected_output):
+    assert get_key(intent, slots, question) == expected_output
+
+
+def test_hit_and_miss():
+    cache = ResponseCache(60, 10, 1024)
+    key = get_key("toilets", {"station": "Norwich"}, "")
+    assert cache.get(key) is None
+    cache.put(key, ["Yes"])
+    assert cache.get(key) == ["Yes"]
+    assert cache.get_stats()["hit_rate"] == 0.5
+
+
+def test_entries_expire():
+    cache = ResponseCache(0, 10, 1024)
+    key = get_key("toilets", {"station": "Norwich"}, "")
+    cache.put(key, ["Yes"])
+    assert cache.get(key) is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_rebuild_invalidates_source():
+    cache = ResponseCache(60, 10, 1024)
+    faq = get_key("toilets", {"station": "Norwich"}, "")
+    plan = get_key("contingency_info", {"station": "Fleet"}, "line blocked")
+    cache.put(faq, ["Yes"])
+    cache.put(plan, ["Use the replacement buses."])
+
+    time.sleep(0.01)
+    data_versions.mark_rebuilt("station_codes")
+    assert cache.get(faq) is None
+    assert cache.get(plan) == ["Use the replacement buses."]
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_least_recently_used_are_evicted():
+    cache = ResponseCache(60, 2, 1024)
+    keys = [get_key("toilets", {"station": name}, "") for name in ("Norwich", "Ely", "Diss")]
+    cache.put(keys[0], ["Yes"])
+    cache.put(keys[1], ["No"])
+    cache.get(keys[0])
+    cache.put(keys[2], ["Yes"])
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == ["Yes"]
+    assert cache.get_stats()["evictions"] == 1
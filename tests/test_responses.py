@@ -0,0 +1,33 @@
+import sys, os, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.responses import *
+
+
+@pytest.mark.parametrize("intent, templates_only, expected_output", [
+    ("toilets", False, False),
+    ("followup", False, False),
+    ("platform_details", False, False),
+    ("route_details", False, True),
+    ("route_details", True, False),
+    ("greeting", False, True),
+    ("greeting", True, False),
+])
+def test_uses_llm(intent, templates_only, expected_output):
+    assert uses_llm(intent, templates_only) == expected_output
+
+
+@pytest.mark.parametrize("keys, expected_output", [
+    (["station"], "Could you tell me the station?"),
+    (["departure_station", "arrival_station", "departure_time"],
+     "Could you tell me the station you are leaving from, the station you are travelling to and when you want to travel?"),
+])
+def test_render_followup(keys, expected_output):
+    assert render_followup(keys) == expected_output
+
+
+def test_render_station_details():
+    details = "Toilets available: True\nWifi available: False"
+    assert render_station_details("norwich", details) == "Here is what I found for Norwich:\nToilets available: Yes\nWifi available: No"
+    assert render_station_details("nowhere", "Station not found.") == "Sorry, I couldn't find any details for Nowhere."
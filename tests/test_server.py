@@ -0,0 +1,81 @@
+import sys, os, asyncio, pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'chatbot')))
+
+from src.chatbot import server
+
+
+class FakeSession:
+    """
+    Stands in for a pisces session whose every message wants the LLM, with or without a templated answer.
+    """
+    def __init__(self, has_template):
+        self.has_template = has_template
+        self.wants_llm = False
+        self.needs_llm = False
+        self.cancelled = False
+        self.usage = {}
+
+    def classify_turn(self, message):
+        self.wants_llm = True
+        return []
+
+    def answer_turn(self, templates_only):
+        self.needs_llm = not templates_only
+        return ["templated"] if templates_only else []
+
+    def cancel_turn(self):
+        self.cancelled = True
+
+
+class FakeSessions:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, session_id):
+        return self.session
+
+
+def post(path, session, monkeypatch, pending):
+    """
+    Send a message to a server whose LLM queue already holds pending turns.
+    :return: The response status, headers and body.
+    """
+    queue = server.LLMQueue(1, 4)
+    queue.pending = pending
+    monkeypatch.setattr(server, "llm_queue", queue)
+    monkeypatch.setattr(server, "DEGRADE_QUEUE_DEPTH", 2)
+    monkeypatch.setattr(server.pisces, "sessions", FakeSessions(session))
+
+    async def send():
+        app = web.Application()
+        app.router.add_post("/chat", server.chat)
+        app.router.add_post("/chat/stream", server.chat_stream)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(path, json={"session_id": "s", "message": "hello"})
+            return response.status, response.headers, await response.text()
+
+    status, headers, body = asyncio.run(send())
+    assert queue.pending == pending
+    return status, headers, body
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_a_deep_queue_answers_from_templates(path, monkeypatch):
+    session = FakeSession(has_template=True)
+    status, headers, body = post(path, session, monkeypatch, pending=2)
+    assert status == 200
+    assert "templated" in body
+    assert not session.cancelled and not session.busy
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_a_full_queue_turns_away_replies_without_a_template(path, monkeypatch):
+    session = FakeSession(has_template=False)
+    status, headers, body = post(path, session, monkeypatch, pending=4)
+    assert status == 503
+    assert int(headers["Retry-After"]) >= 1
+    assert session.cancelled and not session.busy
@@ -0,0 +1,75 @@
+import sys, os, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot.sessions import *
+
+
+class FakeSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.text = ""
+        self.on_resize = None
+
+    def size(self):
+        return len(self.text)
+
+    def say(self, text):
+        self.text += text
+        if self.on_resize is not None:
+            self.on_resize(self.size())
+
+
+def test_get_reuses_session():
+    store = SessionStore(FakeSession, 60, 10, 1024)
+    assert store.get("a") is store.get("a")
+    assert store.get("a") is not store.get("b")
+
+
+def test_ttl_expiry():
+    store = SessionStore(FakeSession, 0.01, 10, 1024)
+    first = store.get("a")
+    time.sleep(0.02)
+    assert store.get("a") is not first
+    assert store.get_stats()["evictions"] == 1
+
+
+def test_lru_eviction():
+    store = SessionStore(FakeSession, 60, 2, 1024)
+    first = store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert list(store.sessions) == ["a", "c"]
+    assert store.get("a") is first
+    assert store.get_stats() == {"sessions": 2, "bytes": 0, "evictions": 1}
+
+
+def test_byte_cap():
+    store = SessionStore(FakeSession, 60, 10, 10)
+    store.get("a").say("123456")
+    store.get("b").say("1234")
+    assert store.get_stats()["bytes"] == 10
+
+    # The session grows past the cap, and the oldest session makes room for it on its next turn
+    store.get("b").say("12")
+    assert store.get_stats()["bytes"] == 12
+    store.get("b")
+    assert list(store.sessions) == ["b"]
+    assert store.get_stats() == {"sessions": 1, "bytes": 6, "evictions": 1}
+
+
+def test_byte_cap_keeps_current_session():
+    store = SessionStore(FakeSession, 60, 10, 4)
+    store.get("a").say("123456789")
+    assert list(store.sessions) == ["a"]
+    assert store.get_stats()["bytes"] == 9
+
+
+def test_evicted_session_stops_counting():
+    store = SessionStore(FakeSession, 60, 1, 1024)
+    first = store.get("a")
+    store.get("b")
+    first.say("12345")
+    store.remove("b")
+    assert store.get_stats() == {"sessions": 0, "bytes": 0, "evictions": 1}
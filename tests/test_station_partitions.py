@@ -0,0 +1,45 @@
+import sys, os, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chatbot import station_partitions
+from src.chatbot.station_partitions import *
+
+CSV_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'csv'))
+
+
+@pytest.fixture(scope="module")
+def station_map():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(station_partitions, "STATION_CODES_PATH", os.path.join(CSV_DIR, "enhanced_stations.csv"))
+        monkeypatch.setattr(station_partitions, "OLD_STATIONS_PATH", os.path.join(CSV_DIR, "stations.csv"))
+        return build_station_map(["Ashford", "Ash", "Fleet", "Smallbrook Jct", "Brading", "Ewell West", "Hersham",
+                                  "Feltham", "Gillingham", "Milford"], "railway_contingency")
+
+
+def test_normalise_station_name():
+    assert normalise_station_name("Smallbrook Jct.") == "smallbrook junction"
+    assert normalise_station_name("Ashford (Surrey) Rail Station") == "ashford surrey"
+
+
+def test_plans_are_matched_to_their_stations(station_map):
+    partitions = station_map["partitions"]
+    assert partitions["Ashford"]["crs"] == "AFS"
+    assert partitions["Ash"]["crs"] == "ASH"
+    assert partitions["Smallbrook Jct"]["crs"] == "SAB"
+    assert partitions["Fleet"]["collection"] == "railway_contingency_fle"
+
+
+def test_station_names_resolve_to_partitions(station_map):
+    assert resolve_station(station_map, "ASHFORD SURREY") == "Ashford"
+    assert resolve_station(station_map, "ash") == "Ash"
+    assert resolve_station(station_map, "afs") == "Ashford"
+    assert resolve_station(station_map, "Smallbrook Junction") == "Smallbrook Jct"
+    assert resolve_station(station_map, "Smalbrook Junction") == "Smallbrook Jct"
+    assert resolve_station(station_map, "Norwich") is None
+    assert resolve_station(station_map, None) is None
+
+
+@pytest.mark.parametrize("station", ["Reading", "Ewell East", "Horsham", "Eltham", "Gillingham (Kent)", "Ilford", "RDG"])
+def test_stations_without_a_plan_are_not_routed_to_similar_names(station_map, station):
+    assert resolve_station(station_map, station) is None
@@ -0,0 +1,47 @@
+import sys, os, types, pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.tracing import *
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.render("latency", 'stage="x"') == [
+        'latency_bucket{stage="x",le="0.1"} 1',
+        'latency_bucket{stage="x",le="1.0"} 3',
+        'latency_bucket{stage="x",le="+Inf"} 4',
+        'latency_sum{stage="x"} 6.050000',
+        'latency_count{stage="x"} 4',
+    ]
+
+
+def test_spans_join_the_current_trace():
+    trace = start_trace()
+    with span("collect_info"):
+        pass
+    bind(observe_stage)("llm_generate", 0.5)
+
+    assert [name for name, _ in trace] == ["collect_info", "llm_generate"]
+    assert "collect_info" in stage_seconds
+
+
+def test_traced_module_names_stages_after_defining_module():
+    def get_station_details_by_columns(name, columns):
+        return name
+    get_station_details_by_columns.__module__ = "chatbot.knowledge_base"
+    module = types.SimpleNamespace(get_station_details_by_columns=get_station_details_by_columns, intent_to_function={})
+
+    trace = start_trace()
+    traced_module = TracedModule(module)
+    assert traced_module.get_station_details_by_columns("Norwich", []) == "Norwich"
+    assert traced_module.intent_to_function == {}
+    assert trace[0][0] == "knowledge_base.get_station_details_by_columns"
+
+
+def test_format_server_timing_sums_repeated_stages():
+    trace = [("nlp.extract_single_station", 0.01), ("spell_correction", 0.002), ("nlp.extract_single_station", 0.02)]
+    assert format_server_timing(trace) == "nlp_extract_single_station;dur=30.0, spell_correction;dur=2.0"